@@ -1,14 +1,17 @@
+import abc
+import functools
 import hashlib
+import numbers
 import re
-import jieba
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from pygments.lexers import PythonLexer
-from pygments import lex
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import os
 import numpy as np
+from scipy import sparse
 import logging
-import time
+import zlib
+from cache import content_hash
+from hashing import rolling_hash_values
+from instrumentation import NULL_INSTRUMENTATION
 
 
 
@@ -16,23 +19,579 @@ import time
 # 配置日志以避免显示jieba的详细调试信息
 logging.getLogger('jieba').setLevel(logging.WARNING)
 
+PROCESS_TOKENIZE_MIN_CHARS = 200000  # 'auto' 模式下，总字数超过该值才启用进程池分词
+CHUNKS_PER_WORKER = 4  # 每个工作进程分到的块数，块越多负载越均衡
+CANCEL_CHECK_DOCUMENTS = 64  # 在当前进程中分词或词法分析时，每处理这么多文档调用一次 cancel_check
+STOPWORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hit_stopwords.txt')  # 哈工大停用词表
+WORD_CHAR_RE = re.compile(r'\w')  # 不含任何文字或数字的词元视为标点
+
+
+# jieba、sklearn 与 pygments 导入较慢，均在真正用到时才导入
+
+
+def _init_tokenizer_worker():
+    # 进程池初始化：每个工作进程只加载一次jieba词典
+    import jieba
+    logging.getLogger('jieba').setLevel(logging.WARNING)
+    jieba.initialize()
+
+
+def _tokenize_text(text):
+    # jieba分词，去掉空白词元，英文统一为小写；返回词元列表，不再拼接成字符串
+    import jieba
+    return [token.lower() for token in jieba.cut(text) if not token.isspace()]
+
+
+def _tokenize_chunk(texts):
+    return [_tokenize_text(text) for text in texts]
+
+
+def _map_chunks(func, chunks, executor=None, cancel_check=None):
+    """
+    依次处理各块并按原顺序拼接结果，每完成一块调用一次 cancel_check。
+    cancel_check 抛出的异常会中止处理并向上传递（用于取消），此时进程池中尚未开始的块被丢弃。
+    参数: func (callable): 处理一块并返回结果列表；chunks (list): 各块的输入；
+          executor (Executor): 可选的进程池，默认在当前进程中处理。
+    返回: list: 各块结果拼接后的列表。
+    """
+    results = executor.map(func, chunks) if executor is not None else map(func, chunks)
+    combined = []
+    try:
+        for chunk in results:
+            combined.extend(chunk)
+            if cancel_check is not None:
+                cancel_check()
+    except BaseException:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    return combined
+
+
+def _fixed_chunks(items, size=CANCEL_CHECK_DOCUMENTS):
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+@functools.lru_cache(maxsize=None)
+def load_stopwords(path=STOPWORDS_PATH):
+    """
+    读取停用词表（每行一个词），每个路径只读取一次。
+    参数: path (str): 停用词文件路径。
+    返回: frozenset: 停用词集合，文件不存在时为空集合。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return frozenset(line.strip() for line in f if line.strip())
+    except OSError as e:
+        logging.warning(f"Failed to load stopwords from {path}: {e}")
+        return frozenset()
+
+
+class TokenAnalyzer:
+    """
+    供 TfidfVectorizer 使用的分析器，直接接收分词后的词元列表：
+    生成 1 到 max_n 元的n-gram，多元词组用空格连接（与sklearn默认分析器的特征名格式相同）。
+    停用词与标点不作为特征，并在该处断开：多元词组只由原文中相邻的词元组成，不会跨过被删除的词元。
+    与默认的正则分析器不同，词元不会被重新拼接、切分，单字词也会保留。
+    """
+
+    def __init__(self, stopwords=frozenset(), ngram_range=(1, 2)):
+        self.stopwords = stopwords
+        self.ngram_range = ngram_range
+
+    def __call__(self, tokens):
+        # 按停用词与标点把词元切成若干段，n-gram 只在段内生成
+        segments, segment = [], []
+        for token in tokens:
+            if token in self.stopwords or not WORD_CHAR_RE.search(token):
+                if segment:
+                    segments.append(segment)
+                    segment = []
+            else:
+                segment.append(token)
+        if segment:
+            segments.append(segment)
+        min_n, max_n = self.ngram_range
+        features = []
+        for n in range(min_n, max_n + 1):
+            for segment in segments:
+                features.extend(' '.join(segment[i:i + n]) for i in range(len(segment) - n + 1))
+        return features
+
+
+def _normalize_rows(matrix):
+    # 按行做L2单位化，零向量保持不变
+    from sklearn.preprocessing import normalize
+    return normalize(matrix)
+
+
+def balanced_chunks(sizes, num_chunks):
+    """
+    按大小把连续的文档划分为总量大致相等的若干块，保持原有顺序。
+    参数: sizes (list): 每个文档的大小；num_chunks (int): 期望的块数。
+    返回: list: (起始下标, 终止下标) 列表。
+    """
+    bounds = np.cumsum(sizes, dtype=np.float64)
+    if len(bounds) == 0:
+        return []
+    targets = bounds[-1] * np.arange(1, num_chunks) / num_chunks
+    cuts = np.unique(np.concatenate([[0], np.searchsorted(bounds, targets, side='right'), [len(bounds)]]))
+    return [(int(start), int(stop)) for start, stop in zip(cuts[:-1], cuts[1:]) if stop > start]
+
+def _sha256_feature_bits(feature_names, hashbits):
+    # 与 TextSimilarityCalculator.hashfunc 一致：SHA-256摘要按大端解释为整数，第i列即整数的第i位
+    digests = b''.join(hashlib.sha256(name.encode('utf-8')).digest() for name in feature_names)
+    digest_bytes = np.frombuffer(digests, dtype=np.uint8).reshape(-1, 32)[:, ::-1]
+    return np.unpackbits(digest_bytes, axis=1, bitorder='little').astype(bool)
+
+
+def _splitmix64(z):
+    # splitmix64 的混合函数，对uint64数组逐元素计算（乘法按2^64自然回绕）
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _splitmix64_feature_bits(feature_names, hashbits):
+    # 非加密的快速哈希：crc32与adler32拼成64位种子，再用splitmix64扩展到所需位数
+    seeds = np.fromiter(
+        ((zlib.crc32(b) << 32) | zlib.adler32(b) for b in (name.encode('utf-8') for name in feature_names)),
+        dtype=np.uint64, count=len(feature_names))
+    words = []
+    for k in range(-(-hashbits // 64)):
+        words.append(_splitmix64(seeds + np.uint64((0x9E3779B97F4A7C15 * (k + 1)) & 0xFFFFFFFFFFFFFFFF)))
+    word_bytes = np.stack(words, axis=1).astype('<u8').view(np.uint8)
+    return np.unpackbits(word_bytes, axis=1, bitorder='little').astype(bool)
+
+
+SIMHASH_METHODS = {
+    'sha256': _sha256_feature_bits,  # 与逐特征的 hashfunc 结果逐位一致
+    'splitmix64': _splitmix64_feature_bits,  # 更快的非加密哈希，指纹与sha256不兼容
+}
+
+
+class SimHashEngine:
+    """
+    向量化的SimHash引擎。
+    词表中的每个特征只哈希一次，得到 (词表大小 × hashbits) 的位矩阵，
+    所有文档的指纹由稀疏TF-IDF矩阵与±1位矩阵的一次乘积得到。
+    """
+
+    def __init__(self, feature_names, hashbits=128, hash_method='sha256', block_bits=64):
+        if hash_method not in SIMHASH_METHODS:
+            raise ValueError(f"Unknown SimHash method: {hash_method}")
+        self.hashbits = hashbits
+        self.hash_method = hash_method
+        self.block_bits = block_bits  # 每次参与乘积的位数，控制±1矩阵的内存占用
+        self.bit_matrix = self.build_bit_matrix(feature_names)
+
+    def build_bit_matrix(self, feature_names):
+        # 计算词表的位矩阵，超出哈希长度的位按0处理（与逐特征算法一致）
+        bits = SIMHASH_METHODS[self.hash_method](feature_names, self.hashbits)
+        if bits.shape[1] < self.hashbits:
+            bits = np.pad(bits, ((0, 0), (0, self.hashbits - bits.shape[1])))
+        return np.ascontiguousarray(bits[:, :self.hashbits])
+
+    def fingerprint_bits(self, tfidf_matrix):
+        """
+        计算所有文档的指纹位。
+        参数: tfidf_matrix: 稀疏TF-IDF矩阵，列与构造时的词表一一对应。
+        返回: np.ndarray: (文档数 × hashbits) 的布尔矩阵，第i列为指纹的第i位。
+        """
+        tfidf_matrix = tfidf_matrix.tocsr()
+        if not tfidf_matrix.has_sorted_indices:
+            # 按列序累加，保证浮点结果与逐特征算法逐位一致
+            tfidf_matrix = tfidf_matrix.sorted_indices()
+        bits = np.empty((tfidf_matrix.shape[0], self.hashbits), dtype=bool)
+        for start in range(0, self.hashbits, self.block_bits):
+            stop = min(start + self.block_bits, self.hashbits)
+            signs = np.where(self.bit_matrix[:, start:stop], 1.0, -1.0)
+            bits[:, start:stop] = (tfidf_matrix @ signs) >= 0
+        return bits
+
+    def fingerprints(self, tfidf_matrix):
+        # 将指纹位打包为Python整数，格式与 TextSimilarityCalculator.simhash 相同
+        return PackedFingerprints.from_bits(self.fingerprint_bits(tfidf_matrix)).to_ints()
+
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount64(words):
+    # 逐元素统计uint64中1的个数；NumPy 2.0以上使用内置的 bitwise_count
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    return _POPCOUNT_TABLE[words.view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+class PackedFingerprints:
+    """
+    打包存储的SimHash指纹数组。
+    每个指纹占 ceil(hashbits / 64) 个uint64（128位即2个），第i位对应整数指纹的第i位。
+    汉明距离通过按块异或与popcount批量计算。
+    """
+
+    def __init__(self, words, hashbits):
+        self.words = np.ascontiguousarray(words, dtype=np.uint64).reshape(len(words), -1)
+        self.hashbits = hashbits
+
+    @classmethod
+    def from_bits(cls, bits):
+        # 由 (文档数 × hashbits) 的布尔矩阵构造
+        hashbits = bits.shape[1]
+        num_words = max(1, -(-hashbits // 64))
+        packed = np.packbits(bits, axis=1, bitorder='little')
+        padded = np.zeros((bits.shape[0], num_words * 8), dtype=np.uint8)
+        padded[:, :packed.shape[1]] = packed
+        return cls(padded.view('<u8'), hashbits)
+
+    @classmethod
+    def from_ints(cls, hashes, hashbits):
+        # 由Python整数指纹列表构造，超出hashbits的高位被截断
+        num_words = max(1, -(-hashbits // 64))
+        bitmask = (1 << hashbits) - 1
+        buffer = b''.join((h & bitmask).to_bytes(num_words * 8, 'little') for h in hashes)
+        return cls(np.frombuffer(buffer, dtype='<u8').reshape(len(hashes), num_words), hashbits)
+
+    def __len__(self):
+        return self.words.shape[0]
+
+    def to_ints(self):
+        return [int.from_bytes(row.tobytes(), 'little') for row in self.words.astype('<u8')]
+
+    def bits(self):
+        # 解包为 (文档数 × hashbits) 的布尔矩阵
+        unpacked = np.unpackbits(self.words.astype('<u8').view(np.uint8), axis=1, bitorder='little')
+        return unpacked[:, :self.hashbits].astype(bool)
+
+    def distances(self, rows, others=None):
+        """
+        计算一组指纹与另一组指纹之间的汉明距离矩阵。
+        参数: rows (np.ndarray): (m × 字数) 的uint64指纹；others: 同格式的指纹，默认为全部指纹。
+        返回: np.ndarray: (m × n) 的int32距离矩阵。
+        """
+        others = self.words if others is None else others
+        result = np.zeros((rows.shape[0], others.shape[0]), dtype=np.int32)
+        for w in range(self.words.shape[1]):
+            result += popcount64(rows[:, w, None] ^ others[None, :, w])
+        return result
+
+    def iter_distance_blocks(self, block_size=512):
+        # 分块生成完整的两两距离矩阵，每块为 (起始行, 终止行, 距离块)
+        for start in range(0, len(self), block_size):
+            stop = min(start + block_size, len(self))
+            yield start, stop, self.distances(self.words[start:stop])
+
+    def distance_matrix(self, block_size=512):
+        matrix = np.empty((len(self), len(self)), dtype=np.int32)
+        for start, stop, block in self.iter_distance_blocks(block_size):
+            matrix[start:stop] = block
+        return matrix
+
+    def pairs_within(self, max_distance, block_size=512):
+        """
+        查询所有汉明距离不超过 max_distance 的文档对。
+        返回: tuple (np.ndarray, np.ndarray, np.ndarray): 满足 i < j 的行号i、j及其距离。
+        """
+        found_i, found_j, found_d = [], [], []
+        for start in range(0, len(self), block_size):
+            stop = min(start + block_size, len(self))
+            # 只与自身及之后的行比较，每对只计算一次
+            block = self.distances(self.words[start:stop], self.words[start:])
+            local_i, local_j = np.nonzero(block <= max_distance)
+            upper = start + local_i < start + local_j
+            local_i, local_j = local_i[upper], local_j[upper]
+            found_i.append(start + local_i)
+            found_j.append(start + local_j)
+            found_d.append(block[local_i, local_j])
+        if not found_i:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0, dtype=np.int32)
+        return np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_d)
+
+
+def _expand_ranges(starts, stops):
+    # 将若干区间 [start, stop) 展开为一个下标数组，返回 (所属区间编号, 下标)
+    lengths = stops - starts
+    owners = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owners, starts[owners] + offsets
+
+
+def _unique_pairs(pairs_i, pairs_j):
+    # 规范化为 i < j 并去重，返回 (m × 2) 的数组
+    if not pairs_i:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.stack([np.concatenate(pairs_i), np.concatenate(pairs_j)], axis=1).astype(np.int64)
+    pairs.sort(axis=1)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    return np.unique(pairs, axis=0)
+
+
+class BandedLSHIndex(abc.ABC):
+    """
+    分段（banding）局部敏感哈希索引的公共部分。
+    每个签名被切成 bands 段，至少有一段完全相同的两个文档才成为候选对，
+    候选对再交给精确的相似度计算验证，避免两两比较。子类负责把签名切分为每段一个uint64段值。
+    """
+
+    def __init__(self, bands):
+        self.bands = bands
+        self.band_keys = [np.empty(0, dtype=np.uint64) for _ in range(bands)]  # 每段的段值，下标即文档编号
+        self._sorted = None  # 查询用的 (排序下标, 排序后段值) 缓存
+
+    def __len__(self):
+        return len(self.band_keys[0])
+
+    @abc.abstractmethod
+    def compute_band_keys(self, signatures):
+        """
+        把一批签名切分为段值。
+        返回: np.ndarray: (bands × 签名数) 的 uint64 数组，每行为一段的段值。
+        """
+
+    def add(self, signatures):
+        """
+        将一批签名加入索引。
+        参数: signatures: 待加入的签名，格式由子类决定。
+        返回: np.ndarray: 这批签名在索引中的编号。
+        """
+        start = len(self)
+        keys = self.compute_band_keys(signatures)
+        self.band_keys = [np.concatenate([old, new]) for old, new in zip(self.band_keys, keys)]
+        self._sorted = None
+        return np.arange(start, len(self))
+
+    def sorted_bands(self):
+        if self._sorted is None:
+            self._sorted = []
+            for keys in self.band_keys:
+                order = np.argsort(keys, kind='stable')
+                self._sorted.append((order, keys[order]))
+        return self._sorted
+
+    def candidate_pairs(self):
+        # 返回索引内部所有候选对 (m × 2)，每对满足 i < j
+        pairs_i, pairs_j = [], []
+        for order, keys in self.sorted_bands():
+            boundaries = np.flatnonzero(np.diff(keys)) + 1
+            starts = np.concatenate([[0], boundaries])
+            stops = np.concatenate([boundaries, [len(keys)]])
+            for start, stop in zip(starts[stops - starts > 1], stops[stops - starts > 1]):
+                members = order[start:stop]
+                upper_i, upper_j = np.triu_indices(len(members), 1)
+                pairs_i.append(members[upper_i])
+                pairs_j.append(members[upper_j])
+        return _unique_pairs(pairs_i, pairs_j)
+
+    def query(self, signatures):
+        """
+        查询一批新签名在索引中的候选匹配。
+        参数: signatures: 待查询的签名，格式与 add 相同。
+        返回: np.ndarray: (m × 2) 的数组，每行为 (查询行号, 索引中的文档编号)。
+        """
+        query_keys = self.compute_band_keys(signatures)
+        found = []
+        for (order, keys), band_query in zip(self.sorted_bands(), query_keys):
+            lefts = np.searchsorted(keys, band_query, side='left')
+            rights = np.searchsorted(keys, band_query, side='right')
+            owners, positions = _expand_ranges(lefts, rights)
+            found.append(np.stack([owners, order[positions]], axis=1))
+        if not found:
+            return np.empty((0, 2), dtype=np.int64)
+        return np.unique(np.concatenate(found).astype(np.int64), axis=0)
+
+
+class SimHashLSHIndex(BandedLSHIndex):
+    """
+    基于SimHash指纹的LSH索引：指纹被切成 bands 段、每段 rows 位。
+    """
+
+    def __init__(self, hashbits=128, bands=16, rows=None):
+        rows = rows or hashbits // bands
+        if bands * rows > hashbits or rows > 64:
+            raise ValueError(f"Invalid LSH banding: {bands} bands x {rows} rows for {hashbits}-bit fingerprints")
+        super().__init__(bands)
+        self.hashbits = hashbits
+        self.rows = rows
+
+    def compute_band_keys(self, fingerprints):
+        # 将 PackedFingerprints 切分为每段一个uint64段值，返回 (bands × 文档数) 的数组
+        bits = fingerprints.bits()
+        keys = np.zeros((self.bands, len(fingerprints)), dtype=np.uint64)
+        for band in range(self.bands):
+            packed = np.packbits(bits[:, band * self.rows:(band + 1) * self.rows], axis=1, bitorder='little')
+            padded = np.zeros((packed.shape[0], 8), dtype=np.uint8)
+            padded[:, :packed.shape[1]] = packed
+            keys[band] = padded.view('<u8').ravel()
+        return keys
+
+
 class TextSimilarityCalculator:
-    def __init__(self, text_corpus, hashbits=128, cosine_weight=0.6, hamming_weight=0.4, workers=10, min_df=0.02, max_df=0.8):
+    def __init__(self, text_corpus, hashbits=128, cosine_weight=0.6, hamming_weight=0.4, workers=10, min_df=0.02, max_df=0.8,
+                 simhash_method='sha256', tokenizer_backend='auto', cache=None, refit_threshold=0.2, instrumentation=None,
+                 stopwords_path=STOPWORDS_PATH, weights=None, cancel_check=None):
         self.hashbits = hashbits  # SimHash位数，用于确定特征向量的长度
         self.cosine_weight = cosine_weight  # 余弦相似度权重，在最终得分计算中的占比
         self.hamming_weight = hamming_weight  # 汉明距离权重，在最终得分计算中的占比
         self.workers = workers  # 线程池工作线程数，用于并行处理任务
-        self.text_corpus = self.parallel_tokenize(text_corpus)  # 对输入的文本数据进行并行分词处理
-        self.vectorizer = TfidfVectorizer(ngram_range=(1, 2), max_df=max_df, min_df=min_df)  # TF-IDF向量化，包括双字节n-gram
-        self.tfidf_matrix = self.vectorizer.fit_transform(self.text_corpus)  # 根据分词结果生成TF-IDF矩阵
-        self.feature_names = self.vectorizer.get_feature_names_out()  # 获取TF-IDF矩阵中的特征名称
-        self.document_hashes = self.calculate_simhashes_parallel()  # 并行计算文档的SimHash值
+        self.tokenizer_backend = tokenizer_backend  # 分词后端：'auto'、'process'、'thread' 或 'serial'
+        self.cache = cache  # ContentCache，按文本内容缓存分词结果
+        self.simhash_method = simhash_method  # SimHash特征哈希方法
+        self.refit_threshold = refit_threshold  # 增删文档数超过拟合时文档数的该比例后，下次计算前重新拟合IDF
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION  # 各阶段计时与内存统计，默认不记录
+        self.cancel_check = cancel_check  # 可选回调，在分词与相似文档查询中定期调用，抛出异常即中止（用于取消）
+        self.min_df = min_df  # 词语至少出现在该比例（或该数量）的文档中
+        self.max_df = max_df  # 词语至多出现在该比例（或该数量）的文档中
+        self.text_corpus = self.cached_tokenize(text_corpus)  # 对输入的文本数据进行并行分词处理，每个文档为词元列表
+        # 每行代表的相同文档份数（见 dedup.DuplicateClusters），默认每行一份
+        self.weights = np.ones(len(self.text_corpus), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+        stopwords = load_stopwords(stopwords_path) if stopwords_path else frozenset()
+        self.analyzer = TokenAnalyzer(stopwords, ngram_range=(1, 2))  # 过滤停用词并生成一元与二元词组
+        self.fit()
+
+    def fit(self):
+        # 在当前全部分词结果上拟合词表与IDF，并重新计算TF-IDF矩阵和SimHash指纹
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        with self.instrumentation.stage('tfidf', items=len(self.text_corpus)) as record:
+            if np.all(self.weights == 1):
+                self.vectorizer = TfidfVectorizer(analyzer=self.analyzer, max_df=self.max_df, min_df=self.min_df)  # TF-IDF向量化
+                self.tfidf_matrix = self.vectorizer.fit_transform(self.text_corpus).tocsr()  # 根据分词结果生成TF-IDF矩阵
+            else:
+                self.tfidf_matrix = self.fit_weighted()
+            self.tfidf_matrix.sort_indices()  # 保证每行非零项按特征序排列，后续直接读取CSR数组
+            self.feature_names = self.vectorizer.get_feature_names_out()  # 获取TF-IDF矩阵中的特征名称
+            record['features'] = len(self.feature_names)
+        with self.instrumentation.stage('simhash', items=len(self.text_corpus)):
+            self.simhash_engine = SimHashEngine(self.feature_names, self.hashbits, self.simhash_method)  # 词表级SimHash引擎
+            self.packed_hashes = PackedFingerprints.from_bits(self.simhash_engine.fingerprint_bits(self.tfidf_matrix))  # 打包的SimHash指纹
+            self.document_hashes = self.packed_hashes.to_ints()  # 整数形式的SimHash值，与 simhash 的输出一致
+        self.fitted_documents = len(self.text_corpus)  # 拟合时的文档数
+        self.changed_since_fit = 0  # 拟合后增删的文档数
+        # 线性时间评分所需的累计量：单位化TF-IDF的（按份数加权的）列和，以及各指纹位为1的文档数
+        self.column_sum = np.asarray(_normalize_rows(self.tfidf_matrix).T @ self.weights, dtype=np.float64).ravel()
+        self.bit_counts = self.packed_hashes.bits().T.astype(np.int64) @ self.weights
+
+    def fit_weighted(self):
+        """
+        带权拟合：第i行代表 weights[i] 份相同的文档，文档频率、min_df/max_df 与IDF都按总份数计算，
+        得到的词表与TF-IDF矩阵和把每行重复 weights[i] 次后直接拟合的结果相同，但分析器只对每行运行一次。
+        返回: scipy.sparse.csr_matrix: 每行一个的TF-IDF矩阵（行已单位化）。
+        """
+        from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+        from sklearn.preprocessing import normalize
+        counter = CountVectorizer(analyzer=self.analyzer)
+        counts = counter.fit_transform(self.text_corpus).tocsr()
+        total = int(self.weights.sum())
+        present = counts.copy()
+        present.data[:] = 1
+        document_frequency = present.T @ self.weights
+        max_count = self.max_df if isinstance(self.max_df, numbers.Integral) else self.max_df * total
+        min_count = self.min_df if isinstance(self.min_df, numbers.Integral) else self.min_df * total
+        keep = (document_frequency >= min_count) & (document_frequency <= max_count)
+        if not keep.any():
+            raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+        idf = np.log((1 + total) / (1 + document_frequency[keep])) + 1  # 与 TfidfVectorizer 默认的平滑IDF相同
+        self.vectorizer = TfidfVectorizer(analyzer=self.analyzer, vocabulary=counter.get_feature_names_out()[keep])
+        self.vectorizer.idf_ = idf  # 固定词表与IDF，新加入的文档直接用 transform 转换
+        return normalize(counts[:, keep] @ sparse.diags(idf), norm='l2').tocsr()
+
+    def needs_refit(self):
+        return self.changed_since_fit > self.refit_threshold * max(self.fitted_documents, 1)
+
+    def ensure_fitted(self):
+        # 漂移超过阈值时才重新拟合，否则继续沿用已拟合的词表与IDF
+        if self.needs_refit():
+            logging.info(f"Refitting TF-IDF after {self.changed_since_fit} document changes.")
+            self.fit()
+
+    def add_documents(self, texts):
+        """
+        增量加入文档：沿用已拟合的词表与IDF，只对新文档分词、向量化并计算SimHash。
+        参数: texts (list): 新文档的文本。
+        返回: list: 新文档的下标。
+        """
+        tokens = self.cached_tokenize(texts)
+        with self.instrumentation.stage('add_documents', items=len(tokens)):
+            self.append_rows(tokens)
+        return list(range(len(self.text_corpus) - len(tokens), len(self.text_corpus)))
+
+    def append_rows(self, tokens):
+        # 用已拟合的向量器转换新文档并追加到TF-IDF矩阵、指纹与累计量中
+        rows = self.vectorizer.transform(tokens).tocsr()
+        rows.sort_indices()
+        bits = self.simhash_engine.fingerprint_bits(rows)
+        new_hashes = PackedFingerprints.from_bits(bits)
+
+        self.text_corpus.extend(tokens)
+        self.tfidf_matrix = sparse.vstack([self.tfidf_matrix, rows], format='csr')
+        self.packed_hashes = PackedFingerprints(np.vstack([self.packed_hashes.words, new_hashes.words]), self.hashbits)
+        self.document_hashes.extend(new_hashes.to_ints())
+        self.column_sum += np.asarray(_normalize_rows(rows).sum(axis=0)).ravel()
+        self.bit_counts += bits.sum(axis=0, dtype=np.int64)
+        self.weights = np.concatenate([self.weights, np.ones(len(tokens), dtype=np.int64)])
+        self.changed_since_fit += len(tokens)
+
+    def remove_documents(self, indices):
+        """
+        删除指定下标的文档，其余文档的下标按原顺序前移。
+        参数: indices (list): 要删除的文档下标。
+        """
+        removed = np.zeros(len(self.text_corpus), dtype=bool)
+        removed[list(indices)] = True
+        keep = np.flatnonzero(~removed)
+        self.column_sum -= np.asarray(_normalize_rows(self.tfidf_matrix[removed]).T @ self.weights[removed]).ravel()
+        self.bit_counts -= self.packed_hashes.bits()[removed].T.astype(np.int64) @ self.weights[removed]
+        self.weights = self.weights[keep]
+        self.text_corpus = [self.text_corpus[i] for i in keep]
+        self.tfidf_matrix = self.tfidf_matrix[keep]
+        self.packed_hashes = PackedFingerprints(self.packed_hashes.words[keep], self.hashbits)
+        self.document_hashes = [self.document_hashes[i] for i in keep]
+        self.changed_since_fit += int(removed.sum())
 
     def parallel_tokenize(self, texts):
-        # 使用线程池来加速分词过程
-        with ThreadPoolExecutor(max_workers=self.workers) as executor:
-            results = list(executor.map(lambda text: ' '.join(jieba.cut(text)), texts))
-        return results
+        # 按分词后端对文本分词；jieba是纯Python实现，只有进程池能真正并行
+        backend = self.tokenizer_backend
+        if backend == 'auto':
+            large = sum(len(text) for text in texts) >= PROCESS_TOKENIZE_MIN_CHARS
+            backend = 'process' if large and self.workers > 1 else 'serial'
+        if backend == 'process':
+            return self.process_tokenize(texts)
+        if backend == 'thread':
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                return list(executor.map(_tokenize_text, texts))
+        if backend == 'serial':
+            return _map_chunks(_tokenize_chunk, _fixed_chunks(texts), cancel_check=self.cancel_check)
+        raise ValueError(f"Unknown tokenizer backend: {backend}")
+
+    def cached_tokenize(self, texts):
+        # 先查缓存，只对未命中的（去重后的）文本分词，再写回缓存
+        texts = list(texts)
+        with self.instrumentation.stage('tokenization', items=len(texts), characters=sum(map(len, texts))) as record:
+            if self.cache is None:
+                return self.parallel_tokenize(texts)
+            return self.tokenize_with_cache(texts, record)
+
+    def tokenize_with_cache(self, texts, record):
+        import jieba
+        keys = [self.cache.make_key('token-lists', content_hash(text), 'jieba', jieba.__version__) for text in texts]
+        found = self.cache.get_many(set(keys))
+        pending = {key: text for key, text in zip(keys, texts) if key not in found}
+        record['cache_misses'] = len(pending)
+        for key, tokens in zip(pending, self.parallel_tokenize(list(pending.values()))):
+            self.cache.set(key, tokens)
+            found[key] = tokens
+        return [found[key] for key in keys]
+
+    def process_tokenize(self, texts):
+        # 使用进程池分词：文档按字数均衡地切成连续的块分发，结果按原顺序拼接
+        texts = list(texts)
+        workers = max(1, min(self.workers, os.cpu_count() or 1))
+        chunks = balanced_chunks([len(text) for text in texts], workers * CHUNKS_PER_WORKER)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_tokenizer_worker) as executor:
+            return _map_chunks(_tokenize_chunk, [texts[start:stop] for start, stop in chunks], executor,
+                               self.cancel_check)
 
     def hashfunc(self, x):
         # 定义一个哈希函数，使用SHA-256算法，用于SimHash计算中
@@ -56,10 +615,9 @@ class TextSimilarityCalculator:
         return fingerprint
 
     def calculate_simhashes_parallel(self):
-        # 并行计算所有文档的SimHash值
-        tfidf_corpus = self.compute_tfidf_corpus()
+        # 并行计算所有文档的SimHash值（逐特征哈希的实现，结果与 simhash_engine 相同）
         with ThreadPoolExecutor(max_workers=self.workers) as executor:
-            results = list(executor.map(self.compute_simhash, tfidf_corpus))
+            results = list(executor.map(self.simhash, self.iter_weighted_features()))
         return results
 
     def compute_simhash(self, document):
@@ -67,26 +625,43 @@ class TextSimilarityCalculator:
         weighted_features = [(weight, feature) for feature, weight in document.items()]
         return self.simhash(weighted_features)
 
+    def iter_weighted_features(self):
+        # 直接读取CSR矩阵的 indices/data，逐行生成 (权重, 特征) 列表，不构造稠密行
+        indptr, indices, data = self.tfidf_matrix.indptr, self.tfidf_matrix.indices, self.tfidf_matrix.data
+        for i in range(self.tfidf_matrix.shape[0]):
+            row_indices = indices[indptr[i]:indptr[i + 1]]
+            row_data = data[indptr[i]:indptr[i + 1]]
+            positive = row_data > 0
+            yield list(zip(row_data[positive].tolist(), self.feature_names[row_indices[positive]].tolist()))
+
     def compute_tfidf_corpus(self):
-        # 将TF-IDF矩阵转换为特征字典，用于后续SimHash计算
-        documents = []
-        for row in self.tfidf_matrix:
-            feature_weights = row.toarray()[0]
-            document = {feature: weight for feature, weight in zip(self.feature_names, feature_weights) if weight > 0}
-            documents.append(document)
-        return documents
-
-    def calculate_scores(self):
-        # 计算每个文档的综合相似度得分
-        num_docs = self.tfidf_matrix.shape[0]
-        cosine_sim_matrix = cosine_similarity(self.tfidf_matrix)  # 计算余弦相似度矩阵
-        scores = []
+        # 将TF-IDF矩阵转换为特征字典（兼容接口），只遍历每行的非零项
+        return [{feature: weight for weight, feature in features} for features in self.iter_weighted_features()]
+
+    def calculate_scores(self, method='linear'):
+        """
+        计算每个文档的综合相似度得分（与其余所有文档的平均相似度）。
+        参数: method (str): 'linear' 利用列和与逐位计数在线性时间内得到精确平均值；
+              'pairwise' 构造完整的余弦相似度矩阵与汉明距离矩阵。
+        返回: list: 每个文档的得分（0-100）。
+        """
+        self.ensure_fitted()
+        with self.instrumentation.stage('text_scoring', items=self.tfidf_matrix.shape[0], method=method):
+            return self.scores_from_totals(method)
 
-        for i in range(num_docs):
-            hamming_distances = [self.hamming_distance(self.document_hashes[i], self.document_hashes[j]) for j in range(num_docs) if i != j]
-            total_hamming = sum(hamming_distances)
-            average_cosine = (sum(cosine_sim_matrix[i]) - 1) / (num_docs - 1)
-            average_hamming = total_hamming / (num_docs - 1)
+    def scores_from_totals(self, method):
+        if method == 'linear':
+            total_cosines, total_hammings = self.linear_totals()
+        elif method == 'pairwise':
+            total_cosines, total_hammings = self.pairwise_totals()
+        else:
+            raise ValueError(f"Unknown scoring method: {method}")
+
+        num_docs = int(self.weights.sum())  # 相同文档按份数计入
+        scores = []
+        for i in range(self.tfidf_matrix.shape[0]):
+            average_cosine = (total_cosines[i] - 1) / (num_docs - 1)  # 减去与自身的相似度1
+            average_hamming = int(total_hammings[i]) / (num_docs - 1)
 
             normalized_hamming = 1 - average_hamming / self.hashbits
             final_score = self.cosine_weight * average_cosine + self.hamming_weight * normalized_hamming
@@ -94,6 +669,99 @@ class TextSimilarityCalculator:
 
         return scores
 
+    def pairwise_totals(self):
+        # 通过完整的 n×n 矩阵求每个文档与所有文档（含自身）的余弦相似度之和及汉明距离之和
+        from sklearn.metrics.pairwise import cosine_similarity
+        cosine_sim_matrix = cosine_similarity(self.tfidf_matrix)  # 计算余弦相似度矩阵
+        total_cosines = cosine_sim_matrix @ self.weights
+        total_hammings = np.zeros(len(self.packed_hashes), dtype=np.int64)
+        for start, stop, block in self.packed_hashes.iter_distance_blocks():
+            total_hammings[start:stop] = block.astype(np.int64) @ self.weights  # 自身距离为0，不影响总和
+        return total_cosines, total_hammings
+
+    def linear_totals(self):
+        # 单位化后，文档i与所有文档的余弦之和等于它与列和向量的点积（列和随增删文档累计更新）
+        total_cosines = _normalize_rows(self.tfidf_matrix) @ self.column_sum
+        # 第b位上与文档i不同的文档数：i该位为1时是该位为0的文档数，否则是该位为1的文档数
+        bits = self.packed_hashes.bits()
+        num_docs = self.weights.sum()
+        total_hammings = np.where(bits, num_docs - self.bit_counts, self.bit_counts).sum(axis=1)
+        return total_cosines, total_hammings
+
+    def find_similar_pairs(self, bands=16, rows=None, max_hamming=None, min_cosine=0.0):
+        """
+        用LSH索引找出候选近重复文档对，并对候选对做精确的余弦相似度与汉明距离验证。
+        参数: bands/rows: LSH分段参数；max_hamming: 汉明距离上限（None表示不限）；min_cosine: 余弦相似度下限。
+        返回: list: (i, j, 余弦相似度, 汉明距离) 列表，i < j，按余弦相似度降序排列。
+        """
+        self.ensure_fitted()
+        index = SimHashLSHIndex(self.hashbits, bands, rows)
+        index.add(self.packed_hashes)
+        pairs = index.candidate_pairs()
+        return self.verify_pairs(pairs, max_hamming, min_cosine)
+
+    def top_k_similar(self, k=5, block_size=1024, rows=None):
+        """
+        找出每个文档最相似的 k 个其他文档。
+        余弦相似度按 block_size × block_size 的块用稀疏矩阵乘积计算，每块计算后只保留每行当前最好的 k 个，
+        内存占用由块大小决定，不会构造 n×n 的稠密矩阵。
+        参数: k (int): 每个文档保留的相似文档数；block_size (int): 分块大小；
+              rows (list): 只查询这些文档，默认查询全部文档。
+        返回: list: 每个被查询文档一个列表，元素为 (文档下标, 余弦相似度, 汉明距离)，按余弦相似度降序排列。
+        """
+        self.ensure_fitted()
+        normalized = _normalize_rows(self.tfidf_matrix).tocsr()
+        num_docs = normalized.shape[0]
+        row_ids = np.arange(num_docs) if rows is None else np.asarray(rows, dtype=np.int64).reshape(-1)
+        k = min(k, num_docs - 1)
+        if k <= 0:
+            return [[] for _ in range(len(row_ids))]
+        best_scores = np.full((len(row_ids), k), -np.inf)
+        best_indices = np.full((len(row_ids), k), -1, dtype=np.int64)
+        for row_start in range(0, len(row_ids), block_size):
+            if self.cancel_check is not None:
+                self.cancel_check()
+            row_stop = min(row_start + block_size, len(row_ids))
+            ids = row_ids[row_start:row_stop]
+            block = normalized[ids]
+            scores, indices = best_scores[row_start:row_stop], best_indices[row_start:row_stop]
+            for col_start in range(0, num_docs, block_size):
+                col_stop = min(col_start + block_size, num_docs)
+                tile = (block @ normalized[col_start:col_stop].T).toarray()
+                # 排除文档与自身的相似度
+                inside = np.flatnonzero((ids >= col_start) & (ids < col_stop))
+                tile[inside, ids[inside] - col_start] = -np.inf
+                candidate_scores = np.hstack([scores, tile])
+                candidate_indices = np.hstack([indices, np.broadcast_to(np.arange(col_start, col_stop), tile.shape)])
+                keep = np.argpartition(-candidate_scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(candidate_scores, keep, axis=1)
+                indices = np.take_along_axis(candidate_indices, keep, axis=1)
+            best_scores[row_start:row_stop], best_indices[row_start:row_stop] = scores, indices
+
+        words = self.packed_hashes.words
+        hammings = popcount64(words[row_ids][:, None, :] ^ words[best_indices]).sum(axis=2, dtype=np.int64)
+        results = []
+        for i in range(len(row_ids)):
+            order = np.lexsort((best_indices[i], -best_scores[i]))  # 相似度降序，相同时按下标升序
+            results.append([(int(best_indices[i, j]), float(best_scores[i, j]), int(hammings[i, j])) for j in order])
+        return results
+
+    def verify_pairs(self, pairs, max_hamming=None, min_cosine=0.0):
+        # 对给定的文档对逐对计算精确的余弦相似度与汉明距离，并按阈值过滤
+        if len(pairs) == 0:
+            return []
+        normalized = _normalize_rows(self.tfidf_matrix)
+        cosines = np.asarray(normalized[pairs[:, 0]].multiply(normalized[pairs[:, 1]]).sum(axis=1)).ravel()
+        words = self.packed_hashes.words
+        hammings = popcount64(words[pairs[:, 0]] ^ words[pairs[:, 1]]).sum(axis=1, dtype=np.int64)
+        keep = cosines >= min_cosine
+        if max_hamming is not None:
+            keep &= hammings <= max_hamming
+        order = np.argsort(-cosines[keep], kind='stable')
+        kept_pairs, kept_cosines, kept_hammings = pairs[keep][order], cosines[keep][order], hammings[keep][order]
+        return [(int(i), int(j), float(cosine), int(hamming))
+                for (i, j), cosine, hamming in zip(kept_pairs, kept_cosines, kept_hammings)]
+
     def hamming_distance(self, hash1, hash2):
         # 计算两个SimHash值之间的汉明距离
         x = hash1 ^ hash2
@@ -102,31 +770,478 @@ class TextSimilarityCalculator:
         return bin(x).count('1')
 
 
+class MinHashEngine:
+    """
+    MinHash签名引擎。
+    词元先用crc32映射为32位整数，再与 num_perm 个随机种子异或后经splitmix64混合、取最小值，
+    每个集合得到固定长度的签名，两个签名逐位相等的比例即Jaccard相似度的估计。
+    """
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.seeds = rng.randint(0, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+    def hash_tokens(self, tokens):
+        return np.fromiter((zlib.crc32(token.encode('utf-8')) for token in tokens), dtype=np.uint64, count=len(tokens))
+
+    def signatures(self, token_matrix, token_hashes, chunk_size=65536):
+        """
+        计算所有集合的MinHash签名。
+        参数: token_matrix: (集合数 × 词元数) 的二值CSR矩阵；token_hashes: 每个词元的32位哈希。
+        返回: np.ndarray: (集合数 × num_perm) 的uint64签名，空集合的签名全部为uint64最大值。
+        """
+        num_sets = token_matrix.shape[0]
+        signatures = np.full((num_sets, self.num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+        indptr, indices = token_matrix.indptr, token_matrix.indices
+        nonempty = np.flatnonzero(np.diff(indptr) > 0)
+        # 按非零项分块，块内用 minimum.reduceat 一次求出若干集合的最小值
+        start = 0
+        while start < len(nonempty):
+            stop = start + 1
+            while stop < len(nonempty) and indptr[nonempty[stop] + 1] - indptr[nonempty[start]] <= chunk_size:
+                stop += 1
+            rows = nonempty[start:stop]
+            values = token_hashes[indices[indptr[rows[0]]:indptr[rows[-1] + 1]]]
+            permuted = _splitmix64(self.seeds[:, None] ^ values[None, :])
+            offsets = indptr[rows] - indptr[rows[0]]
+            signatures[rows] = np.minimum.reduceat(permuted, offsets, axis=1).T
+            start = stop
+        return signatures
+
+    @staticmethod
+    def estimate_jaccard(signatures_a, signatures_b):
+        # 逐行估计两组签名之间的Jaccard相似度
+        return (signatures_a == signatures_b).mean(axis=1)
+
+
+class MinHashLSHIndex(BandedLSHIndex):
+    """
+    基于MinHash签名的LSH索引：签名被切成 bands 段、每段 rows 个哈希值。
+    """
+
+    def __init__(self, num_perm=128, bands=32, rows=None):
+        rows = rows or num_perm // bands
+        if bands * rows > num_perm:
+            raise ValueError(f"Invalid LSH banding: {bands} bands x {rows} rows for {num_perm} permutations")
+        super().__init__(bands)
+        self.num_perm = num_perm
+        self.rows = rows
+
+    def compute_band_keys(self, signatures):
+        # 将每段的 rows 个哈希值混合为一个uint64段值，返回 (bands × 集合数) 的数组
+        keys = np.zeros((self.bands, signatures.shape[0]), dtype=np.uint64)
+        for band in range(self.bands):
+            key = np.zeros(signatures.shape[0], dtype=np.uint64)
+            for row in range(band * self.rows, (band + 1) * self.rows):
+                key = _splitmix64(key ^ signatures[:, row])
+            keys[band] = key
+        return keys
+
+
+PROCESS_LEX_MIN_CHARS = 500000  # 代码总字数超过该值才启用进程池词法分析
+LEXERS = {'python': 'PythonLexer', 'c': 'CLexer', 'cpp': 'CppLexer', 'java': 'JavaLexer'}  # 语言 -> pygments 词法分析器类名
+
+_LINE_COMMENT_RE = re.compile(r'//.*?$', re.MULTILINE)  # C/C++/Java 单行注释
+_HASH_COMMENT_RE = re.compile(r'#.*?$', re.MULTILINE)  # Python 单行注释
+_BLOCK_COMMENT_RE = re.compile(r'/\*.*?\*/', re.MULTILINE | re.DOTALL)  # C/C++/Java 多行注释
+_JAVA_MARKERS_RE = re.compile(r'\bpublic\s+(?:static\s+)?(?:class|void)\b|\bSystem\.out\.|^\s*import\s+java\.', re.MULTILINE)
+_C_FAMILY_MARKERS_RE = re.compile(r'^\s*#\s*include\b|\bint\s+main\s*\(|\bprintf\s*\(|\bscanf\s*\(', re.MULTILINE)
+_CPP_MARKERS_RE = re.compile(r'\bstd::|\bcout\b|\bcin\b|\busing\s+namespace\b|\btemplate\s*<|^\s*class\s+\w+\s*[:{]|#\s*include\s*<(?:iostream|vector|string|map|algorithm)>', re.MULTILINE)
+DETECT_PREFIX_CHARS = 4000  # 语言检测只看代码开头的这么多字符
+
+_lexer_instances = {}  # 每个进程内复用的词法分析器实例
+
+
+def detect_language(code):
+    """
+    用少量正则特征粗略判断代码语言，代价远低于 pygments 的 guess_lexer。
+    返回: str: 'java'、'cpp'、'c' 或 'python'（无法判断时）。
+    """
+    head = code[:DETECT_PREFIX_CHARS]
+    if _JAVA_MARKERS_RE.search(head):
+        return 'java'
+    if _C_FAMILY_MARKERS_RE.search(head):
+        return 'cpp' if _CPP_MARKERS_RE.search(head) else 'c'
+    if _CPP_MARKERS_RE.search(head):
+        return 'cpp'
+    return 'python'
+
+
+def clean_code(code, language=None):
+    # 按语言移除注释；未指定语言时同时移除Python与C++风格的注释
+    if language in (None, 'python'):
+        code = _HASH_COMMENT_RE.sub('', code)
+    if language != 'python':
+        code = _LINE_COMMENT_RE.sub('', code)
+        code = _BLOCK_COMMENT_RE.sub('', code)
+    return code
+
+
+def _lex_chunk(items):
+    # 对一批 (代码, 语言) 做词法分析，词元类型转为字符串，便于跨进程传递与缓存
+    from pygments import lex, lexers
+    streams = []
+    for code, language in items:
+        lexer = _lexer_instances.get(language)
+        if lexer is None:
+            lexer = _lexer_instances[language] = getattr(lexers, LEXERS[language])()
+        streams.append([(str(ttype), value) for ttype, value in lex(code, lexer)])
+    return streams
+
+
+def load_lexers():
+    # 在当前进程中预先导入 pygments 并创建各语言的词法分析器，之后的词法分析不再包含这部分开销
+    _lex_chunk([('', language) for language in LEXERS])
+
+
+def normalize_token_stream(stream):
+    """
+    按词元类型规范化词元流：标识符、字符串、数字分别替换为统一的占位符，
+    去掉空白与注释，关键字、运算符、标点和内置名称保持原值。这样变量重命名、改常量不会影响指纹。
+    参数: stream (list): [(词元类型字符串, 词元值), ...]。
+    返回: list: 规范化后的词元列表。
+    """
+    normalized = []
+    for ttype, value in stream:
+        if ttype.startswith('Token.Comment') or not value.strip():
+            continue
+        if ttype.startswith('Token.Name') and not ttype.startswith('Token.Name.Builtin'):
+            normalized.append('<ID>')
+        elif ttype.startswith('Token.Literal.String'):
+            normalized.append('<STR>')
+        elif ttype.startswith('Token.Literal.Number'):
+            normalized.append('<NUM>')
+        else:
+            normalized.append(value)
+    return normalized
+
+
+class WinnowingEngine:
+    """
+    MOSS风格的winnowing指纹引擎。
+    规范化后的词元流按 k 个一组计算滚动哈希，在每 window 个连续哈希中取最小值（相同时取最右），
+    被选中的哈希构成紧凑的指纹集合；任何长度不少于 k + window - 1 个词元的相同片段都必然产生共同指纹。
+    """
+
+    def __init__(self, k=5, window=4):
+        self.k = k
+        self.window = window
+
+    def kgram_hashes(self, normalized_tokens):
+        token_ids = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in normalized_tokens),
+                                dtype=np.uint64, count=len(normalized_tokens))
+        return rolling_hash_values(token_ids, self.k)
+
+    def fingerprint(self, normalized_tokens):
+        # 返回去重排序后的指纹数组（uint64）
+        hashes = self.kgram_hashes(normalized_tokens)
+        if len(hashes) <= self.window:
+            return hashes[np.argmin(hashes)][None] if len(hashes) else hashes  # 不足一个窗口时取全局最小值
+        windows = np.lib.stride_tricks.sliding_window_view(hashes, self.window)
+        rightmost = self.window - 1 - np.argmin(windows[:, ::-1], axis=1)
+        selected = np.unique(np.arange(len(windows)) + rightmost)
+        return np.unique(hashes[selected])
+
+
+class WinnowingIndex:
+    """
+    指纹倒排索引：指纹 -> 含有该指纹的文档。
+    只有至少共享一个指纹的文档对才会被生成，无需比较所有文档对。
+    """
+
+    def __init__(self, fingerprints):
+        self.sizes = np.array([len(f) for f in fingerprints], dtype=np.int64)
+        self.hashes = np.concatenate(fingerprints) if fingerprints else np.empty(0, dtype=np.uint64)
+        self.doc_ids = np.repeat(np.arange(len(fingerprints)), self.sizes)
+        order = np.argsort(self.hashes, kind='stable')
+        self.hashes, self.doc_ids = self.hashes[order], self.doc_ids[order]
+
+    def matching_pairs(self, max_doc_frequency=None):
+        """
+        统计每对文档共享的指纹数。
+        参数: max_doc_frequency (int): 出现在过多文档中的指纹（如公共框架代码）被忽略，None表示不限。
+        返回: tuple (np.ndarray, np.ndarray, np.ndarray): 满足 i < j 的文档i、j及共享指纹数。
+        """
+        boundaries = np.flatnonzero(np.diff(self.hashes)) + 1
+        starts = np.concatenate([[0], boundaries])
+        stops = np.concatenate([boundaries, [len(self.hashes)]])
+        counts = stops - starts
+        shared = (counts > 1) if max_doc_frequency is None else (counts > 1) & (counts <= max_doc_frequency)
+        num_docs = len(self.sizes)
+        pair_codes = []
+        for start, stop in zip(starts[shared], stops[shared]):
+            members = self.doc_ids[start:stop]
+            upper_i, upper_j = np.triu_indices(len(members), 1)
+            pair_codes.append(members[upper_i] * num_docs + members[upper_j])
+        if not pair_codes:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        codes, shared_counts = np.unique(np.concatenate(pair_codes), return_counts=True)
+        return codes // num_docs, codes % num_docs, shared_counts
+
+
 class CodeSimilarityCalculator:
-    def __init__(self, code_corpus, workers=10):
+    def __init__(self, code_corpus, workers=10, cache=None, language='auto', instrumentation=None, weights=None,
+                 cancel_check=None):
         self.workers = workers
-        self.code_corpus = [self.clean_code(code) for code in code_corpus]
-        self.tokens = self.tokenize_codes(self.code_corpus)
+        self.cache = cache  # ContentCache，按代码内容缓存词元流
+        self.language = language  # 'auto' 按提交逐份检测语言，也可固定为 LEXERS 中的某种语言
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION  # 各阶段计时与内存统计，默认不记录
+        self.cancel_check = cancel_check  # 可选回调，在词法分析与相似代码查询中定期调用，抛出异常即中止（用于取消）
+        code_corpus = list(code_corpus)
+        with self.instrumentation.stage('code_cleaning', items=len(code_corpus)):
+            self.languages = [detect_language(code) if language == 'auto' else language for code in code_corpus]
+            self.code_corpus = [self.clean_code(code, lang) for code, lang in zip(code_corpus, self.languages)]
+        self.token_streams = self.lex_codes(self.code_corpus, self.languages)  # 每份代码的有序词元流 [(词元类型, 词元值), ...]
+        self.tokens = [set(value for _, value in stream) for stream in self.token_streams]
+        # 每份代码代表的相同提交份数（见 dedup.DuplicateClusters），默认每份一份
+        self.weights = np.ones(len(self.tokens), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+
+    def clean_code(self, code, language=None):
+        # 按语言移除注释；未指定语言时同时移除Python与C++风格的注释
+        return clean_code(code, language)
+
+    def add_documents(self, codes):
+        """
+        增量加入代码：只对新代码检测语言、清理并做词法分析，已缓存的签名与指纹在下次使用时重新计算。
+        参数: codes (list): 新代码文本。
+        返回: list: 新代码的下标。
+        """
+        codes = list(codes)
+        languages = [detect_language(code) if self.language == 'auto' else self.language for code in codes]
+        cleaned = [self.clean_code(code, lang) for code, lang in zip(codes, languages)]
+        streams = self.lex_codes(cleaned, languages)
+        start = len(self.code_corpus)
+        self.languages.extend(languages)
+        self.code_corpus.extend(cleaned)
+        self.token_streams.extend(streams)
+        self.tokens.extend(set(value for _, value in stream) for stream in streams)
+        self.weights = np.concatenate([self.weights, np.ones(len(streams), dtype=np.int64)])
+        self.invalidate_indexes()
+        return list(range(start, len(self.code_corpus)))
 
-    def clean_code(self, code):
-        # 示例：移除Python或C++风格的注释
-        code = re.sub(r'//.*?$', '', code, flags=re.MULTILINE)  # C++ 单行注释
-        code = re.sub(r'#.*?$', '', code, flags=re.MULTILINE)  # Python 单行注释
-        code = re.sub(r'/\*.*?\*/', '', code, flags=re.MULTILINE | re.DOTALL)  # C++ 多行注释
-        return code
+    def remove_documents(self, indices):
+        # 删除指定下标的代码，其余代码的下标按原顺序前移
+        removed = set(indices)
+        keep = [i for i in range(len(self.code_corpus)) if i not in removed]
+        self.languages = [self.languages[i] for i in keep]
+        self.code_corpus = [self.code_corpus[i] for i in keep]
+        self.token_streams = [self.token_streams[i] for i in keep]
+        self.tokens = [self.tokens[i] for i in keep]
+        self.weights = self.weights[keep]
+        self.invalidate_indexes()
+
+    def invalidate_indexes(self):
+        # 语料变化后丢弃缓存的词元矩阵、MinHash签名与winnowing指纹
+        self._token_matrix = None
+        self._minhash = None
+        self._winnowing = None
 
     def tokenize_codes(self, codes):
-        lexer = PythonLexer()
-        return [set(token[1] for token in lex(code, lexer)) for code in codes]
+        return [set(value for _, value in stream) for stream in self.lex_codes(codes)]
+
+    def lex_codes(self, codes, languages=None):
+        # 词法分析得到有序词元流，先查缓存，未命中的代码在大批量时交给进程池处理
+        codes = list(codes)
+        languages = languages or ['python'] * len(codes)
+        with self.instrumentation.stage('code_lexing', items=len(codes), characters=sum(map(len, codes))) as record:
+            if self.cache is None:
+                return self.parallel_lex(codes, languages)
+            return self.lex_with_cache(codes, languages, record)
+
+    def lex_with_cache(self, codes, languages, record):
+        import pygments
+        keys = [self.cache.make_key('code-streams', content_hash(code), LEXERS[lang], pygments.__version__)
+                for code, lang in zip(codes, languages)]
+        found = self.cache.get_many(set(keys))
+        pending = {key: (code, lang) for key, code, lang in zip(keys, codes, languages) if key not in found}
+        record['cache_misses'] = len(pending)
+        streams = self.parallel_lex([code for code, _ in pending.values()], [lang for _, lang in pending.values()])
+        for key, stream in zip(pending, streams):
+            self.cache.set(key, stream)
+            found[key] = stream
+        return [found[key] for key in keys]
+
+    def parallel_lex(self, codes, languages):
+        # 代码总量较小时直接在当前进程中处理，避免进程池的启动开销
+        items = list(zip(codes, languages))
+        workers = max(1, min(self.workers, os.cpu_count() or 1))
+        if workers == 1 or sum(len(code) for code in codes) < PROCESS_LEX_MIN_CHARS:
+            return _map_chunks(_lex_chunk, _fixed_chunks(items), cancel_check=self.cancel_check)
+        chunks = balanced_chunks([len(code) for code in codes], workers * CHUNKS_PER_WORKER)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return _map_chunks(_lex_chunk, [items[start:stop] for start, stop in chunks], executor, self.cancel_check)
+
+    def build_token_matrix(self):
+        # 将各文档的词元集合转换为 (文档数 × 词元数) 的二值CSR矩阵，返回矩阵与词元列表；语料不变时复用上次结果
+        cached = getattr(self, '_token_matrix', None)
+        if cached is not None:
+            return cached
+        vocabulary = {}
+        indices = []
+        indptr = [0]
+        for token_set in self.tokens:
+            indices.extend(vocabulary.setdefault(token, len(vocabulary)) for token in token_set)
+            indptr.append(len(indices))
+        data = np.ones(len(indices), dtype=np.int32)
+        matrix = sparse.csr_matrix((data, np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+                                   shape=(len(self.tokens), len(vocabulary)))
+        matrix.sort_indices()
+        self._token_matrix = (matrix, list(vocabulary))
+        return self._token_matrix
+
+    def compute_minhash_signatures(self, num_perm=128, seed=1):
+        # 计算并缓存MinHash签名
+        cached = getattr(self, '_minhash', None)
+        if cached is None or cached[0] != (num_perm, seed):
+            engine = MinHashEngine(num_perm, seed)
+            matrix, vocabulary = self.build_token_matrix()
+            cached = ((num_perm, seed), engine.signatures(matrix, engine.hash_tokens(vocabulary)))
+            self._minhash = cached
+        return cached[1]
 
-    def calculate_jaccard_scores(self):
+    def calculate_jaccard_scores(self, method='sparse', num_perm=128, block_size=1024):
+        """
+        计算每份代码与其余所有代码的平均Jaccard相似度。
+        参数: method (str): 'sparse' 用稀疏矩阵乘积精确计算；'minhash' 用MinHash签名估计；
+              'winnowing' 用规范化词元流的winnowing指纹集合计算；'pairwise' 逐对计算集合交并。
+        返回: list: 每份代码的得分（0-100）。
+        """
+        with self.instrumentation.stage('jaccard', items=len(self.tokens), method=method):
+            return self.jaccard_scores_by(method, num_perm, block_size)
+
+    def jaccard_scores_by(self, method, num_perm, block_size):
+        if method == 'sparse':
+            return self.sparse_jaccard_scores(block_size)
+        if method == 'minhash':
+            return self.minhash_jaccard_scores(num_perm)
+        if method == 'winnowing':
+            return self.winnowing_scores()
+        if method != 'pairwise':
+            raise ValueError(f"Unknown Jaccard method: {method}")
+        num_docs = int(self.weights.sum())
         scores = []
         for i in range(len(self.tokens)):
-            score_list = []
+            total = 0
             for j in range(len(self.tokens)):
-                if i != j:
+                copies = self.weights[j] - (i == j)  # 与自身相同的其余副本也计入
+                if copies:
                     intersection = len(self.tokens[i].intersection(self.tokens[j]))
                     union = len(self.tokens[i].union(self.tokens[j]))
-                    score_list.append(intersection / union if union != 0 else 0)
-            scores.append(np.mean(score_list) * 100 if score_list else 0)
+                    total += copies * (intersection / union if union != 0 else 0)
+            scores.append(total / (num_docs - 1) * 100 if num_docs > 1 else 0)
         return scores
+
+    def sparse_jaccard_scores(self, block_size=1024):
+        # 交集大小由二值矩阵的分块乘积得到，只有交集非零的文档对才参与求和，相同提交按份数加权
+        num_docs = int(self.weights.sum())
+        if num_docs < 2:
+            return [0] * len(self.tokens)
+        matrix, _ = self.build_token_matrix()
+        sizes = np.diff(matrix.indptr)
+        totals = np.zeros(len(self.tokens))
+        for start in range(0, len(self.tokens), block_size):
+            stop = min(start + block_size, len(self.tokens))
+            intersections = (matrix[start:stop] @ matrix.T).tocoo()
+            rows = intersections.row + start
+            unions = sizes[rows] + sizes[intersections.col] - intersections.data
+            np.add.at(totals, rows, intersections.data / unions * self.weights[intersections.col])
+        totals -= sizes > 0  # 去掉与自身的相似度1
+        return list(totals / (num_docs - 1) * 100)
+
+    def minhash_jaccard_scores(self, num_perm=128):
+        # 对每个置换位统计相同签名值的文档（按份数）数，得到估计Jaccard之和，整体为O(n × num_perm)
+        num_docs = int(self.weights.sum())
+        if num_docs < 2:
+            return [0] * len(self.tokens)
+        signatures = self.compute_minhash_signatures(num_perm)
+        nonempty = np.array([len(token_set) > 0 for token_set in self.tokens])
+        weights = self.weights[nonempty]
+        totals = np.zeros(len(self.tokens))
+        for column in signatures[nonempty].T:
+            _, inverse = np.unique(column, return_inverse=True)
+            totals[nonempty] += np.bincount(inverse.ravel(), weights=weights)[inverse.ravel()] - 1
+        return list(totals / num_perm / (num_docs - 1) * 100)
+
+    def find_similar_pairs(self, num_perm=128, bands=32, rows=None, min_jaccard=0.0):
+        """
+        用MinHash LSH索引找出候选相似代码对，并用精确Jaccard相似度验证。
+        返回: list: (i, j, 估计Jaccard, 精确Jaccard) 列表，i < j，按精确Jaccard降序排列。
+        """
+        signatures = self.compute_minhash_signatures(num_perm)
+        nonempty = np.flatnonzero([len(token_set) > 0 for token_set in self.tokens])
+        index = MinHashLSHIndex(num_perm, bands, rows)
+        index.add(signatures[nonempty])
+        pairs = nonempty[index.candidate_pairs()]
+        if len(pairs) == 0:
+            return []
+        estimated = MinHashEngine.estimate_jaccard(signatures[pairs[:, 0]], signatures[pairs[:, 1]])
+        matrix, _ = self.build_token_matrix()
+        sizes = np.diff(matrix.indptr)
+        intersections = np.asarray(matrix[pairs[:, 0]].multiply(matrix[pairs[:, 1]]).sum(axis=1)).ravel()
+        exact = intersections / (sizes[pairs[:, 0]] + sizes[pairs[:, 1]] - intersections)
+        results = [(int(i), int(j), float(e), float(x)) for (i, j), e, x in zip(pairs, estimated, exact) if x >= min_jaccard]
+        return sorted(results, key=lambda item: item[3], reverse=True)
+
+    def top_k_similar(self, k=5, rows=None, block_size=1024):
+        """
+        找出每份代码Jaccard相似度最高的 k 份其他代码，交集大小由二值词元矩阵的分块乘积得到。
+        参数: k (int): 每份代码保留的相似代码数；rows (list): 只查询这些代码，默认查询全部；block_size (int): 分块大小。
+        返回: list: 每份被查询代码一个列表，元素为 (代码下标, Jaccard相似度)，按相似度降序排列。
+        """
+        matrix, _ = self.build_token_matrix()
+        num_docs = matrix.shape[0]
+        row_ids = np.arange(num_docs) if rows is None else np.asarray(rows, dtype=np.int64).reshape(-1)
+        sizes = np.diff(matrix.indptr)
+        results = []
+        for start in range(0, len(row_ids), block_size):
+            if self.cancel_check is not None:
+                self.cancel_check()
+            ids = row_ids[start:start + block_size]
+            intersections = (matrix[ids] @ matrix.T).tocsr()
+            for offset, i in enumerate(ids):
+                row = intersections[offset]
+                columns, shared = row.indices, row.data
+                similarity = shared / (sizes[i] + sizes[columns] - shared)
+                others = columns != i
+                columns, similarity = columns[others], similarity[others]
+                order = np.lexsort((columns, -similarity))[:k]
+                results.append([(int(columns[j]), float(similarity[j])) for j in order])
+        return results
+
+    def compute_winnowing_fingerprints(self, k=5, window=4):
+        # 计算并缓存每份代码的winnowing指纹
+        cached = getattr(self, '_winnowing', None)
+        if cached is None or cached[0] != (k, window):
+            engine = WinnowingEngine(k, window)
+            cached = ((k, window), [engine.fingerprint(normalize_token_stream(stream)) for stream in self.token_streams])
+            self._winnowing = cached
+        return cached[1]
+
+    def find_matching_programs(self, k=5, window=4, min_similarity=0.0, max_doc_frequency=None):
+        """
+        通过winnowing指纹倒排索引找出共享代码片段的程序对。
+        返回: list: (i, j, 共享指纹数, 指纹Jaccard相似度) 列表，i < j，按相似度降序排列。
+        """
+        fingerprints = self.compute_winnowing_fingerprints(k, window)
+        index = WinnowingIndex(fingerprints)
+        pairs_i, pairs_j, shared = index.matching_pairs(max_doc_frequency)
+        similarity = shared / (index.sizes[pairs_i] + index.sizes[pairs_j] - shared)
+        keep = similarity >= min_similarity
+        order = np.argsort(-similarity[keep], kind='stable')
+        return [(int(i), int(j), int(count), float(value)) for i, j, count, value in
+                zip(pairs_i[keep][order], pairs_j[keep][order], shared[keep][order], similarity[keep][order])]
+
+    def winnowing_scores(self, k=5, window=4):
+        # 每份代码与其余代码指纹Jaccard相似度的平均值，只累加共享指纹的文档对，相同提交按份数加权
+        num_docs = int(self.weights.sum())
+        if num_docs < 2:
+            return [0] * len(self.token_streams)
+        fingerprints = self.compute_winnowing_fingerprints(k, window)
+        # 相同提交的其余副本指纹完全相同，相似度为1
+        totals = (self.weights - 1) * np.array([len(prints) > 0 for prints in fingerprints], dtype=np.float64)
+        for i, j, _, similarity in self.find_matching_programs(k, window):
+            totals[i] += similarity * self.weights[j]
+            totals[j] += similarity * self.weights[i]
+        return list(totals / (num_docs - 1) * 100)
@@ -0,0 +1,309 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+from scipy import sparse
+
+from algorithm import PackedFingerprints, SimHashEngine, popcount64
+from dedup import normalize_code
+
+ARCHIVE_FORMAT = 1  # 归档格式版本，数组布局变化时递增
+META_FILE = 'meta.json'
+SEGMENT_ARRAYS = [
+    'text_names',  # 文本部分的文档名
+    'tfidf_indptr', 'tfidf_indices', 'tfidf_data',  # 单位化TF-IDF行的CSR数组，列为归档词表
+    'simhash',  # 打包的SimHash指纹，每行 ceil(hashbits / 64) 个uint64
+    'code_names',  # 代码部分的文档名（去重后文本与代码的行不一定对应）
+    'minhash',  # 代码词元集合的MinHash签名
+    'code_sizes',  # 代码词元集合的大小，0表示没有代码
+    'winnowing_indptr', 'winnowing',  # winnowing指纹，按CSR方式拼接
+]
+MINHASH_BLOCK_BYTES = 64 * 1024 * 1024  # 比较MinHash签名时每块临时布尔数组的上限
+
+
+def _merge_top_k(scores, indices, tile_scores, tile_indices, k):
+    # 把一块候选并入每行当前最好的 k 个
+    candidate_scores = np.hstack([scores, tile_scores])
+    candidate_indices = np.hstack([indices, tile_indices])
+    keep = np.argpartition(-candidate_scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(candidate_scores, keep, axis=1), np.take_along_axis(candidate_indices, keep, axis=1)
+
+
+def _code_sizes(code_calculator):
+    # 每份代码的词元集合大小；规范化后为空的代码（没有代码的报告）只有空白词元，记为0
+    return np.array([len(tokens) if normalize_code(code) else 0
+                     for tokens, code in zip(code_calculator.tokens, code_calculator.code_corpus)], dtype=np.int64)
+
+
+def _ranked(scores, indices):
+    # 每行按得分降序（相同时按下标升序）列出得分为正的候选
+    results = []
+    for row_scores, row_indices in zip(scores, indices):
+        order = np.lexsort((row_indices, -row_scores))
+        results.append([(int(row_indices[j]), float(row_scores[j])) for j in order if row_scores[j] > 0])
+    return results
+
+
+class ArchiveSegment:
+    """
+    归档中一次加入的一批文档。各数组保存为单独的 .npy 文件，第一次使用时才做内存映射，按需读取。
+    参数: path (str): 段目录；label (str): 本批的标签；text_count、code_count (int): 文本与代码部分的文档数（记录在 meta.json 中）。
+    """
+
+    def __init__(self, path, label=None, text_count=0, code_count=0):
+        self.path = path
+        self.label = label
+        self._text_count = text_count
+        self._code_count = code_count
+        self._arrays = None
+
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = {name: np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+                            for name in SEGMENT_ARRAYS}
+        return self._arrays
+
+    def text_count(self):
+        return self._text_count
+
+    def code_count(self):
+        return self._code_count
+
+    def display_name(self, name):
+        return f"{self.label}/{name}" if self.label else str(name)
+
+    def tfidf_rows(self, start, stop, num_features):
+        # 读取第 start 到 stop 行的TF-IDF矩阵，只有这些行的数据会被读入内存
+        indptr = np.asarray(self.arrays['tfidf_indptr'][start:stop + 1], dtype=np.int64)
+        indices = self.arrays['tfidf_indices'][indptr[0]:indptr[-1]]
+        data = self.arrays['tfidf_data'][indptr[0]:indptr[-1]]
+        return sparse.csr_matrix((data, indices, indptr - indptr[0]), shape=(stop - start, num_features))
+
+    def winnowing_fingerprints(self, i):
+        indptr = self.arrays['winnowing_indptr']
+        return np.asarray(self.arrays['winnowing'][indptr[i]:indptr[i + 1]])
+
+
+class ReferenceArchive:
+    """
+    往届提交的参考归档，用于把新一批作业与历年提交比较。
+    归档目录包含 meta.json、拟合好的词表（排序后的定长字符串数组）与IDF，以及若干个段（每次加入的一批文档）；
+    所有数组都以 np.load(mmap_mode='r') 按需映射，打开归档只读取 meta.json，与归档大小无关。
+    新文档用归档的词表与IDF向量化（词表之外的词语被忽略），再按块与各段比较，内存占用由块大小决定。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != ARCHIVE_FORMAT:
+            raise ValueError(f"Unsupported archive format: {self.meta.get('format')}")
+        self.vocabulary = np.load(os.path.join(path, 'vocabulary.npy'), mmap_mode='r')
+        self.idf = np.load(os.path.join(path, 'idf.npy'), mmap_mode='r')
+        self.segments = [ArchiveSegment(os.path.join(path, segment['name']), segment['label'],
+                                        segment['text_documents'], segment['code_documents'])
+                         for segment in self.meta['segments']]
+        self.update_offsets()
+
+    @staticmethod
+    def exists(path):
+        return os.path.isfile(os.path.join(path, META_FILE))
+
+    @classmethod
+    def create(cls, path, text_calculator, num_perm=128, seed=1, winnowing=(5, 4)):
+        """
+        新建空归档，词表与IDF取自 text_calculator 已拟合的向量器，之后加入和比较的文档都沿用它们。
+        参数: path (str): 归档目录；text_calculator (TextSimilarityCalculator): 已拟合的文本计算器；
+              num_perm、seed (int): 代码MinHash签名参数；winnowing (tuple): winnowing指纹的 (k, window)。
+        返回: ReferenceArchive: 打开的归档。
+        """
+        if cls.exists(path):
+            raise ValueError(f"Archive already exists: {path}")
+        os.makedirs(path, exist_ok=True)
+        vocabulary = np.asarray(text_calculator.vectorizer.get_feature_names_out(), dtype=str)
+        idf = np.asarray(text_calculator.vectorizer.idf_, dtype=np.float64)
+        order = np.argsort(vocabulary)  # 词表排序后可直接用二分查找，无需构造字典
+        np.save(os.path.join(path, 'vocabulary.npy'), vocabulary[order])
+        np.save(os.path.join(path, 'idf.npy'), idf[order])
+        meta = {
+            'format': ARCHIVE_FORMAT,
+            'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'hashbits': text_calculator.hashbits,
+            'simhash_method': text_calculator.simhash_method,
+            'num_perm': num_perm,
+            'seed': seed,
+            'winnowing': list(winnowing),
+            'segments': [],
+        }
+        cls.write_meta(path, meta)
+        return cls(path)
+
+    @staticmethod
+    def write_meta(path, meta):
+        # 先写临时文件再替换，中途失败不会留下损坏的 meta.json
+        temp_path = os.path.join(path, META_FILE + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=4)
+        os.replace(temp_path, os.path.join(path, META_FILE))
+
+    def update_offsets(self):
+        # 各段在全局下标中的起始位置，文本与代码分别编号
+        self.text_offsets = np.cumsum([0] + [segment.text_count() for segment in self.segments])
+        self.code_offsets = np.cumsum([0] + [segment.code_count() for segment in self.segments])
+
+    def __len__(self):
+        return int(self.text_offsets[-1])
+
+    def append(self, text_names, text_calculator, code_names, code_calculator, label=None):
+        """
+        把一批文档作为新的段加入归档，已有的段不会被改写。
+        参数: text_names (list): 与 text_calculator 各行对应的文档名；code_names (list): 与 code_calculator 各行对应的文档名；
+              label (str): 本批的标签（如学期），比较结果中以 "标签/文档名" 表示归档文档。
+        """
+        self.check_compatible(text_calculator)
+        if len(text_names) != len(text_calculator.text_corpus) or len(code_names) != len(code_calculator.tokens):
+            raise ValueError("Document names do not match the calculator rows.")
+        matrix = self.transform(text_calculator)
+        fingerprints = code_calculator.compute_winnowing_fingerprints(*self.meta['winnowing'])
+        arrays = {
+            'text_names': np.asarray(text_names, dtype=str),
+            'tfidf_indptr': matrix.indptr.astype(np.int64),
+            'tfidf_indices': matrix.indices.astype(np.int32),
+            'tfidf_data': matrix.data.astype(np.float32),  # 单精度足够比较，归档大小减半
+            'simhash': self.fingerprints(matrix).words,
+            'code_names': np.asarray(code_names, dtype=str),
+            'minhash': code_calculator.compute_minhash_signatures(self.meta['num_perm'], self.meta['seed']),
+            'code_sizes': _code_sizes(code_calculator),
+            'winnowing_indptr': np.concatenate([[0], np.cumsum([len(f) for f in fingerprints])]).astype(np.int64),
+            'winnowing': np.concatenate(fingerprints).astype(np.uint64) if fingerprints else np.empty(0, np.uint64),
+        }
+        name = f"segment_{len(self.segments):04d}"
+        temp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.path)
+        try:
+            for key, value in arrays.items():
+                np.save(os.path.join(temp_dir, key + '.npy'), value)
+            os.replace(temp_dir, os.path.join(self.path, name))
+        except OSError:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+        self.meta['segments'].append({'name': name, 'label': label, 'text_documents': len(text_names),
+                                      'code_documents': len(code_names),
+                                      'added_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+        self.write_meta(self.path, self.meta)
+        self.segments.append(ArchiveSegment(os.path.join(self.path, name), label, len(text_names), len(code_names)))
+        self.update_offsets()
+
+    def check_compatible(self, text_calculator):
+        if (text_calculator.hashbits, text_calculator.simhash_method) != (self.meta['hashbits'], self.meta['simhash_method']):
+            raise ValueError("SimHash settings do not match the archive.")
+
+    def transform(self, text_calculator):
+        """
+        用归档的词表与IDF把计算器中已分词的文档转换为单位化的TF-IDF行，结果与 TfidfVectorizer.transform 相同。
+        返回: scipy.sparse.csr_matrix: (文档数 × 归档词表大小)。
+        """
+        from sklearn.preprocessing import normalize
+        indptr, indices, counts = [0], [], []
+        for tokens in text_calculator.text_corpus:
+            features, feature_counts = np.unique(np.asarray(text_calculator.analyzer(tokens), dtype=str),
+                                                 return_counts=True)
+            if len(self.vocabulary) and len(features):
+                positions = np.minimum(np.searchsorted(self.vocabulary, features), len(self.vocabulary) - 1)
+                known = self.vocabulary[positions] == features
+                indices.extend(positions[known].tolist())
+                counts.extend(feature_counts[known].tolist())
+            indptr.append(len(indices))
+        indices = np.array(indices, dtype=np.int64)
+        data = np.array(counts, dtype=np.float64) * self.idf[indices]
+        matrix = sparse.csr_matrix((data, indices, np.array(indptr, dtype=np.int64)),
+                                   shape=(len(indptr) - 1, len(self.vocabulary)))
+        matrix = normalize(matrix, norm='l2').tocsr()
+        matrix.sort_indices()
+        return matrix
+
+    def fingerprints(self, matrix):
+        # 只对这批文档用到的词语计算SimHash位，指纹与在整个词表上计算的结果相同
+        used = np.unique(matrix.indices)
+        engine = SimHashEngine(self.vocabulary[used], self.meta['hashbits'], self.meta['simhash_method'])
+        return PackedFingerprints.from_bits(engine.fingerprint_bits(matrix[:, used]))
+
+    def locate(self, index, offsets):
+        # 全局下标 -> (段, 段内下标)
+        segment = int(np.searchsorted(offsets, index, side='right')) - 1
+        return self.segments[segment], int(index - offsets[segment])
+
+    def top_k_text(self, text_calculator, k=3, block_size=4096):
+        """
+        找出每个新文档在归档中余弦相似度最高的 k 个文档，按 block_size 行一块读取归档。
+        返回: list: 每个新文档一个列表，元素为 (归档文档名, 余弦相似度, 汉明距离)，按相似度降序排列。
+        """
+        self.check_compatible(text_calculator)
+        batch = self.transform(text_calculator)
+        k = min(k, len(self))
+        if k <= 0 or batch.shape[0] == 0:
+            return [[] for _ in range(batch.shape[0])]
+        best_scores = np.full((batch.shape[0], k), -np.inf)
+        best_indices = np.full((batch.shape[0], k), -1, dtype=np.int64)
+        for segment, offset in zip(self.segments, self.text_offsets):
+            for start in range(0, segment.text_count(), block_size):
+                stop = min(start + block_size, segment.text_count())
+                tile = (batch @ segment.tfidf_rows(start, stop, len(self.vocabulary)).T).toarray()
+                tile_indices = np.broadcast_to(np.arange(offset + start, offset + stop), tile.shape)
+                best_scores, best_indices = _merge_top_k(best_scores, best_indices, tile, tile_indices, k)
+
+        words = self.fingerprints(batch).words
+        results = []
+        for i, matches in enumerate(_ranked(best_scores, best_indices)):
+            row = []
+            for index, cosine in matches:
+                segment, local = self.locate(index, self.text_offsets)
+                hamming = int(popcount64(words[i] ^ segment.arrays['simhash'][local]).sum())
+                row.append((segment.display_name(segment.arrays['text_names'][local]), cosine, hamming))
+            results.append(row)
+        return results
+
+    def top_k_code(self, code_calculator, k=3, candidates=None):
+        """
+        找出每份新代码在归档中最相似的 k 份代码。先按MinHash估计的词元集合Jaccard相似度取 candidates 份候选
+        （只读取签名），再读取候选的winnowing指纹，按指纹相似度排序；标识符改名后的抄袭也能排在前面。
+        参数: k (int): 每份代码保留的数量；candidates (int): 候选数，默认为 10 * k。
+        返回: list: 每份新代码一个列表，元素为 (归档文档名, winnowing指纹相似度, 共享指纹数, 估计Jaccard)，
+              按指纹相似度降序排列。
+        """
+        num_perm, seed = self.meta['num_perm'], self.meta['seed']
+        signatures = code_calculator.compute_minhash_signatures(num_perm, seed)
+        empty = _code_sizes(code_calculator) == 0
+        pool = min(candidates or 10 * k, int(self.code_offsets[-1]))
+        if k <= 0 or pool <= 0 or len(signatures) == 0:
+            return [[] for _ in range(len(signatures))]
+        best_scores = np.full((len(signatures), pool), -np.inf)
+        best_indices = np.full((len(signatures), pool), -1, dtype=np.int64)
+        block_size = max(1, MINHASH_BLOCK_BYTES // (len(signatures) * num_perm))
+        for segment, offset in zip(self.segments, self.code_offsets):
+            for start in range(0, segment.code_count(), block_size):
+                stop = min(start + block_size, segment.code_count())
+                archived = np.asarray(segment.arrays['minhash'][start:stop])
+                tile = np.count_nonzero(signatures[:, None, :] == archived[None, :, :], axis=2) / num_perm
+                tile[empty] = 0  # 没有代码的文档不参与比较
+                tile[:, np.asarray(segment.arrays['code_sizes'][start:stop]) == 0] = 0
+                tile_indices = np.broadcast_to(np.arange(offset + start, offset + stop), tile.shape)
+                best_scores, best_indices = _merge_top_k(best_scores, best_indices, tile, tile_indices, pool)
+
+        fingerprints = code_calculator.compute_winnowing_fingerprints(*self.meta['winnowing'])
+        results = []
+        for i, matches in enumerate(_ranked(best_scores, best_indices)):
+            row = []
+            for index, estimated in matches:
+                segment, local = self.locate(index, self.code_offsets)
+                archived = segment.winnowing_fingerprints(local)
+                shared = len(np.intersect1d(fingerprints[i], archived, assume_unique=True))
+                union = len(fingerprints[i]) + len(archived) - shared
+                row.append((segment.display_name(segment.arrays['code_names'][local]),
+                            shared / union if union else 0.0, shared, estimated))
+            row.sort(key=lambda match: (-match[1], -match[3]))  # 稳定排序，完全相同时保持候选顺序
+            results.append(row[:k])
+        return results
@@ -0,0 +1,326 @@
+"""
+无界面的性能基准测试。
+用合成语料（带有计划抄袭的中文实验报告与代码）在不同文档数和文档长度下分别测量各阶段耗时：
+文档读取、模板去除、分词、TF-IDF、SimHash、文本评分、代码词法分析与Jaccard评分，
+并检查计划的抄袭对是否仍能被检出。结果写入JSON文件，可与上一次的结果比较以发现性能回退。
+用法: python benchmark.py [--sizes 50,200,800] [--lengths 20,80] [--baseline 上次结果.json] [--output 结果.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from instrumentation import Instrumentation
+from load import WordProcessor
+
+# 报告的阶段，名称与 Instrumentation 的记录相同。ingestion 是读取整个文件夹的墙钟时间（含模板去除），
+# template_strip 是各文档模板去除耗时之和（并行读取时为各工作进程之和）
+STAGES = ['ingestion', 'template_strip', 'tokenization', 'tfidf', 'simhash', 'text_scoring', 'code_lexing', 'jaccard']
+
+NOUNS = ['算法', '数据', '结构', '链表', '二叉树', '哈希表', '排序', '查找', '图', '队列', '栈', '矩阵', '模型', '系统',
+         '接口', '模块', '内存', '缓存', '线程', '进程', '网络', '数据库', '索引', '函数', '变量', '指针', '数组', '字符串']
+VERBS = ['实现', '分析', '设计', '测试', '优化', '比较', '验证', '计算', '统计', '构建', '改进', '调试']
+ADJECTIVES = ['高效', '稳定', '简单', '复杂', '动态', '静态', '递归', '并行', '完整', '合理']
+SENTENCE_PATTERNS = [
+    '本实验{v}了{a}的{n}，并对{n}进行了{v}。',
+    '在{n}部分，我们首先{v}{n}，然后使用{a}的{n}完成{n}的{v}。',
+    '通过{v}{n}与{n}，可以发现{a}的{n}在{n}方面表现更好。',
+    '实验结果表明，{a}的{n}能够有效{v}{n}的性能。',
+    '针对{n}中出现的问题，我们{v}了{n}，使{n}更加{a}。',
+    '最后对{n}和{n}进行了{v}，得到了{a}的结果。',
+]
+SYNONYMS = {'实现': '完成', '分析': '研究', '设计': '规划', '测试': '检验', '优化': '改善', '比较': '对比',
+            '高效': '快速', '稳定': '可靠', '简单': '简洁', '完整': '全面', '结果': '结论', '问题': '难点',
+            '表明': '说明', '首先': '先', '最后': '最终', '能够': '可以', '有效': '显著'}
+TEMPLATE_PARAGRAPHS = ['实验报告模板：请在下方填写实验目的、实验步骤以及实验结果分析。',
+                       '一、实验目的：掌握常用数据结构与算法的实现方法。',
+                       '二、实验要求：独立完成，禁止抄袭，代码需附在报告末尾。']
+CODE_TEMPLATES = [
+    'def {f}({a}, {b}):\n    {c} = {a} + {b}\n    return {c} * {n}\n',
+    'def {f}({a}):\n    {c} = []\n    for {i} in range({a}):\n        if {i} % {n} == 0:\n            {c}.append({i})\n    return {c}\n',
+    'class {C}:\n    def __init__(self, {a}):\n        self.{a} = {a}\n\n    def {f}(self, {b}):\n        return self.{a} * {b} + {n}\n',
+    'def {f}({a}, {b}):\n    while {a} < {b}:\n        {a} += {n}\n    return {a}\n',
+    'def {f}({a}):\n    {c} = {{}}\n    for {i} in {a}:\n        {c}[{i}] = {c}.get({i}, 0) + 1\n    return {c}\n',
+    'def {f}({a}, {b}):\n    if not {a}:\n        return {b}\n    {c} = {a}[0]\n    return {f}({a}[1:], {b} + {c})\n',
+]
+IDENTIFIER_FIELDS = ['f', 'a', 'b', 'c', 'i', 'C']
+EXTRA_STATEMENTS = ['    {c} = {a} - {n}\n', '    print({a})\n', '    {b} = [{a}] * {n}\n',
+                    '    if {a} is None:\n        raise ValueError({n})\n', '    {i} = len(str({a})) // {n}\n',
+                    '    for {i} in range({n}):\n        pass\n', '    assert {a} != {n}\n']
+
+
+class CorpusGenerator:
+    """
+    合成语料生成器。每份作业由若干中文句子和若干段Python函数组成；
+    按 plagiarism_rate 的比例生成抄袭副本：文本做同义词替换、句子重排和部分改写，代码做标识符重命名。
+    """
+
+    def __init__(self, seed=0, plagiarism_rate=0.2, paraphrase_rate=0.3, rename_identifiers=True):
+        self.random = random.Random(seed)
+        self.plagiarism_rate = plagiarism_rate  # 抄袭副本在语料中的比例
+        self.paraphrase_rate = paraphrase_rate  # 抄袭副本中被改写的句子比例
+        self.rename_identifiers = rename_identifiers
+
+    def sentence(self):
+        pattern = self.random.choice(SENTENCE_PATTERNS)
+        return re.sub(r'\{(\w)\}', lambda m: self.random.choice(
+            {'n': NOUNS, 'v': VERBS, 'a': ADJECTIVES}[m.group(1)]), pattern)
+
+    def report(self, sentences):
+        return [self.sentence() for _ in range(sentences)]
+
+    def identifier(self, capitalize=False):
+        name = ''.join(self.random.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(self.random.randint(4, 9)))
+        return name.capitalize() if capitalize else name
+
+    def program(self, functions):
+        # 返回代码文本及其中使用的标识符，便于生成抄袭副本时重命名
+        parts, identifiers = [], []
+        for _ in range(functions):
+            names = {field: self.identifier(field == 'C') for field in IDENTIFIER_FIELDS}
+            names['n'] = self.random.randint(2, 99)
+            header, body = self.random.choice(CODE_TEMPLATES).format(**names).split('\n', 1)
+            # 在函数开头随机插入几条语句，使不同作业的代码结构各不相同
+            extra = ''.join(self.random.choice(EXTRA_STATEMENTS).format(**names)
+                            for _ in range(self.random.randint(0, 3)))
+            parts.append(header + '\n' + extra + body)
+            identifiers.extend(names[field] for field in IDENTIFIER_FIELDS)
+        return '\n'.join(parts), identifiers
+
+    def paraphrase(self, sentences):
+        # 同义词替换、相邻句子交换，并把一部分句子换成新写的句子
+        result = []
+        for sentence in sentences:
+            if self.random.random() < self.paraphrase_rate:
+                sentence = self.sentence()
+            else:
+                for word, synonym in SYNONYMS.items():
+                    if word in sentence and self.random.random() < 0.5:
+                        sentence = sentence.replace(word, synonym)
+            result.append(sentence)
+        for i in range(0, len(result) - 1, 2):
+            if self.random.random() < 0.3:
+                result[i], result[i + 1] = result[i + 1], result[i]
+        return result
+
+    def rename(self, code, identifiers):
+        if not self.rename_identifiers:
+            return code
+        mapping = {name: self.identifier(name[:1].isupper()) for name in set(identifiers)}
+        return re.sub(r'\b[A-Za-z_]\w*\b', lambda m: mapping.get(m.group(0), m.group(0)), code)
+
+    def generate(self, num_docs, sentences, functions=6):
+        """
+        生成语料。
+        参数: num_docs (int): 文档数；sentences (int): 每份报告的句子数；functions (int): 每份代码的函数数。
+        返回: tuple (list, list): 文档列表 [(名称, 句子列表, 代码)]，以及计划的抄袭对 [(原文下标, 副本下标)]。
+        """
+        num_copies = int(num_docs * self.plagiarism_rate)
+        documents, sources = [], []
+        for i in range(num_docs - num_copies):
+            code, identifiers = self.program(functions)
+            documents.append((f'student{i:04d}', self.report(sentences), code))
+            sources.append(identifiers)
+        planted = []
+        for _ in range(num_copies):
+            source = self.random.randrange(len(sources))
+            _, text, code = documents[source]
+            planted.append((source, len(documents)))
+            documents.append((f'student{len(documents):04d}', self.paraphrase(text), self.rename(code, sources[source])))
+        return documents, planted
+
+
+def write_docx_corpus(documents, folder):
+    # 把合成语料写成DOCX文件（模板段落 + 报告正文 + 代码），返回模板文件路径
+    from docx import Document
+    os.makedirs(folder, exist_ok=True)
+    template = Document()
+    for paragraph in TEMPLATE_PARAGRAPHS:
+        template.add_paragraph(paragraph)
+    template_path = os.path.join(folder, 'template.docx')
+    template.save(template_path)
+    corpus_folder = os.path.join(folder, 'submissions')
+    os.makedirs(corpus_folder, exist_ok=True)
+    for name, sentences, code in documents:
+        document = Document()
+        for paragraph in TEMPLATE_PARAGRAPHS:
+            document.add_paragraph(paragraph)
+        for sentence in sentences:
+            document.add_paragraph(sentence)
+        for line in code.split('\n'):
+            document.add_paragraph(line)
+        document.save(os.path.join(corpus_folder, f'{name}.docx'))
+    return template_path, corpus_folder
+
+
+def plagiarism_families(planted, num_docs):
+    # 原文与它的所有抄袭副本属于同一族，副本的最佳匹配是同族的任一文档即算检出
+    family = list(range(num_docs))
+    for source, copy in planted:
+        family[copy] = family[source]
+    return family
+
+
+def top1_recall(planted, neighbours):
+    # 抄袭副本的最相似文档与其属于同一抄袭族的比例
+    if not planted:
+        return 1.0
+    family = plagiarism_families(planted, len(neighbours))
+    hits = sum(1 for _, copy in planted if neighbours[copy] and family[neighbours[copy][0][0]] == family[copy])
+    return hits / len(planted)
+
+
+def winnowing_recall(planted, matches, num_docs):
+    # 按winnowing指纹相似度，副本的最佳匹配与其属于同一抄袭族的比例
+    best = [(-1.0, -1)] * num_docs
+    for i, j, _, similarity in matches:
+        best[i] = max(best[i], (similarity, j))
+        best[j] = max(best[j], (similarity, i))
+    if not planted:
+        return 1.0
+    family = plagiarism_families(planted, num_docs)
+    return sum(1 for _, copy in planted if best[copy][1] >= 0 and family[best[copy][1]] == family[copy]) / len(planted)
+
+
+def run_configuration(num_docs, sentences, workers, seed, work_dir):
+    """
+    对一种语料规模运行全部阶段。各阶段按实际检测流程各运行一次（文档读取使用 workers 个进程），
+    耗时取自流水线本身的 Instrumentation 记录。
+    返回: dict: 阶段耗时（秒）、文档规模与检出质量。
+    """
+    from algorithm import TextSimilarityCalculator, CodeSimilarityCalculator
+
+    documents, planted = CorpusGenerator(seed).generate(num_docs, sentences)
+    folder = os.path.join(work_dir, f'{num_docs}x{sentences}')
+    template_path, corpus_folder = write_docx_corpus(documents, folder)
+    instrumentation = Instrumentation()
+
+    processor = WordProcessor(extractor='stream', instrumentation=instrumentation)
+    processor.set_template(processor.read_docx(template_path))
+    processor.process_folder(corpus_folder, workers=workers)
+    texts = [processor.documents[name]['自然语言内容'] for name, _, _ in documents]
+    codes = [processor.documents[name]['代码内容'] for name, _, _ in documents]
+
+    # 构造计算器时即完成分词、TF-IDF、SimHash与词法分析，各阶段由计算器自己记录
+    text_calculator = TextSimilarityCalculator(texts, workers=workers, instrumentation=instrumentation)
+    text_calculator.calculate_scores()
+    code_calculator = CodeSimilarityCalculator(codes, workers=workers, instrumentation=instrumentation)
+    code_calculator.calculate_jaccard_scores()
+    timings = instrumentation.summary()
+
+    quality = {
+        'planted_pairs': len(planted),
+        'text_top1_recall': top1_recall(planted, text_calculator.top_k_similar(1)),
+        'code_jaccard_top1_recall': top1_recall(planted, code_calculator.top_k_similar(1)),
+        'code_winnowing_recall': winnowing_recall(planted, code_calculator.find_matching_programs(), num_docs),
+    }
+    shutil.rmtree(folder, ignore_errors=True)
+    return {
+        'documents': num_docs,
+        'sentences': sentences,
+        'characters': sum(len(text) + len(code) for text, code in zip(texts, codes)),
+        'stages': {stage: timings[stage]['wall_seconds'] if stage in timings else 0.0 for stage in STAGES},
+        'quality': quality,
+    }
+
+
+def check_regressions(results, baseline, tolerance, min_seconds, min_recall):
+    """
+    与基线结果比较：阶段耗时超过 基线 × tolerance 且超过 min_seconds 视为回退；
+    文本与代码（winnowing）的检出率低于 min_recall 视为质量回退。
+    返回: list of str: 发现的问题。
+    """
+    problems = []
+    previous = {(item['documents'], item['sentences']): item for item in (baseline or {}).get('configurations', [])}
+    for item in results:
+        key = (item['documents'], item['sentences'])
+        label = f"{key[0]} docs x {key[1]} sentences"
+        for metric in ('text_top1_recall', 'code_winnowing_recall'):
+            if item['quality'][metric] < min_recall:
+                problems.append(f"{label}: {metric} {item['quality'][metric]:.2f} < {min_recall:.2f}")
+        if key not in previous:
+            continue
+        for stage, seconds in item['stages'].items():
+            limit = previous[key]['stages'].get(stage, 0.0) * tolerance
+            if seconds > limit and seconds > min_seconds:
+                problems.append(f"{label}: {stage} took {seconds:.3f}s, baseline limit {limit:.3f}s")
+    return problems
+
+
+def parse_sizes(value):
+    return [int(part) for part in value.split(',') if part.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='查重系统性能基准测试')
+    parser.add_argument('--sizes', type=parse_sizes, default=[50, 200, 800], help='文档数，逗号分隔')
+    parser.add_argument('--lengths', type=parse_sizes, default=[20, 80], help='每份报告的句子数，逗号分隔')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='分词与词法分析进程数')
+    parser.add_argument('--seed', type=int, default=0, help='语料随机种子')
+    parser.add_argument('--output', default='benchmark_results.json', help='结果JSON文件')
+    parser.add_argument('--baseline', help='用于比较的上一次结果JSON文件')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='允许的耗时增长倍数')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='低于该耗时的阶段不判定回退')
+    parser.add_argument('--min-recall', type=float, default=0.9, help='计划抄袭对的最低检出率')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    import jieba
+    jieba.setLogLevel(logging.WARNING)
+    start = time.perf_counter()
+    jieba.initialize()  # 词典加载单独计时，不计入分词阶段
+    jieba_init = time.perf_counter() - start
+    from algorithm import load_lexers
+    start = time.perf_counter()
+    load_lexers()  # pygments 导入与词法分析器创建同样单独计时，否则只计入第一个配置的 code_lexing 阶段
+    lexer_init = time.perf_counter() - start
+
+    work_dir = tempfile.mkdtemp(prefix='plagiarism-benchmark-')
+    configurations = []
+    try:
+        for num_docs in args.sizes:
+            for sentences in args.lengths:
+                result = run_configuration(num_docs, sentences, args.workers, args.seed, work_dir)
+                configurations.append(result)
+                stages = ', '.join(f"{stage} {seconds:.3f}s" for stage, seconds in result['stages'].items())
+                print(f"{num_docs} docs x {sentences} sentences: {stages}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    problems = check_regressions(configurations, baseline, args.tolerance, args.min_seconds, args.min_recall)
+    report = {
+        'environment': {'python': sys.version.split()[0], 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count(), 'numpy': np.__version__, 'workers': args.workers},
+        'jieba_init_seconds': jieba_init,
+        'lexer_init_seconds': lexer_init,
+        'thresholds': {'tolerance': args.tolerance, 'min_seconds': args.min_seconds, 'min_recall': args.min_recall,
+                       'baseline': args.baseline},
+        'configurations': configurations,
+        'problems': problems,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    for problem in problems:
+        print(f"REGRESSION: {problem}", file=sys.stderr)
+    print(f"结果已保存到 {args.output}")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
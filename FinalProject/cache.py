@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+CACHE_VERSION = 1  # 缓存格式版本，修改提取/分词逻辑后递增以使旧缓存失效
+
+
+def content_hash(data):
+    # 计算内容的SHA-256摘要，字符串按UTF-8编码
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    # 分块读取文件并计算SHA-256摘要
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentCache:
+    """
+    以内容哈希为键的磁盘缓存，用于保存文档提取结果、分词结果和代码词元等中间结果。
+    每个条目是缓存目录下的一个pickle文件，读取时更新修改时间；
+    总大小超过 max_bytes 时按最近使用时间淘汰最旧的条目。
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # 当前缓存总大小，首次写入时扫描得到
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, namespace, *parts):
+        """
+        由命名空间和若干组成部分（内容哈希、模板哈希、参数等）生成缓存键。
+        参数: namespace (str): 缓存类别，如 'document'、'tokens'；parts: 影响结果的所有输入。
+        返回: str: 缓存键。
+        """
+        digest = hashlib.sha256(f'{CACHE_VERSION}\0{namespace}'.encode('utf-8'))
+        for part in parts:
+            digest.update(b'\0')
+            digest.update(part if isinstance(part, bytes) else repr(part).encode('utf-8'))
+        return digest.hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.pkl')
+
+    def get(self, key, default=None):
+        path = self.path_for(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return default
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            logging.warning(f"Discarding unreadable cache entry {path}: {e}")
+            self.misses += 1
+            return default
+        try:
+            os.utime(path)  # 记录最近使用时间，供淘汰时参考
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            old_size = os.path.getsize(path)  # 覆盖已有条目时，先从总大小中减去旧文件
+        except OSError:
+            old_size = 0
+        try:
+            # 先写临时文件再原子替换，避免并发读取到不完整的条目
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning(f"Failed to write cache entry {path}: {e}")
+            return
+        if self._size is None:
+            self._size = self.total_size()
+        else:
+            self._size += os.path.getsize(path) - old_size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def get_many(self, keys):
+        # 批量读取，返回 {键: 值}，只包含命中的条目
+        found = {}
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def iter_entries(self):
+        # 遍历所有缓存条目，生成 (最近使用时间, 大小, 路径)
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.pkl'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def total_size(self):
+        return sum(size for _, size, _ in self.iter_entries())
+
+    def evict(self, target_ratio=0.8):
+        # 按最近使用时间从旧到新删除条目，直到总大小降到上限的 target_ratio 以下
+        entries = sorted(self.iter_entries())
+        size = sum(entry[1] for entry in entries)
+        target = self.max_bytes * target_ratio
+        removed = 0
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            removed += 1
+        self._size = size
+        logging.info(f"Evicted {removed} cache entries, cache size is now {size} bytes.")
+
+    def clear(self):
+        for _, _, path in list(self.iter_entries()):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._size = 0
+
+
+_MISSING = object()
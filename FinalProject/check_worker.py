@@ -0,0 +1,110 @@
+import logging
+import traceback
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from pipeline import (build_results, find_duplicates, load_documents, locate_passages, make_code_calculator,
+                      make_text_calculator, similar_pairs)
+
+
+class CheckCancelled(Exception):
+    pass
+
+
+def partial_records(names, text_scores=None):
+    # 得分尚未全部算出时的临时结果，缺少的得分为None
+    records = []
+    for i, name in enumerate(names):
+        records.append({
+            'Document Name': name,
+            'Text Score': float(text_scores[i]) if text_scores is not None else None,
+            'Code Score': None,
+            'Average Score': None,
+            'Equivalent Score': None,
+            'Timestamp': None
+        })
+    return records
+
+
+class CheckWorker(QThread):
+    """
+    在后台线程中运行完整查重流程，避免界面卡顿。
+    各阶段通过 progress 信号报告进度。每读完一个文件通过 document_read 发送该文档的一行（尚无得分），
+    每完成一个计算阶段通过 partial_results 发送全部文档已有的得分，由表格按文档名合并。
+    调用 requestInterruption() 取消：文档读取阶段在每个文件之后检查，计算阶段在阶段之间检查。
+    """
+
+    STAGES = ['读取文档', '文本相似度', '代码相似度']
+
+    progress = pyqtSignal(str, int, int)  # 阶段名, 已完成数, 总数
+    document_read = pyqtSignal(list)  # 刚读完的文档对应的行
+    partial_results = pyqtSignal(list)
+    results_ready = pyqtSignal(list)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, template_path, folder_path, workers=1, cache=None, extractor='stream', evidence_k=3, parent=None):
+        super().__init__(parent)
+        self.template_path = template_path
+        self.folder_path = folder_path
+        self.workers = workers
+        self.cache = cache
+        self.extractor = extractor
+        self.evidence_k = evidence_k  # 每个文档记录的最相似文档数，保存到历史记录中
+        self.processor = None
+        self.pairs = []
+
+    def check_cancelled(self):
+        if self.isInterruptionRequested():
+            raise CheckCancelled()
+
+    def report_file(self, done, total, name):
+        self.progress.emit(self.STAGES[0], done, total)
+        self.document_read.emit(partial_records([name]))
+        self.check_cancelled()
+
+    def run(self):
+        try:
+            self.run_stages()
+        except CheckCancelled:
+            logging.info("Plagiarism check cancelled.")
+            self.cancelled.emit()
+        except Exception as e:
+            logging.error(f"Plagiarism check failed: {traceback.format_exc()}")
+            self.failed.emit(str(e))
+
+    def run_stages(self):
+        self.progress.emit(self.STAGES[0], 0, 0)
+        self.processor = load_documents(self.template_path, self.folder_path, workers=self.workers, cache=self.cache,
+                                        extractor=self.extractor, progress=self.report_file)
+        names = list(self.processor.documents.keys())
+        if not names:
+            self.results_ready.emit([])
+            return
+        self.check_cancelled()
+
+        document_texts = [self.processor.documents[name]['自然语言内容'] for name in names]
+        code_texts = [self.processor.documents[name]['代码内容'] for name in names]
+        failed = [i for i, name in enumerate(names) if name in self.processor.errors]
+        text_clusters, code_clusters = find_duplicates(document_texts, code_texts, failed=failed)  # 相同的提交只计算一次
+        self.pairs = text_clusters.duplicate_pairs(names, 'text') + code_clusters.duplicate_pairs(names, 'code')
+
+        self.progress.emit(self.STAGES[1], 0, 1)
+        text_calculator = make_text_calculator(document_texts, cache=self.cache, clusters=text_clusters,
+                                               cancel_check=self.check_cancelled)
+        text_scores = text_clusters.expand(text_calculator.calculate_scores())
+        self.progress.emit(self.STAGES[1], 1, 1)
+        self.partial_results.emit(partial_records(names, text_scores))
+        self.check_cancelled()
+
+        self.progress.emit(self.STAGES[2], 0, 1)
+        code_calculator = make_code_calculator(code_texts, cache=self.cache, clusters=code_clusters,
+                                               cancel_check=self.check_cancelled)
+        code_scores = code_clusters.expand(code_calculator.calculate_jaccard_scores())
+        if self.evidence_k:
+            evidence = similar_pairs(names, text_calculator, code_calculator, self.evidence_k, text_clusters,
+                                     code_clusters, failed)
+            self.check_cancelled()
+            self.pairs += locate_passages(names, document_texts, evidence)
+        self.progress.emit(self.STAGES[2], 1, 1)
+        self.results_ready.emit(build_results(names, text_scores, code_scores))
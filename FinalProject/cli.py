@@ -0,0 +1,141 @@
+"""
+命令行批量查重入口，不依赖图形界面，适合在服务器上定时运行。
+结果保存到 history/history.sqlite3 历史记录库，也可另外导出为JSON或CSV文件。
+可用 --archive 与往届提交的参考归档比较，--archive-add 把本批文档加入归档。
+用法: python cli.py --template 模板.docx --folder 作业文件夹 [--output 结果.json|结果.csv]
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+
+from dedup import describe_duplicates
+from pipeline import RESULT_FIELDS, run_check
+
+
+def write_json(results, file_path):
+    with open(file_path, 'w', encoding='utf-8') as jsonfile:
+        json.dump(results, jsonfile, ensure_ascii=False, indent=4)
+
+
+def write_csv(results, file_path):
+    # 使用带BOM的UTF-8，便于Excel直接打开中文文件名
+    with open(file_path, 'w', encoding='utf-8-sig', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+WRITERS = {'json': write_json, 'csv': write_csv}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='作业查重（命令行模式）')
+    parser.add_argument('--template', required=True, help='模板DOCX文件路径')
+    parser.add_argument('--folder', required=True, help='作业文件夹路径')
+    parser.add_argument('--output', help='另外导出结果的文件路径（.json 或 .csv）')
+    parser.add_argument('--format', choices=sorted(WRITERS), help='输出格式，默认由输出文件扩展名决定')
+    parser.add_argument('--history-dir', default=os.path.join(os.getcwd(), 'history'), help='历史记录库所在目录')
+    parser.add_argument('--no-history', action='store_true', help='不写入历史记录库')
+    parser.add_argument('--label', help='本次检测的备注，如课程与作业名')
+    parser.add_argument('--evidence-k', type=int, default=3, help='每个文档在历史记录中保存的最相似文档数')
+    parser.add_argument('--archive', help='往届提交的参考归档目录，与其中的文档比较')
+    parser.add_argument('--archive-add', action='store_true',
+                        help='检测后把本批文档加入参考归档（标签为 --label 或作业文件夹名），归档不存在时新建')
+    parser.add_argument('--archive-k', type=int, default=3, help='每个文档保存的最相似往届文档数')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='文档读取进程数')
+    parser.add_argument('--cache-dir', default=os.path.join(os.getcwd(), 'cache'), help='缓存目录')
+    parser.add_argument('--no-cache', action='store_true', help='不使用磁盘缓存')
+    parser.add_argument('--extractor', choices=['stream', 'python-docx'], default='stream', help='DOCX文本提取方式')
+    parser.add_argument('--metrics', help='把各阶段耗时、CPU时间与处理数量连同结果写入该JSON文件')
+    parser.add_argument('--track-memory', action='store_true', help='统计各阶段峰值内存（较慢），需配合 --metrics')
+    parser.add_argument('--profile', nargs='?', const=True, default=False,
+                        help='对各阶段运行cProfile；给出目录时保存 .prof 文件，需配合 --metrics')
+    parser.add_argument('-v', '--verbose', action='store_true', help='输出详细日志')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    if not args.verbose:
+        # jieba 导入时会把自己的日志级别设为DEBUG，用过滤器才能在延迟导入后仍然生效
+        logging.getLogger('jieba').addFilter(lambda record: record.levelno >= logging.WARNING)
+
+    output_format = args.format
+    if output_format is None and args.output:
+        output_format = os.path.splitext(args.output)[1].lstrip('.').lower()
+    output_format = output_format or 'json'
+    if args.output and output_format not in WRITERS:
+        print(f"不支持的输出格式: {output_format}", file=sys.stderr)
+        return 2
+    if not os.path.isfile(args.template):
+        print(f"模板文件不存在: {args.template}", file=sys.stderr)
+        return 2
+    if not os.path.isdir(args.folder):
+        print(f"作业文件夹不存在: {args.folder}", file=sys.stderr)
+        return 2
+    if args.archive_add and not args.archive:
+        print("--archive-add 需要配合 --archive 使用", file=sys.stderr)
+        return 2
+    archive_label = None
+    if args.archive_add:
+        archive_label = args.label or os.path.basename(os.path.normpath(args.folder))
+
+    cache = None
+    if not args.no_cache:
+        from cache import ContentCache
+        cache = ContentCache(args.cache_dir)
+
+    instrumentation = None
+    if args.metrics:
+        from instrumentation import Instrumentation
+        profile_dir = args.profile if isinstance(args.profile, str) else None
+        instrumentation = Instrumentation(track_memory=args.track_memory, profile=bool(args.profile),
+                                          profile_dir=profile_dir)
+
+    start = time.perf_counter()
+    try:
+        results, errors, pairs = run_check(args.template, args.folder, workers=args.workers, cache=cache,
+                                           extractor=args.extractor, instrumentation=instrumentation,
+                                           evidence_k=0 if args.no_history else args.evidence_k,
+                                           archive_path=args.archive, archive_k=args.archive_k,
+                                           archive_label=archive_label)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    finally:
+        if instrumentation is not None:
+            instrumentation.close()
+
+    saved_to = []
+    if not args.no_history:
+        from history_store import HistoryStore, DEFAULT_DB_NAME
+        db_path = os.path.join(args.history_dir, DEFAULT_DB_NAME)
+        with HistoryStore(db_path) as store:
+            run_id = store.add_run(results, label=args.label, template=os.path.abspath(args.template),
+                                   folder=os.path.abspath(args.folder), pairs=pairs)
+        saved_to.append(f"{db_path}（记录 {run_id}）")
+    if args.output:
+        WRITERS[output_format](results, args.output)
+        saved_to.append(args.output)
+    if instrumentation is not None:
+        instrumentation.save_json(args.metrics, results=results, errors=errors,
+                                  total_seconds=time.perf_counter() - start)
+    for filename, error in errors.items():
+        print(f"处理失败: {filename}: {error}", file=sys.stderr)
+    duplicates = describe_duplicates(pairs)
+    if duplicates:
+        print(f"发现重复提交: {duplicates}")
+    for pair in [pair for pair in pairs if pair['kind'] == 'archive-text'][:5]:
+        print(f"与往届相似: {pair['document_a']} - {pair['document_b']}（文本余弦 {pair['score']:.2f}）")
+    print(f"已检查 {len(results)} 份文档，用时 {time.perf_counter() - start:.2f}s，结果已保存到 {'、'.join(saved_to) or '（未保存）'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import numpy as np
+
+from cache import content_hash
+
+DUPLICATE_KINDS = {'text': 'text-duplicate', 'code': 'code-duplicate'}  # 重复提交在相似文档对中的类型
+
+
+def normalize_text(text):
+    # 忽略空白与大小写的差异（分词时本就丢弃空白并转为小写，这些差异不影响文本特征）
+    return ' '.join(text.lower().split())
+
+
+def normalize_code(code):
+    # 统一换行符，去掉行尾空白与空行；行首缩进在Python中有意义，予以保留
+    return '\n'.join(line.rstrip() for line in code.splitlines() if line.strip())
+
+
+class DuplicateClusters:
+    """
+    按原始内容与规范化内容的哈希把相同的提交分组。
+    规范化后相同的提交归为一组，只有组内第一份提交（代表）参与分词、TF-IDF、SimHash和词法分析，
+    组的大小作为权重交给相似度计算器，得到的得分再按组展开到每份提交。
+    完全相同的提交得分与逐份计算相同；仅空白或大小写不同的提交沿用代表的特征。
+    规范化后为空的提交（如没有代码的报告）与读取失败的提交各自单独成组，不会被当作相互重复。
+    参数: items (list of str): 每份提交的文本或代码；normalize (callable): 规范化函数；
+          excluded (iterable of int): 不参与分组的提交下标，如读取失败的文档。
+    """
+
+    def __init__(self, items, normalize, excluded=()):
+        excluded = set(excluded)
+        keys = {}  # 规范化内容的哈希 -> 组号
+        self.labels = np.empty(len(items), dtype=np.int64)  # 每份提交所属的组
+        self.representatives = []  # 每组第一份提交的下标
+        self.raw_hashes = []  # 每份提交原始内容的哈希，用于区分完全相同与仅空白不同
+        for i, item in enumerate(items):
+            normalized = '' if i in excluded else normalize(item)
+            key = content_hash(normalized) if normalized else None
+            label = keys.get(key) if key else None
+            if label is None:
+                label = len(self.representatives)
+                self.representatives.append(i)
+                if key:
+                    keys[key] = label
+            self.labels[i] = label
+            self.raw_hashes.append(content_hash(item))
+        self.weights = np.bincount(self.labels, minlength=len(self.representatives))  # 每组的提交数
+
+    def __len__(self):
+        return len(self.representatives)
+
+    def unique(self, items):
+        # 取出每组代表的内容，顺序与组号一致
+        return [items[i] for i in self.representatives]
+
+    def expand(self, values):
+        # 把每组一个的值展开为每份提交一个
+        return [values[label] for label in self.labels]
+
+    def duplicate_groups(self):
+        # 包含多份提交的组，每组为按原顺序排列的提交下标列表，第一项是代表
+        groups = {}
+        for i, label in enumerate(self.labels):
+            if self.weights[label] > 1:
+                groups.setdefault(label, []).append(i)
+        return list(groups.values())
+
+    def duplicate_pairs(self, names, kind):
+        """
+        把重复提交整理为相似文档对，与 pipeline.similar_pairs 的格式相同，可一并保存到历史记录中。
+        参数: names (list): 每份提交的文档名；kind (str): 'text' 或 'code'。
+        返回: list of dict: 组内每份其他提交与代表各一项，'kind' 为 DUPLICATE_KINDS 中的类型，'score' 为1，
+              另含 'match'（'exact' 完全相同，'normalized' 仅空白或大小写不同）与 'cluster_size'。
+        """
+        pairs = []
+        for members in self.duplicate_groups():
+            representative = members[0]
+            for member in members[1:]:
+                match = 'exact' if self.raw_hashes[member] == self.raw_hashes[representative] else 'normalized'
+                pairs.append({'kind': DUPLICATE_KINDS[kind], 'document_a': names[representative],
+                              'document_b': names[member], 'score': 1.0, 'match': match,
+                              'cluster_size': len(members)})
+        return pairs
+
+
+def describe_duplicates(pairs):
+    # 根据相似文档对中的重复提交生成一句说明，如 "文本相同 2 组（共 7 份）"，没有重复时返回空字符串
+    parts = []
+    for kind, label in (('text', '文本'), ('code', '代码')):
+        groups = {pair['document_a']: pair['cluster_size'] for pair in pairs if pair['kind'] == DUPLICATE_KINDS[kind]}
+        if groups:
+            parts.append(f"{label}相同 {len(groups)} 组（共 {sum(groups.values())} 份）")
+    return '，'.join(parts)
@@ -0,0 +1,30 @@
+import numpy as np
+
+ROLLING_HASH_BASE = 0x100000001B3  # 多项式滚动哈希的底数（奇数，在模2^64下可逆）
+_ROLLING_HASH_BASE_INVERSE = pow(ROLLING_HASH_BASE, -1, 1 << 64)
+
+
+def rolling_hash_values(values, size):
+    """
+    计算整数序列中每个长度为 size 的窗口的多项式滚动哈希（模2^64）。
+    利用 H_i = B^(i+size-1) * (S[i+size] - S[i])，其中 S 为 v[j] * B^(-j) 的前缀和，整个计算向量化完成；
+    同一窗口内容无论出现在哪个位置，哈希值都相同。
+    参数: values (np.ndarray): uint64序列；size (int): 窗口长度。
+    返回: np.ndarray: 长度为 len(values) - size + 1 的uint64数组。
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) < size or size <= 0:
+        return np.empty(0, dtype=np.uint64)
+    base = np.full(len(values) - 1, ROLLING_HASH_BASE, dtype=np.uint64)
+    inverse = np.full(len(values) - 1, _ROLLING_HASH_BASE_INVERSE, dtype=np.uint64)
+    one = np.ones(1, dtype=np.uint64)
+    powers = np.concatenate([one, np.cumprod(base, dtype=np.uint64)])  # B^0 ... B^(n-1)
+    inverse_powers = np.concatenate([one, np.cumprod(inverse, dtype=np.uint64)])
+    prefix = np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(values * inverse_powers, dtype=np.uint64)])
+    return powers[size - 1:] * (prefix[size:] - prefix[:-size])
+
+
+def rolling_hashes(text, size):
+    # 计算文本中每个长度为 size 的子串的滚动哈希，第i项为 text[i:i+size] 的哈希
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    return rolling_hash_values(codes, size)
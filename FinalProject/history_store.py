@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    label TEXT,
+    template TEXT,
+    folder TEXT,
+    source TEXT UNIQUE,
+    document_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    rank INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    text_score REAL,
+    code_score REAL,
+    average_score REAL,
+    equivalent_score REAL,
+    timestamp TEXT,
+    PRIMARY KEY (run_id, rank)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS documents_by_name ON documents(name, run_id);
+CREATE TABLE IF NOT EXISTS pairs (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    document_a TEXT NOT NULL,
+    document_b TEXT NOT NULL,
+    score REAL NOT NULL,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS pairs_by_run ON pairs(run_id, kind, score DESC);
+CREATE TABLE IF NOT EXISTS imported_files (
+    source TEXT PRIMARY KEY,
+    imported_at TEXT NOT NULL
+);
+"""
+
+# 结果字段与数据库列的对应关系，排序列只允许使用这里列出的列
+COLUMNS = {
+    'Document Name': 'name',
+    'Text Score': 'text_score',
+    'Code Score': 'code_score',
+    'Average Score': 'average_score',
+    'Equivalent Score': 'equivalent_score',
+    'Timestamp': 'timestamp',
+}
+DEFAULT_DB_NAME = 'history.sqlite3'  # 历史记录库在 history 目录下的文件名
+LEGACY_NAME_RE = re.compile(r'results_(\d{8}_\d{6})\.json$')
+
+
+class HistoryStore:
+    """
+    基于SQLite的查重历史记录。
+    runs 表记录每次检测，documents 表记录每个文档的得分（与历史JSON文件的字段一致），
+    pairs 表记录相似文档对等证据。支持分页读取、按学生跨批次查询，以及导入旧的JSON历史文件。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def add_run(self, results, label=None, template=None, folder=None, pairs=None, created_at=None, source=None):
+        """
+        保存一次检测的结果。
+        参数: results (list of dict): 历史记录格式的结果，按排名顺序；label (str): 备注；
+              template、folder (str): 模板与作业文件夹路径；pairs (list of dict): 相似文档对，
+              每项含 'kind'、'document_a'、'document_b'、'score'，其余字段存入 details；
+              created_at (str): 检测时间，默认为当前时间；source (str): 导入来源，同一来源只保存一次。
+        返回: int: 新记录的编号。
+        """
+        created_at = created_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO runs (created_at, label, template, folder, source, document_count) VALUES (?, ?, ?, ?, ?, ?)',
+                (created_at, label, template, folder, source, len(results)))
+            run_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, rank, result['Document Name'], result.get('Text Score'), result.get('Code Score'),
+                  result.get('Average Score'), result.get('Equivalent Score'), result.get('Timestamp'))
+                 for rank, result in enumerate(results)])
+            if pairs:
+                self.connection.executemany(
+                    'INSERT INTO pairs VALUES (?, ?, ?, ?, ?, ?)',
+                    [(run_id, pair['kind'], pair['document_a'], pair['document_b'], pair['score'],
+                      json.dumps({key: value for key, value in pair.items()
+                                  if key not in ('kind', 'document_a', 'document_b', 'score')}, ensure_ascii=False))
+                     for pair in pairs])
+        return run_id
+
+    def count_runs(self):
+        return self.connection.execute('SELECT COUNT(*) FROM runs').fetchone()[0]
+
+    def list_runs(self, offset=0, limit=100):
+        # 按时间从新到旧分页列出检测记录
+        rows = self.connection.execute(
+            'SELECT id, created_at, label, template, folder, source, document_count FROM runs '
+            'ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?', (limit, offset))
+        return [dict(row) for row in rows]
+
+    def get_run(self, run_id):
+        row = self.connection.execute('SELECT * FROM runs WHERE id = ?', (run_id,)).fetchone()
+        return dict(row) if row else None
+
+    def count_documents(self, run_id):
+        return self.connection.execute('SELECT COUNT(*) FROM documents WHERE run_id = ?', (run_id,)).fetchone()[0]
+
+    def load_results(self, run_id, offset=0, limit=-1, order_by=None, descending=True):
+        """
+        分页读取一次检测的结果。
+        参数: run_id (int): 检测编号；offset、limit (int): 分页，limit 为 -1 表示读取全部；
+              order_by (str): 排序字段（结果字段名，如 'Text Score'），默认按原排名；descending (bool): 是否降序。
+        返回: list of dict: 历史记录格式的结果。
+        """
+        order = 'rank'
+        if order_by is not None:
+            if order_by not in COLUMNS:
+                raise ValueError(f"Unknown result field: {order_by}")
+            order = f"{COLUMNS[order_by]} {'DESC' if descending else 'ASC'}, rank"
+        rows = self.connection.execute(
+            f'SELECT * FROM documents WHERE run_id = ? ORDER BY {order} LIMIT ? OFFSET ?', (run_id, limit, offset))
+        return [self.row_to_result(row) for row in rows]
+
+    def row_to_result(self, row):
+        return {field: row[column] for field, column in COLUMNS.items()}
+
+    def document_history(self, name):
+        """
+        查询某个学生（文档名）在所有检测中的结果，按检测时间从新到旧排列。
+        返回: list of dict: 历史记录格式的结果，另含 'Run'、'Run Time'、'Run Label' 与 'Rank'。
+        """
+        rows = self.connection.execute(
+            'SELECT documents.*, runs.created_at, runs.label FROM documents JOIN runs ON runs.id = documents.run_id '
+            'WHERE documents.name = ? ORDER BY runs.created_at DESC, runs.id DESC', (name,))
+        history = []
+        for row in rows:
+            result = self.row_to_result(row)
+            result.update({'Run': row['run_id'], 'Run Time': row['created_at'], 'Run Label': row['label'],
+                           'Rank': row['rank']})
+            history.append(result)
+        return history
+
+    def search_names(self, prefix, limit=50):
+        # 按前缀查找出现过的文档名，用于输入提示
+        rows = self.connection.execute('SELECT DISTINCT name FROM documents WHERE name >= ? AND name < ? LIMIT ?',
+                                       (prefix, prefix + '\uffff', limit))
+        return [row[0] for row in rows]
+
+    def load_pairs(self, run_id, kind=None, limit=100):
+        # 读取一次检测中得分最高的相似文档对
+        query = 'SELECT * FROM pairs WHERE run_id = ?'
+        params = [run_id]
+        if kind is not None:
+            query += ' AND kind = ?'
+            params.append(kind)
+        rows = self.connection.execute(query + ' ORDER BY score DESC LIMIT ?', params + [limit])
+        pairs = []
+        for row in rows:
+            pair = {'kind': row['kind'], 'document_a': row['document_a'], 'document_b': row['document_b'],
+                    'score': row['score']}
+            pair.update(json.loads(row['details'] or '{}'))
+            pairs.append(pair)
+        return pairs
+
+    def delete_run(self, run_id):
+        with self.connection:
+            self.connection.execute('DELETE FROM runs WHERE id = ?', (run_id,))
+
+    def compact(self):
+        # 删除大量记录后回收空间
+        self.connection.execute('VACUUM')
+
+    def import_json_file(self, file_path):
+        """
+        导入一个旧的 results_<时间>.json 历史文件。导入过的文件名记录在 imported_files 表中，
+        之后即使删除了对应的检测记录也不会再次导入。
+        返回: int 或 None: 新记录的编号，跳过时为None。
+        """
+        source = os.path.basename(file_path)
+        if self.is_imported(source):
+            return None
+        with open(file_path, 'r', encoding='utf-8') as f:
+            results = json.load(f)
+        if not isinstance(results, list):
+            raise ValueError(f"JSON 文件格式不正确: {file_path}")
+        match = LEGACY_NAME_RE.search(source)
+        if match:
+            created_at = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
+        else:
+            created_at = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime("%Y-%m-%d %H:%M:%S")
+        run_id = self.add_run(results, label=source, created_at=created_at, source=source)
+        with self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO imported_files VALUES (?, ?)',
+                                    (source, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        return run_id
+
+    def is_imported(self, source):
+        # 早期版本只在 runs.source 中记录导入来源，两处都要检查
+        return bool(self.connection.execute('SELECT 1 FROM imported_files WHERE source = ?', (source,)).fetchone()
+                    or self.connection.execute('SELECT 1 FROM runs WHERE source = ?', (source,)).fetchone())
+
+    def import_json_folder(self, folder_path):
+        # 导入文件夹中旧版本自动保存的 results_<时间>.json 历史文件（手动导出的其他JSON文件不导入），返回新导入的数量
+        imported = 0
+        for filename in sorted(os.listdir(folder_path)):
+            if not LEGACY_NAME_RE.fullmatch(filename):
+                continue
+            try:
+                if self.import_json_file(os.path.join(folder_path, filename)) is not None:
+                    imported += 1
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Skipping history file {filename}: {e}")
+        return imported
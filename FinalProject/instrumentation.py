@@ -0,0 +1,169 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Instrumentation:
+    """
+    记录流水线各阶段的墙钟时间、CPU时间、峰值内存和处理数量，可按文档细分，并导出为JSON。
+    参数: track_memory (bool): 使用tracemalloc统计峰值内存（会明显拖慢运行）；
+          profile (bool 或 set): 对全部阶段或指定名称的阶段运行cProfile；
+          profile_dir (str): 保存各阶段 .prof 文件的目录，为None时只在记录中保留耗时最多的几个函数。
+    CPU时间与内存只统计当前进程，进程池中的工作进程各自记录后由调用方用 merge 合并。
+    """
+
+    enabled = True
+
+    def __init__(self, track_memory=False, profile=False, profile_dir=None, profile_top=15):
+        self.track_memory = track_memory
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.profile_top = profile_top
+        self.records = []  # 每个阶段一条记录，按结束顺序排列
+        self._stack = []  # 正在进行的阶段，用于嵌套统计峰值内存
+        self._profiling = False
+        self._started_tracemalloc = False
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def should_profile(self, name):
+        if self._profiling or not self.profile:
+            return False
+        return self.profile is True or name in self.profile
+
+    @contextmanager
+    def stage(self, name, items=None, document=None, **details):
+        """
+        计量一个阶段。
+        参数: name (str): 阶段名；items (int): 处理数量，也可在 with 块中写入 record['items']；
+              document (str): 所属文档名，用于按文档统计；details: 其他需要记录的信息。
+        返回: 上下文管理器，产生该阶段的记录字典。
+        """
+        record = {'stage': name, 'document': document, 'items': items, 'depth': len(self._stack)}
+        record.update(details)
+        profiler = None
+        if self.should_profile(name):
+            profiler = cProfile.Profile()
+            self._profiling = True
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                # 重置峰值前先把外层阶段到目前为止的峰值保存下来
+                self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], peak)
+            tracemalloc.reset_peak()
+            record['_start_memory'], record['_peak'] = current, current
+        self._stack.append(record)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                self.save_profile(record, profiler)
+            record['wall_seconds'] = time.perf_counter() - wall_start
+            record['cpu_seconds'] = time.process_time() - cpu_start
+            self._stack.pop()
+            if self.track_memory:
+                peak = max(record.pop('_peak'), tracemalloc.get_traced_memory()[1])
+                record['peak_memory_bytes'] = peak - record.pop('_start_memory')
+                if self._stack:
+                    self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], peak)
+            self.records.append(record)
+
+    def save_profile(self, record, profiler):
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"{len(self.records):03d}_{record['stage']}.prof")
+            profiler.dump_stats(path)
+            record['profile_path'] = path
+        else:
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(self.profile_top)
+            record['profile'] = stream.getvalue()
+
+    def merge(self, records):
+        # 合并工作进程中产生的记录
+        self.records.extend(records)
+
+    def drain(self):
+        # 取出并清空当前记录，供工作进程返回给主进程
+        records, self.records = self.records, []
+        return records
+
+    def summary(self):
+        # 按阶段名汇总：次数、总墙钟时间、总CPU时间、最大峰值内存与总处理数量
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {'count': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                        'items': 0, 'peak_memory_bytes': None})
+            total['count'] += 1
+            total['wall_seconds'] += record['wall_seconds']
+            total['cpu_seconds'] += record['cpu_seconds']
+            total['items'] += record['items'] or 0
+            if 'peak_memory_bytes' in record:
+                total['peak_memory_bytes'] = max(total['peak_memory_bytes'] or 0, record['peak_memory_bytes'])
+        return totals
+
+    def by_document(self):
+        # 按文档整理各阶段记录：{文档名: {阶段名: 记录}}
+        documents = {}
+        for record in self.records:
+            if record['document'] is not None:
+                documents.setdefault(record['document'], {})[record['stage']] = record
+        return documents
+
+    def to_dict(self):
+        return {
+            'stages': self.summary(),
+            'documents': self.by_document(),
+            'records': [record for record in self.records if record['document'] is None],
+        }
+
+    def save_json(self, file_path, **extra):
+        # extra 中的内容（如本次运行的结果）一并写入
+        data = self.to_dict()
+        data.update(extra)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4, default=str)
+
+    def close(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+
+class NullInstrumentation:
+    """
+    默认使用的空实现，接口与 Instrumentation 相同但不做任何计量。
+    """
+
+    enabled = False
+    records = []
+
+    @contextmanager
+    def stage(self, name, items=None, document=None, **details):
+        yield {}
+
+    def merge(self, records):
+        pass
+
+    def drain(self):
+        return []
+
+    def summary(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
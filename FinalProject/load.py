@@ -1,17 +1,23 @@
 import sys
 import os
 import re
-import comtypes.client
 import logging
-import tkinter as tk
-from tkinter import filedialog, messagebox
-from docx import Document
+import numpy as np
 import difflib
+import itertools
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from cache import content_hash, file_hash
+from hashing import rolling_hashes
+from instrumentation import Instrumentation, NULL_INSTRUMENTATION
 
 #logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def doc_to_docx(doc_path):
     try:
+        import comtypes.client  # 仅 Windows 可用，转换 .doc 时才导入
         word = comtypes.client.CreateObject('Word.Application')
         doc = word.Documents.Open(doc_path)
         doc.Activate()
@@ -31,14 +37,188 @@ def doc_to_docx(doc_path):
         logging.error(f"Error converting {doc_path} to .docx: {e}")
         return None
 
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+R_TYPE_OFFICE_DOCUMENT = '/officeDocument'
+# 段落中 w:r 的直接子元素与对应文本，与 python-docx 的 Run.text 一致（w:t 与 w:br 单独处理）
+_RUN_CHAR_ELEMENTS = {W_NS + 'tab': '\t', W_NS + 'cr': '\n', W_NS + 'noBreakHyphen': '-', W_NS + 'ptab': '\t'}
+
+
+def _main_document_part(archive):
+    # 通过包关系找到主文档部件，找不到时使用默认路径
+    try:
+        relationships = ET.fromstring(archive.read('_rels/.rels'))
+    except KeyError:
+        return 'word/document.xml'
+    for relationship in relationships:
+        if relationship.get('Type', '').endswith(R_TYPE_OFFICE_DOCUMENT):
+            return relationship.get('Target').lstrip('/')
+    return 'word/document.xml'
+
+
+def _resolve_table_cells(rows):
+    """
+    按 python-docx 的 _Row.cells 规则展开表格单元格文本：
+    横向合并（gridSpan）的单元格重复其跨越的列数次，纵向合并的后续单元格（vMerge=continue）取上方起始单元格的内容。
+    参数: rows (list): 每行为 (gridBefore, [(gridSpan, vMerge, 文本), ...])。
+    返回: list: 按行、按列展开后的单元格文本。
+    """
+    texts = []
+    previous = {}  # 上一行中 网格偏移 -> (起始单元格文本, 起始单元格跨列数)
+    for row_index, (grid_before, cells) in enumerate(rows):
+        offset = grid_before
+        current = {}
+        for span, vmerge, text in cells:
+            if vmerge == 'continue':
+                if offset not in previous:
+                    raise ValueError(f"no cell above grid offset {offset} in row {row_index}")
+                root = previous[offset]
+            else:
+                root = (text, span)
+            current[offset] = root
+            texts.extend([root[0]] * root[1])
+            offset += span
+        previous = current
+    return texts
+
+
+def iter_docx_blocks(file_path):
+    """
+    用增量XML解析直接读取DOCX中的 word/document.xml，按文档顺序生成正文的段落与顶层表格。
+    只统计正文和顶层表格单元格的直接子段落，文本规则与 python-docx 相同。
+    参数: file_path (str): DOCX文件路径。
+    返回: 生成器，每项为 ('paragraph', 段落文本) 或 ('table', 单元格文本列表)。
+    """
+    body, p, r, hyperlink = W_NS + 'body', W_NS + 'p', W_NS + 'r', W_NS + 'hyperlink'
+    tbl, tr, tc = W_NS + 'tbl', W_NS + 'tr', W_NS + 'tc'
+    text_tag, br_tag = W_NS + 't', W_NS + 'br'
+    with zipfile.ZipFile(file_path) as archive, archive.open(_main_document_part(archive)) as xml_file:
+        stack = []
+        paragraph, paragraph_depth = None, None  # 当前段落的文本片段及其在元素栈中的深度
+        rows, row, cell, table_depth = None, None, None, None  # 当前顶层表格的解析状态
+        for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+            if event == 'start':
+                parent = stack[-1] if stack else None
+                depth = len(stack)
+                stack.append(elem.tag)
+                if elem.tag == p and (parent == body or (cell is not None and depth == table_depth + 3)):
+                    paragraph, paragraph_depth = [], depth
+                elif table_depth is None:
+                    if elem.tag == tbl and parent == body:
+                        rows, table_depth = [], depth
+                elif elem.tag == tr and depth == table_depth + 1:
+                    row = [0, []]
+                elif elem.tag == tc and depth == table_depth + 2:
+                    cell = [1, None, []]
+                elif depth == table_depth + 3 and parent == W_NS + 'trPr' and elem.tag == W_NS + 'gridBefore':
+                    row[0] = int(elem.get(W_NS + 'val'))
+                elif cell is not None and depth == table_depth + 4 and stack[-2] == W_NS + 'tcPr':
+                    if elem.tag == W_NS + 'gridSpan':
+                        cell[0] = int(elem.get(W_NS + 'val'))
+                    elif elem.tag == W_NS + 'vMerge':
+                        cell[1] = elem.get(W_NS + 'val', 'continue')
+                continue
+
+            tag = stack.pop()
+            depth = len(stack)
+            if paragraph is not None and depth > paragraph_depth:
+                # 只收集段落直接子元素 w:r（或 w:hyperlink/w:r）中的文本
+                in_run = ((depth == paragraph_depth + 2 and stack[paragraph_depth + 1] == r) or
+                          (depth == paragraph_depth + 3 and stack[paragraph_depth + 1] == hyperlink
+                           and stack[paragraph_depth + 2] == r))
+                if in_run:
+                    if tag == text_tag:
+                        paragraph.append(elem.text or '')
+                    elif tag == br_tag:
+                        paragraph.append('\n' if elem.get(W_NS + 'type', 'textWrapping') == 'textWrapping' else '')
+                    elif tag in _RUN_CHAR_ELEMENTS:
+                        paragraph.append(_RUN_CHAR_ELEMENTS[tag])
+            elif tag == p and depth == paragraph_depth:
+                text = ''.join(paragraph)
+                paragraph, paragraph_depth = None, None
+                if cell is not None:
+                    cell[2].append(text)
+                else:
+                    yield 'paragraph', text
+                    elem.clear()
+            elif table_depth is not None:
+                if tag == tc and depth == table_depth + 2:
+                    row[1].append((cell[0], cell[1], '\n'.join(cell[2])))
+                    cell = None
+                elif tag == tr and depth == table_depth + 1:
+                    rows.append(row)
+                    row = None
+                elif tag == tbl and depth == table_depth:
+                    yield 'table', _resolve_table_cells(rows)
+                    rows, table_depth = None, None
+                    elem.clear()
+
+
+class TemplateIndex:
+    """
+    模板内容的滚动哈希分片（shingle）索引。
+    模板中每个长度为 min_length + 1 的子串都被索引，学生文本只需线性扫描一遍：
+    凡是与模板某个分片相同的位置都被标记，所有连续覆盖长度超过 min_length 的片段一并删除。
+    """
+
+    def __init__(self, template_text, min_length=20):
+        self.template_text = template_text
+        self.min_length = min_length  # 与模板相同的片段超过该长度才删除，避免误删过短的匹配
+        self.shingle_size = min_length + 1
+        hashes = rolling_hashes(template_text, self.shingle_size)
+        self.shingle_hashes = np.unique(hashes)
+        self.positions = dict(zip(hashes.tolist(), range(len(hashes))))  # 哈希 -> 模板中的一个起始位置，用于校验
+
+    def find_spans(self, text):
+        """
+        找出文本中与模板相同的所有片段。
+        返回: list: (起始, 终止) 区间列表，每个区间长度都超过 min_length。
+        """
+        size = self.shingle_size
+        hashes = rolling_hashes(text, size)
+        candidates = np.flatnonzero(np.isin(hashes, self.shingle_hashes))
+        if len(candidates) == 0:
+            return []
+        # 逐个校验子串确实与模板相同，排除哈希碰撞
+        template = self.template_text
+        starts = np.array([i for i, h in zip(candidates.tolist(), hashes[candidates].tolist())
+                           if text[i:i + size] == template[self.positions[h]:self.positions[h] + size]], dtype=np.int64)
+        if len(starts) == 0:
+            return []
+        coverage = np.zeros(len(text) + 1, dtype=np.int64)
+        np.add.at(coverage, starts, 1)
+        np.add.at(coverage, starts + size, -1)
+        covered = np.concatenate([[0], (np.cumsum(coverage[:-1]) > 0).astype(np.int8), [0]])
+        edges = np.flatnonzero(np.diff(covered))
+        return [(int(start), int(stop)) for start, stop in zip(edges[::2], edges[1::2]) if stop - start > self.min_length]
+
+    def remove(self, text):
+        # 删除文本中所有与模板相同的片段；跨行的片段留下一个换行，避免两侧的行被拼接成一行
+        pieces, last = [], 0
+        for start, stop in self.find_spans(text):
+            pieces.append(text[last:start])
+            if '\n' in text[start:stop]:
+                pieces.append('\n')
+            last = stop
+        pieces.append(text[last:])
+        return ''.join(pieces)
+
+
 class WordProcessor:
-    def __init__(self):
+    def __init__(self, cache=None, extractor='python-docx', template_strategy='indexed', instrumentation=None):
         self.template_text = None
+        self.template_index = None  # 模板的滚动哈希分片索引，在 set_template 中构建一次
+        self.template_strategy = template_strategy  # 模板去除方式：'indexed' 删除全部模板片段，'difflib' 只删除最长的一段
+        self.template_timings = {}  # 每个文档去除模板内容的耗时（秒）
+        self.extractor = extractor  # DOCX文本提取方式：'python-docx' 或 'stream'（直接解析XML，输出相同）
         self.documents = {}  # 字典来存储姓名(文件名)-内容-评分
+        self.cache = cache  # ContentCache，缓存每个文件去除模板并分离后的内容
+        self.errors = {}  # 读取失败的文件名 -> 错误信息
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION  # 各阶段计时与内存统计，默认不记录
 
     def set_template(self, template_text):
         if template_text:
             self.template_text = template_text
+            self.template_index = TemplateIndex(template_text)
             logging.info("Template text has been set.")
         else:
             logging.warning("Attempted to set empty template text.")
@@ -50,6 +230,7 @@ class WordProcessor:
         返回:str: DOCX文件的全部文本内容，如果发生错误则返回None。
         """
         try:
+            from docx import Document
             doc = Document(file_path)
             full_text = []
 
@@ -72,6 +253,38 @@ class WordProcessor:
             logging.error(f"Error reading {file_path}: {e}")
             return None
 
+    def read_docx_stream(self, file_path, document_order=False):
+        """
+        不构建 python-docx 对象模型，直接增量解析 word/document.xml 读取文本。
+        参数: file_path (str): 要读取的DOCX文件的路径；
+              document_order (bool): 为True时段落与表格按文档中的先后顺序输出，
+              否则与 read_docx 相同，先输出所有段落再输出所有表格。
+        返回: str: DOCX文件的全部文本内容，如果发生错误则返回None。
+        """
+        try:
+            paragraphs, tables = [], []
+            for kind, content in iter_docx_blocks(file_path):
+                if kind == 'paragraph':
+                    paragraphs.append(content)
+                elif document_order:
+                    paragraphs.extend(content)
+                else:
+                    tables.extend(content)
+            document_text = '\n'.join(paragraphs + tables)
+            logging.info(f"Successfully read document: {file_path}")
+            return document_text
+        except Exception as e:
+            logging.error(f"Error reading {file_path}: {e}")
+            return None
+
+    def extract_text(self, file_path):
+        # 按当前选择的提取方式读取DOCX文本
+        if self.extractor == 'stream':
+            return self.read_docx_stream(file_path)
+        if self.extractor == 'python-docx':
+            return self.read_docx(file_path)
+        raise ValueError(f"Unknown docx extractor: {self.extractor}")
+
     def remove_template_content(self, student_text, template_text):
         """
         从学生文档中移除模板内容。
@@ -88,11 +301,14 @@ class WordProcessor:
     def preprocess_text(self, text):
         """Preprocess text by removing template content."""
         if self.template_text and text:
+            if self.template_strategy == 'indexed':
+                return self.template_index.remove(text)
             return self.remove_template_content(text, self.template_text)
         return text
 
     def doc_to_docx(self, doc_path):
         try:
+            import comtypes.client  # 仅 Windows 可用，转换 .doc 时才导入
             word = comtypes.client.CreateObject('Word.Application')
             doc = word.Documents.Open(doc_path)
             doc.Activate()
@@ -126,43 +342,201 @@ class WordProcessor:
                 natural_language_text.append(line)
             else:
                 code_text.append(line)  # 将代码行加入code_text
-                logging.info(f"Identified as code or irrelevant: {line}")
+        logging.debug(f"Separated {len(natural_language_text)} natural language lines and {len(code_text)} code lines.")
 
         # 返回自然语言文本和代码文本
         return '\n'.join(natural_language_text), '\n'.join(code_text)
 
     def add_document(self, file_path):
+        filename = os.path.splitext(os.path.basename(file_path))[0]
         if file_path.endswith('.doc'):
             file_path = self.doc_to_docx(file_path)
+            if file_path is None:
+                self.record_error(filename, 'Failed to convert .doc file')
+                return
 
-        document_text = self.read_docx(file_path)
-        filename = os.path.splitext(os.path.basename(file_path))[0]
-        if document_text is not None:
-            document_text = self.preprocess_text(document_text)
-            # 分离自然语言和代码
-            natural_language_text, code_text = self.separate_natural_language_from_code(document_text)
-
-            self.documents[filename] = {
-                '姓名': filename,
-                '自然语言内容': natural_language_text,
-                '代码内容': code_text,  # 存储代码部分
-                '评分': None
-            }
+        cache_key = self.document_cache_key(file_path)
+        cached = self.cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            self.store_document(filename, *cached)
+            logging.info(f"Loaded document from cache: {filename}")
+            return
+
+        # 与并行处理相同，单个文件出错只记录错误信息，不中断整批处理
+        try:
+            content = self.extract_document(file_path)
+        except Exception as e:
+            self.record_error(filename, f"{type(e).__name__}: {e}")
+            return
+        if content is not None:
+            if cache_key:
+                self.cache.set(cache_key, content)
+            self.store_document(filename, *content)
             logging.info(f"Added document with separated content: {filename}")
         else:
-            logging.error(f"Failed to process file: {file_path}")
-            self.documents[filename] = {
-                '姓名': filename,
-                '自然语言内容': 'error',
-                '代码内容': 'error',
-                '评分': None
-            }
-
-    def process_folder(self, folder_path):
-        for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
-            self.add_document(file_path)
+            self.record_error(filename, 'Failed to read document')
+
+    def record_error(self, filename, error):
+        # 记录读取失败的文件，并以 'error' 占位保留该文档
+        logging.error(f"Failed to process file {filename}: {error}")
+        self.errors[filename] = error
+        self.store_document(filename, 'error', 'error')
+
+    def extract_document(self, file_path):
+        """
+        读取文档、去除模板内容并分离自然语言与代码。
+        参数: file_path (str): DOCX文件路径。
+        返回: tuple (str, str): 自然语言内容与代码内容，读取失败时返回None。
+        """
+        filename = os.path.splitext(os.path.basename(file_path))[0]
+        with self.instrumentation.stage('extract', document=filename) as record:
+            document_text = self.extract_text(file_path)
+            record['items'] = len(document_text) if document_text is not None else 0
+        if document_text is None:
+            return None
+        start = time.perf_counter()
+        with self.instrumentation.stage('template_strip', items=len(document_text), document=filename):
+            document_text = self.preprocess_text(document_text)
+        elapsed = time.perf_counter() - start
+        self.template_timings[filename] = elapsed
+        logging.info(f"Removed template content from {file_path} in {elapsed:.4f}s")
+        # 分离自然语言和代码
+        with self.instrumentation.stage('separate', items=len(document_text), document=filename):
+            return self.separate_natural_language_from_code(document_text)
+
+    def store_document(self, filename, natural_language_text, code_text):
+        self.documents[filename] = {
+            '姓名': filename,
+            '自然语言内容': natural_language_text,
+            '代码内容': code_text,  # 存储代码部分
+            '评分': None
+        }
+
+    def document_cache_key(self, file_path):
+        # 缓存键由文件内容哈希与模板哈希组成，模板变化后旧条目自动失效
+        if self.cache is None or file_path is None:
+            return None
+        try:
+            return self.cache.make_key('document', file_hash(file_path), content_hash(self.template_text or ''),
+                                       self.template_strategy)
+        except OSError as e:
+            logging.error(f"Error hashing {file_path}: {e}")
+            return None
+
+    def list_folder(self, folder_path):
+        # 按文件名排序，保证每次处理顺序一致
+        return [os.path.join(folder_path, filename) for filename in sorted(os.listdir(folder_path))]
+
+    def iter_folder(self, folder_path, workers=4, max_in_flight=None):
+        """
+        使用进程池并行提取文件夹中的文档，按完成顺序逐个生成结果。
+        单个文件出错只记录错误信息，不会中断整批处理。
+        参数: folder_path (str): 文件夹路径；workers (int): 进程数；
+              max_in_flight (int): 同时提交的最大任务数，默认为进程数的2倍。
+        返回: 生成器，每项为 (序号, 文件名, (自然语言内容, 代码内容) 或None, 错误信息或None)，序号为文件在排序后列表中的位置。
+        """
+        pending = []
+        for position, file_path in enumerate(self.list_folder(folder_path)):
+            if file_path.endswith('.doc'):
+                # Word转换依赖COM，只能在主进程中完成
+                converted = self.doc_to_docx(file_path)
+                if converted is None:
+                    yield position, os.path.splitext(os.path.basename(file_path))[0], None, 'Failed to convert .doc file'
+                    continue
+                file_path = converted
+            filename = os.path.splitext(os.path.basename(file_path))[0]
+            cache_key = self.document_cache_key(file_path)
+            cached = self.cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                yield position, filename, cached, None
+            else:
+                pending.append((position, filename, file_path, cache_key))
+
+        if not pending:
+            return
+        max_in_flight = max_in_flight or workers * 2
+        queue = iter(pending)
+        instrument = self.instrumentation.enabled
+        track_memory = getattr(self.instrumentation, 'track_memory', False)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_ingest_worker,
+                                 initargs=(self.template_text, self.extractor, self.template_strategy, instrument,
+                                           track_memory)) as executor:
+            in_flight = {}
+            for position, filename, file_path, cache_key in itertools.islice(queue, max_in_flight):
+                in_flight[executor.submit(_ingest_file, file_path)] = (position, filename, cache_key)
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    position, filename, cache_key = in_flight.pop(future)
+                    try:
+                        content, error, elapsed, records = future.result()
+                    except Exception as e:
+                        content, error, elapsed, records = None, f"{type(e).__name__}: {e}", None, []
+                    self.instrumentation.merge(records)
+                    if elapsed is not None:
+                        self.template_timings[filename] = elapsed
+                    if content is not None and cache_key:
+                        self.cache.set(cache_key, content)
+                    yield position, filename, content, error
+                # 补充新任务，保持在途任务数不超过上限
+                for position, filename, file_path, cache_key in itertools.islice(queue, len(done)):
+                    in_flight[executor.submit(_ingest_file, file_path)] = (position, filename, cache_key)
+
+    def process_folder(self, folder_path, workers=1, progress=None):
+        """
+        读取文件夹中的全部文档。
+        参数: folder_path (str): 文件夹路径；workers (int): 进程数，1 表示在当前进程中逐个处理；
+              progress (callable): 可选回调 progress(已完成数, 总数, 文档名)，每处理完一个文件调用一次，
+              文档名与 self.documents 的键相同（不含扩展名），
+              回调抛出的异常会中止处理并向上传递（用于取消）。
+        """
+        file_paths = self.list_folder(folder_path)
+        with self.instrumentation.stage('ingestion', items=len(file_paths), workers=workers):
+            self.load_files(folder_path, file_paths, workers, progress)
+
+    def load_files(self, folder_path, file_paths, workers, progress):
+        # 逐个或用进程池读取文件，结果按文件名顺序存入 self.documents
+        if workers <= 1:
+            for done, file_path in enumerate(file_paths, 1):
+                self.add_document(file_path)
+                if progress is not None:
+                    progress(done, len(file_paths), os.path.splitext(os.path.basename(file_path))[0])
+            return
+
+        results = []
+        for result in self.iter_folder(folder_path, workers):
+            results.append(result)
+            if progress is not None:
+                progress(len(results), len(file_paths), result[1])
+        results.sort(key=lambda result: result[0])
+        for _, filename, content, error in results:
+            if content is not None:
+                self.store_document(filename, *content)
+            else:
+                self.record_error(filename, error)
         # 在此处调用相似度计算函数，更新self.documents中每个文档的'similarity'键
 
 
+_worker_processor = None  # 工作进程内的 WordProcessor，由 _init_ingest_worker 创建
+
+
+def _init_ingest_worker(template_text, extractor, template_strategy, instrument=False, track_memory=False):
+    global _worker_processor
+    instrumentation = Instrumentation(track_memory=track_memory) if instrument else None
+    _worker_processor = WordProcessor(extractor=extractor, template_strategy=template_strategy,
+                                      instrumentation=instrumentation)
+    if template_text:
+        _worker_processor.set_template(template_text)
 
+
+def _ingest_file(file_path):
+    # 在工作进程中提取单个文件，返回 (内容, 错误信息, 模板去除耗时, 计量记录)，异常以字符串形式返回
+    try:
+        content = _worker_processor.extract_document(file_path)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", None, _worker_processor.instrumentation.drain()
+    elapsed = _worker_processor.template_timings.get(os.path.splitext(os.path.basename(file_path))[0])
+    records = _worker_processor.instrumentation.drain()
+    if content is None:
+        return None, 'Failed to read document', elapsed, records
+    return content, None, elapsed, records
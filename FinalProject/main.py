@@ -1,13 +1,17 @@
 import os
 import sys
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QColor, QIcon, QFont
+from PyQt5.QtGui import QIcon, QFont
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QFileDialog, QMessageBox, \
-    QTableWidgetItem, QTableWidget, QHeaderView, QComboBox, QListWidget
+    QTableView, QHeaderView, QComboBox, QListView, QProgressBar, QLineEdit, QHBoxLayout
 from load import WordProcessor
-from algorithm import TextSimilarityCalculator, CodeSimilarityCalculator
+from cache import ContentCache
+from pipeline import calculate_equivalent_score
+from dedup import describe_duplicates
+from check_worker import CheckWorker
+from results_model import ResultsTableModel, RunListModel
+from history_store import HistoryStore, DEFAULT_DB_NAME
 import json
-from datetime import datetime
 
 
 class HistoryWindow(QWidget):
@@ -16,12 +20,25 @@ class HistoryWindow(QWidget):
         self.setWindowTitle('历史记录')
         self.setGeometry(150, 150, 600, 400)
         self.layout = QVBoxLayout(self)
+        self.store = self.parent().history
 
-        self.history_list = QListWidget(self)
-        self.load_history_files()
-        self.history_list.itemDoubleClicked.connect(self.load_selected_history)
+        # 检测记录按需分页读取，记录再多也能立即打开
+        self.history_model = RunListModel(self.store, self)
+        self.history_list = QListView(self)
+        self.history_list.setModel(self.history_model)
+        self.history_list.doubleClicked.connect(self.load_selected_history)
         self.layout.addWidget(self.history_list)
 
+        search_layout = QHBoxLayout()
+        self.student_input = QLineEdit(self)
+        self.student_input.setPlaceholderText('输入学生（文档名），查询其在所有检测中的结果')
+        self.student_input.returnPressed.connect(self.search_student)
+        search_layout.addWidget(self.student_input)
+        self.search_button = QPushButton('查询学生', self)
+        self.search_button.clicked.connect(self.search_student)
+        search_layout.addWidget(self.search_button)
+        self.layout.addLayout(search_layout)
+
         self.load_button = QPushButton('加载选中记录', self)
         self.load_button.setIcon(QIcon('icons/load.png'))
         self.load_button.clicked.connect(self.load_selected_history)
@@ -37,55 +54,43 @@ class HistoryWindow(QWidget):
         self.close_button.clicked.connect(self.close)
         self.layout.addWidget(self.close_button)
 
-    def load_history_files(self):
-        history_dir = self.parent().ensure_history_folder_exists()
-        files = [f for f in os.listdir(history_dir) if f.endswith('.json')]
-        self.history_list.addItems(files)
+    def selected_run(self):
+        index = self.history_list.currentIndex()
+        if not index.isValid():
+            QMessageBox.warning(self, '警告', '请选择一个历史记录。')
+            return None, None
+        return index.data(Qt.UserRole), index.data(Qt.DisplayRole)
 
     def load_selected_history(self):
-        selected_item = self.history_list.currentItem()
-        if not selected_item:
-            QMessageBox.warning(self, '警告', '请选择一个历史记录。')
+        run_id, title = self.selected_run()
+        if run_id is None:
             return
+        self.parent().load_history_run(run_id)
+        QMessageBox.information(self, '加载成功', f'已成功加载记录: {title}')
 
-        file_name = selected_item.text()
-        history_dir = self.parent().ensure_history_folder_exists()
-        file_path = os.path.join(history_dir, file_name)
-
-        try:
-            with open(file_path, 'r', encoding='utf-8') as jsonfile:
-                results = json.load(jsonfile)
-                if not isinstance(results, list):
-                    raise ValueError("JSON 文件格式不正确")
-
-                self.parent().update_table_with_loaded_results(results)
-                QMessageBox.information(self, '加载成功', f'已成功加载记录: {file_name}')
-        except FileNotFoundError:
-            QMessageBox.critical(self, '错误', f'未找到文件: {file_name}')
-        except json.JSONDecodeError:
-            QMessageBox.critical(self, '错误', f'JSON 解析错误: {file_name}')
-        except ValueError as e:
-            QMessageBox.critical(self, '错误', str(e))
+    def search_student(self):
+        name = self.student_input.text().strip()
+        if not name:
+            QMessageBox.warning(self, '警告', '请输入学生（文档名）。')
+            return
+        results = self.store.document_history(name)
+        if not results:
+            QMessageBox.information(self, '查询结果', f'没有找到 {name} 的记录。')
+            return
+        self.parent().update_table_with_loaded_results(results)
 
     def delete_selected_history(self):
-        selected_item = self.history_list.currentItem()
-        if not selected_item:
-            QMessageBox.warning(self, '警告', '请选择一个历史记录。')
+        run_id, title = self.selected_run()
+        if run_id is None:
             return
 
-        file_name = selected_item.text()
-        history_dir = self.parent().ensure_history_folder_exists()
-        file_path = os.path.join(history_dir, file_name)
-
-        reply = QMessageBox.question(self, '确认删除', f'确定要删除记录 {file_name} 吗？',
+        reply = QMessageBox.question(self, '确认删除', f'确定要删除记录 {title} 吗？',
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
             try:
-                os.remove(file_path)
-                self.history_list.takeItem(self.history_list.row(selected_item))
-                QMessageBox.information(self, '删除成功', f'已成功删除记录: {file_name}')
-            except FileNotFoundError:
-                QMessageBox.critical(self, '错误', f'未找到文件: {file_name}')
+                self.store.delete_run(run_id)
+                self.history_model.refresh()
+                QMessageBox.information(self, '删除成功', f'已成功删除记录: {title}')
             except Exception as e:
                 QMessageBox.critical(self, '错误', str(e))
 
@@ -93,7 +98,13 @@ class HistoryWindow(QWidget):
 class PlagiarismCheckerGUI(QWidget):
     def __init__(self):
         super().__init__()
-        self.processor = WordProcessor()
+        self.cache = ContentCache(self.ensure_cache_folder_exists())
+        history_dir = self.ensure_history_folder_exists()
+        self.history = HistoryStore(os.path.join(history_dir, DEFAULT_DB_NAME))
+        self.history.import_json_folder(history_dir)  # 导入旧版本保存的JSON历史文件（已导入的会跳过）
+        self.processor = WordProcessor(cache=self.cache, extractor='stream')
+        self.worker = None
+        self.export_dir = os.path.expanduser('~')  # 保存结果对话框的初始目录，记住上次保存的位置
         self.initUI()
 
     def initUI(self):
@@ -116,7 +127,7 @@ class PlagiarismCheckerGUI(QWidget):
                 font-size: 16px;
                 font-weight: bold;
             }
-            QTableWidget {
+            QTableView {
                 background-color: white;
             }
             QListWidget {
@@ -140,23 +151,33 @@ class PlagiarismCheckerGUI(QWidget):
         btn_select_folder.clicked.connect(self.selectFolder)
         layout.addWidget(btn_select_folder)
 
-        btn_check = QPushButton('开始检测抄袭', self)
-        btn_check.setIcon(QIcon('icons/check.png'))
-        btn_check.clicked.connect(self.checkPlagiarism)
-        layout.addWidget(btn_check)
+        self.btn_check = QPushButton('开始检测抄袭', self)
+        self.btn_check.setIcon(QIcon('icons/check.png'))
+        self.btn_check.clicked.connect(self.checkPlagiarism)
+        layout.addWidget(self.btn_check)
+
+        self.btn_cancel = QPushButton('取消检测', self)
+        self.btn_cancel.setEnabled(False)
+        self.btn_cancel.clicked.connect(self.cancelCheck)
+        layout.addWidget(self.btn_cancel)
+
+        self.status_label = QLabel('', self)
+        layout.addWidget(self.status_label)
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setVisible(False)
+        layout.addWidget(self.progress_bar)
 
         self.sort_combo_box = QComboBox(self)
         self.sort_combo_box.addItems(['按总结果排序', '标准排序', '按文本查重结果排序', '按代码查重结果排序'])
         self.sort_combo_box.currentIndexChanged.connect(self.update_table_sorting)
         layout.addWidget(self.sort_combo_box)
 
-        self.table_widget = QTableWidget(self)
-        self.table_widget.setRowCount(0)
-        self.table_widget.setColumnCount(5)
-        self.table_widget.setHorizontalHeaderLabels(
-            ['Document Name', 'Text Score', 'Code Score', 'Average Score', 'Timestamp'])
-        self.table_widget.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        layout.addWidget(self.table_widget)
+        self.results_model = ResultsTableModel(self)
+        self.table_view = QTableView(self)
+        self.table_view.setModel(self.results_model)
+        self.table_view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table_view.verticalHeader().setDefaultSectionSize(24)  # 固定行高，避免逐行测量
+        layout.addWidget(self.table_view)
 
         btn_save_results = QPushButton('保存结果', self)
         btn_save_results.setIcon(QIcon('icons/save.png'))
@@ -196,58 +217,79 @@ class PlagiarismCheckerGUI(QWidget):
         if not template_path or not folder_path:
             QMessageBox.warning(self, '错误', '请选择模板文件和文件夹。')
             return
+        if self.worker is not None and self.worker.isRunning():
+            return
+
+        # 查重流程在后台线程中运行，界面通过信号接收进度和结果
+        self.results_model.set_results([])
+        self.worker = CheckWorker(template_path, folder_path, workers=os.cpu_count() or 1, cache=self.cache,
+                                  extractor='stream', parent=self)
+        self.worker.progress.connect(self.on_check_progress)
+        self.worker.document_read.connect(self.results_model.append_results)
+        self.worker.partial_results.connect(self.results_model.update_results)
+        self.worker.results_ready.connect(self.on_check_finished)
+        self.worker.failed.connect(self.on_check_failed)
+        self.worker.cancelled.connect(self.on_check_cancelled)
+        self.set_checking(True)
+        self.worker.start()
+
+    def cancelCheck(self):
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.requestInterruption()
+            self.status_label.setText('正在取消……')
+            self.btn_cancel.setEnabled(False)
+
+    def set_checking(self, checking):
+        self.btn_check.setEnabled(not checking)
+        self.btn_cancel.setEnabled(checking)
+        self.progress_bar.setVisible(checking)
+        if checking:
+            self.progress_bar.setRange(0, 0)
+
+    def on_check_progress(self, stage, done, total):
+        # total 为0时显示忙碌状态
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+        self.status_label.setText(f'{stage}: {done}/{total}' if total else f'{stage}……')
+
+    def on_check_finished(self, results):
+        self.set_checking(False)
+        self.processor = self.worker.processor or self.processor
+        self.results_model.set_results(results)
+        self.update_table_sorting()
+        self.save_results_to_history(results)
+        duplicates = describe_duplicates(self.worker.pairs)
+        failed = sorted(self.processor.errors)
+        self.status_label.setText(f'检测完成，共 {len(results)} 份文档。' + (f'发现重复提交：{duplicates}。' if duplicates else '')
+                                  + (f"读取失败 {len(failed)} 份：{'、'.join(failed)}。" if failed else ''))
+
+    def on_check_failed(self, message):
+        self.set_checking(False)
+        self.status_label.setText('检测失败。')
+        QMessageBox.critical(self, '错误', f'检测时发生错误: {message}')
+
+    def on_check_cancelled(self):
+        self.set_checking(False)
+        if self.results_model.rowCount():
+            self.status_label.setText('检测已取消，表格中为已完成部分的结果。')
+        else:
+            self.status_label.setText('检测已取消。')
 
-        template_text = self.processor.read_docx(template_path)
-        self.processor.set_template(template_text)
-        self.processor.process_folder(folder_path)
-
-        document_texts = [self.processor.documents[name]['自然语言内容'] for name in self.processor.documents]
-        code_texts = [self.processor.documents[name]['代码内容'] for name in self.processor.documents]
-        self.text_calculator = TextSimilarityCalculator(document_texts)
-        self.code_calculator = CodeSimilarityCalculator(code_texts)
-
-        text_scores = self.text_calculator.calculate_scores()
-        code_scores = self.code_calculator.calculate_jaccard_scores()
-
-        results = []
-        for name, text_score, code_score in zip(self.processor.documents.keys(), text_scores, code_scores):
-            average_score = (text_score + code_score) / 2
-            results.append((name, text_score, code_score, average_score))
-
-        results_sorted = sorted(results, key=lambda x: x[3], reverse=True)
-        total_documents = len(results_sorted)
-        results_to_save = []
-        for i, (name, text_score, code_score, average_score) in enumerate(results_sorted):
-            percentile = (i / total_documents) * 100
-            equivalent_score = self.calculate_equivalent_score(percentile)
-            results_to_save.append({
-                'Document Name': name,
-                'Text Score': text_score,
-                'Code Score': code_score,
-                'Average Score': average_score,
-                'Equivalent Score': equivalent_score,
-                'Timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
-            self.update_table_with_results(i, name, text_score, code_score, average_score, equivalent_score)
-
-        self.save_results_to_json(results_to_save)
+    def closeEvent(self, event):
+        # 关闭窗口前停止后台线程
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.requestInterruption()
+            self.worker.wait()
+        self.history.close()
+        super().closeEvent(event)
 
     def save_results(self):
-        results = []
-        for row in range(self.table_widget.rowCount()):
-            result = {
-                'Document Name': self.table_widget.item(row, 0).text(),
-                'Text Score': float(self.table_widget.item(row, 1).text()),
-                'Code Score': float(self.table_widget.item(row, 2).text()),
-                'Average Score': float(self.table_widget.item(row, 3).text()),
-                'Equivalent Score': float(self.table_widget.item(row, 4).data(Qt.UserRole)),  # Store equivalent score
-                'Timestamp': self.table_widget.item(row, 4).text()
-            }
-            results.append(result)
+        results = self.results_model.results()
 
-        file_name, _ = QFileDialog.getSaveFileName(self, '保存结果', self.ensure_history_folder_exists(),
-                                                   'JSON 文件 (*.json)')
+        # 不默认保存到 history 目录，以免导出的文件在下次启动时被当作旧的历史文件导入
+        file_name, _ = QFileDialog.getSaveFileName(self, '保存结果', self.export_dir, 'JSON 文件 (*.json)')
         if file_name:
+            self.export_dir = os.path.dirname(file_name)
             try:
                 with open(file_name, 'w', encoding='utf-8') as jsonfile:
                     json.dump(results, jsonfile, ensure_ascii=False, indent=4)
@@ -256,57 +298,32 @@ class PlagiarismCheckerGUI(QWidget):
                 QMessageBox.critical(self, '错误', f'保存文件时发生错误: {str(e)}')
 
     def update_table_with_loaded_results(self, results):
-        self.table_widget.setRowCount(len(results))
-        for row, result in enumerate(results):
-            self.table_widget.setItem(row, 0, QTableWidgetItem(result['Document Name']))
-            self.table_widget.setItem(row, 1, QTableWidgetItem(f"{result['Text Score']:.2f}"))
-            self.table_widget.setItem(row, 2, QTableWidgetItem(f"{result['Code Score']:.2f}"))
-            self.table_widget.setItem(row, 3, QTableWidgetItem(f"{result['Average Score']:.2f}"))
+        self.results_model.set_results(results)
+        self.table_view.resizeColumnsToContents()
 
-            item = QTableWidgetItem(result['Timestamp'])
-            item.setData(Qt.UserRole, result['Equivalent Score'])  # Store equivalent score
-            self.table_widget.setItem(row, 4, item)
+    def load_history_run(self, run_id):
+        # 历史记录按页从数据库读取，滚动时再读取后续的行
+        self.results_model.set_pager(
+            lambda offset, limit, order_by, descending: self.history.load_results(run_id, offset, limit, order_by,
+                                                                                   descending),
+            self.history.count_documents(run_id))
 
-            self.colorize_row(row, result['Equivalent Score'])
-        self.table_widget.resizeColumnsToContents()
-
-    def save_results_to_json(self, results):
-        history_dir = self.ensure_history_folder_exists()
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_path = os.path.join(history_dir, f'results_{timestamp}.json')
-        with open(file_path, 'w', encoding='utf-8') as jsonfile:
-            json.dump(results, jsonfile, ensure_ascii=False, indent=4)
+    def save_results_to_history(self, results):
+        self.history.add_run(results, template=getattr(self, 'template_path', None),
+                             folder=getattr(self, 'folder_path', None), pairs=self.worker.pairs)
 
     def ensure_history_folder_exists(self):
         history_dir = os.path.join(os.getcwd(), 'history')
         os.makedirs(history_dir, exist_ok=True)
         return history_dir
 
-    def update_table_with_results(self, row, name, text_score, code_score, average_score, equivalent_score):
-        self.table_widget.insertRow(row)
-        self.table_widget.setItem(row, 0, QTableWidgetItem(name))
-        self.table_widget.setItem(row, 1, QTableWidgetItem(f"{text_score:.2f}"))
-        self.table_widget.setItem(row, 2, QTableWidgetItem(f"{code_score:.2f}"))
-        self.table_widget.setItem(row, 3, QTableWidgetItem(f"{average_score:.2f}"))
-
-        item = QTableWidgetItem(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-        item.setData(Qt.UserRole, equivalent_score)  # Store equivalent score
-        self.table_widget.setItem(row, 4, item)
-
-        self.colorize_row(row, equivalent_score)
-
-    def colorize_row(self, row, equivalent_score):
-        for col in range(self.table_widget.columnCount()):
-            item = self.table_widget.item(row, col)
-            if equivalent_score >= 80:
-                item.setBackground(QColor(255, 0, 0))  # Red
-            elif equivalent_score >= 60:
-                item.setBackground(QColor(255, 255, 0))  # Yellow
-            else:
-                item.setBackground(QColor(0, 255, 0))  # Green
+    def ensure_cache_folder_exists(self):
+        cache_dir = os.path.join(os.getcwd(), 'cache')
+        os.makedirs(cache_dir, exist_ok=True)
+        return cache_dir
 
     def calculate_equivalent_score(self, percentile):
-        return 100 - percentile
+        return calculate_equivalent_score(percentile)
 
     def update_table_sorting(self):
         current_sorting = self.sort_combo_box.currentText()
@@ -320,7 +337,7 @@ class PlagiarismCheckerGUI(QWidget):
             self.sort_table_by_column(3)
 
     def sort_table_by_column(self, column):
-        self.table_widget.sortItems(column, Qt.DescendingOrder)
+        self.results_model.sort(column, Qt.DescendingOrder)
 
     def show_history(self):
         self.history_window = HistoryWindow(self)
@@ -0,0 +1,142 @@
+import hashlib
+import numbers
+import re
+
+import numpy as np
+
+# 句子以中英文句末标点、英文句点（后接空白）或换行结束
+SENTENCE_RE = re.compile(r'[^\n]+?(?:[。！？!?；;…]+|\.(?=\s|$)|(?=\n)|$)')
+NORMALIZE_RE = re.compile(r'[\W_]+')  # 规范化时去掉的空白与标点
+# 按比例计算的文档频率上限至少为该值：小班中几名学生共享的段落正是需要报告的合谋抄袭，不能当作套话忽略
+MIN_DOC_FREQUENCY_CAP = 5
+
+
+def split_sentences(text):
+    # 切分句子，返回每句在原文中的 (起始, 结束) 偏移，已去掉首尾空白并忽略空句
+    spans = []
+    for match in SENTENCE_RE.finditer(text):
+        sentence = match.group()
+        start = match.start() + len(sentence) - len(sentence.lstrip())
+        end = match.end() - len(sentence) + len(sentence.rstrip())
+        if end > start:
+            spans.append((start, end))
+    return spans
+
+
+def normalize_sentence(sentence):
+    # 忽略大小写、空白与标点的差异
+    return NORMALIZE_RE.sub('', sentence.lower())
+
+
+def shingle_hash(normalized):
+    return int.from_bytes(hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class PassageIndex:
+    """
+    句子级的相同段落定位。
+    每篇文本切分为句子，规范化后把每 shingle_size 个连续句子的哈希加入倒排索引；同一哈希出现在两篇文本中即为共同片段，
+    同一文档对中前后相接的共同片段再合并为连续的段落。全部哈希只需排序一次，总耗时与语料总长度近似线性，
+    不需要逐对比较文档。出现在过多文档中的片段（题目要求、常见套话等）被忽略。
+    参数: texts (list of str): 每篇文档的自然语言内容；shingle_size (int): 每个片段的句子数；
+          min_chars (int): 片段规范化后的最少字数，更短的片段不参与匹配；
+          max_doc_frequency (int 或 float): 片段最多出现的文档数，小数表示占全部文档的比例（至少为 MIN_DOC_FREQUENCY_CAP）。
+    """
+
+    def __init__(self, texts, shingle_size=2, min_chars=12, max_doc_frequency=0.1):
+        self.texts = list(texts)
+        self.shingle_size = shingle_size
+        self.min_chars = min_chars
+        if isinstance(max_doc_frequency, numbers.Integral):
+            self.max_doc_frequency = max_doc_frequency
+        else:
+            self.max_doc_frequency = max(MIN_DOC_FREQUENCY_CAP, int(max_doc_frequency * len(self.texts)))
+        self.sentences = [split_sentences(text) for text in self.texts]  # 每篇文本的句子偏移
+        hashes, documents, positions = [], [], []
+        for document, (text, spans) in enumerate(zip(self.texts, self.sentences)):
+            normalized = [normalize_sentence(text[start:end]) for start, end in spans]
+            for position in range(len(spans) - shingle_size + 1):
+                shingle = ''.join(normalized[position:position + shingle_size])
+                if len(shingle) >= min_chars:
+                    hashes.append(shingle_hash(shingle))
+                    documents.append(document)
+                    positions.append(position)
+        self.hashes = np.array(hashes, dtype=np.uint64)
+        self.documents = np.array(documents, dtype=np.int64)
+        self.positions = np.array(positions, dtype=np.int64)  # 片段的第一句在本文中的句子序号
+
+    def matches(self):
+        """
+        在倒排索引中找出所有共同片段。
+        返回: tuple of np.ndarray: (文档i, 文档j, 片段在i中的位置, 片段在j中的位置)，i < j。
+        """
+        empty = np.empty(0, dtype=np.int64)
+        if len(self.hashes) == 0:
+            return empty, empty, empty, empty
+        order = np.lexsort((self.positions, self.documents, self.hashes))
+        hashes, documents, positions = self.hashes[order], self.documents[order], self.positions[order]
+        starts = np.flatnonzero(np.concatenate([[True], hashes[1:] != hashes[:-1]]))
+        stops = np.append(starts[1:], len(hashes))
+        # 同一哈希内按文档排序，文档号变化的次数即包含该片段的文档数
+        new_document = np.concatenate([[True], (documents[1:] != documents[:-1]) | (hashes[1:] != hashes[:-1])])
+        doc_frequency = np.add.reduceat(new_document.astype(np.int64), starts)
+        kept = np.flatnonzero((doc_frequency >= 2) & (doc_frequency <= self.max_doc_frequency))
+        pairs_i, pairs_j, positions_i, positions_j = [], [], [], []
+        for group in kept:
+            for a in range(starts[group], stops[group]):
+                for b in range(a + 1, stops[group]):
+                    if documents[a] != documents[b]:
+                        pairs_i.append(documents[a])
+                        pairs_j.append(documents[b])
+                        positions_i.append(positions[a])
+                        positions_j.append(positions[b])
+        return (np.array(pairs_i, dtype=np.int64), np.array(pairs_j, dtype=np.int64),
+                np.array(positions_i, dtype=np.int64), np.array(positions_j, dtype=np.int64))
+
+    def passages(self, pairs=None, max_gap=1):
+        """
+        把共同片段合并为连续的段落。
+        参数: pairs (iterable): 只返回这些 (i, j) 文档对，默认返回全部有共同片段的文档对；
+              max_gap (int): 合并时允许中间被改写或插入的句子数（两侧分别计算）。
+        返回: dict: {(i, j): [段落, ...]}，i < j，段落按在i中的位置排列，每个段落为 dict，含 'a_start'、'a_end'
+              （在文档i中的字符偏移）、'b_start'、'b_end'（在文档j中的字符偏移）与 'sentences'（文档i中的句子数）。
+        """
+        wanted = None if pairs is None else {(min(i, j), max(i, j)) for i, j in pairs}
+        pairs_i, pairs_j, positions_i, positions_j = self.matches()
+        order = np.lexsort((positions_j, positions_i, pairs_j, pairs_i))
+        # 改动一句会使覆盖它的 shingle_size 个片段都不再匹配，位置最多跳过 max_gap + shingle_size
+        max_step = max_gap + self.shingle_size
+        results = {}
+        runs = []  # 当前文档对中的段落，每项为 [i中首片段, i中末片段, j中首片段, j中末片段]
+        current = None
+        for k in order:
+            key = (int(pairs_i[k]), int(pairs_j[k]))
+            if wanted is not None and key not in wanted:
+                continue
+            if key != current:
+                if runs:
+                    results[current] = [self.to_span(current, run) for run in runs]
+                current, runs = key, []
+            position_i, position_j = int(positions_i[k]), int(positions_j[k])
+            for run in reversed(runs):
+                if 0 < position_i - run[1] <= max_step and 0 < position_j - run[3] <= max_step:
+                    run[1], run[3] = position_i, position_j
+                    break
+            else:
+                runs.append([position_i, position_i, position_j, position_j])
+        if runs:
+            results[current] = [self.to_span(current, run) for run in runs]
+        for spans in results.values():
+            spans.sort(key=lambda span: (span['a_start'], span['b_start']))
+        return results
+
+    def to_span(self, key, run):
+        # 首末片段覆盖的句子范围转换为字符偏移，片段位置 p 覆盖第 p 到 p + shingle_size - 1 句
+        first_i, last_i, first_j, last_j = run
+        sentences_i, sentences_j = self.sentences[key[0]], self.sentences[key[1]]
+        end_i, end_j = last_i + self.shingle_size - 1, last_j + self.shingle_size - 1
+        return {
+            'a_start': sentences_i[first_i][0], 'a_end': sentences_i[end_i][1],
+            'b_start': sentences_j[first_j][0], 'b_end': sentences_j[end_j][1],
+            'sentences': end_i - first_i + 1,
+        }
@@ -0,0 +1,256 @@
+import logging
+import os
+from datetime import datetime
+
+from dedup import DuplicateClusters, normalize_code, normalize_text
+from instrumentation import NULL_INSTRUMENTATION
+from load import WordProcessor
+
+RESULT_FIELDS = ['Document Name', 'Text Score', 'Code Score', 'Average Score', 'Equivalent Score', 'Timestamp']
+
+
+def calculate_equivalent_score(percentile):
+    return 100 - percentile
+
+
+def build_results(names, text_scores, code_scores, timestamp=None):
+    """
+    汇总文本与代码得分，按平均分从高到低排序并计算等效分，生成与历史记录文件相同格式的结果。
+    参数: names (list): 文档名；text_scores、code_scores (list): 对应的文本与代码得分；
+          timestamp (str): 记录时间，默认为当前时间。
+    返回: list of dict: 每个文档一条记录，键见 RESULT_FIELDS。
+    """
+    timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    results = []
+    for name, text_score, code_score in zip(names, text_scores, code_scores):
+        average_score = (text_score + code_score) / 2
+        results.append((name, float(text_score), float(code_score), float(average_score)))
+
+    results_sorted = sorted(results, key=lambda x: x[3], reverse=True)
+    total_documents = len(results_sorted)
+    records = []
+    for i, (name, text_score, code_score, average_score) in enumerate(results_sorted):
+        percentile = (i / total_documents) * 100
+        records.append({
+            'Document Name': name,
+            'Text Score': text_score,
+            'Code Score': code_score,
+            'Average Score': average_score,
+            'Equivalent Score': calculate_equivalent_score(percentile),
+            'Timestamp': timestamp
+        })
+    return records
+
+
+def load_documents(template_path, folder_path, workers=None, cache=None, extractor='stream', progress=None,
+                   instrumentation=None):
+    """
+    读取模板和文件夹中的全部作业，去除模板内容并分离自然语言与代码。
+    参数: template_path (str): 模板DOCX路径；folder_path (str): 作业文件夹；workers (int): 进程数，默认为CPU核数；
+          cache (ContentCache): 可选的磁盘缓存；extractor (str): DOCX提取方式；
+          progress (callable): 每读完一个文件调用 progress(已完成数, 总数, 文件名)；
+          instrumentation (Instrumentation): 可选的各阶段计量。
+    返回: WordProcessor: 已载入全部文档的处理器，读取模板失败时抛出 ValueError。
+    """
+    processor = WordProcessor(cache=cache, extractor=extractor, instrumentation=instrumentation)
+    template_text = processor.read_docx(template_path)
+    if template_text is None:
+        raise ValueError(f"Failed to read template file: {template_path}")
+    processor.set_template(template_text)
+    processor.process_folder(folder_path, workers=workers or os.cpu_count() or 1, progress=progress)
+    return processor
+
+
+def score_documents(processor, cache=None, instrumentation=None, evidence_k=0, archive_path=None, archive_k=3,
+                    archive_label=None):
+    """
+    计算每个文档的文本与代码相似度得分。算法模块（jieba、sklearn、Pygments）在此处才导入。
+    相同的提交先由 find_duplicates 分组，每组只计算一次特征。
+    参数: processor (WordProcessor): 已载入文档的处理器；cache (ContentCache): 可选的磁盘缓存；
+          instrumentation (Instrumentation): 可选的各阶段计量；evidence_k (int): 每个文档记录的最相似文档数，0 表示不记录；
+          archive_path、archive_k、archive_label: 与往届提交的参考归档比较，见 compare_with_archive。
+    返回: tuple (list, list, list, list): 文档名、文本得分、代码得分与相似文档对（见 similar_pairs），
+          相似文档对中总是包含重复提交（见 DuplicateClusters.duplicate_pairs）。
+    """
+    names = list(processor.documents.keys())
+    if not names:
+        return names, [], [], []
+    document_texts = [processor.documents[name]['自然语言内容'] for name in names]
+    code_texts = [processor.documents[name]['代码内容'] for name in names]
+    failed = [i for i, name in enumerate(names) if name in processor.errors]
+    text_clusters, code_clusters = find_duplicates(document_texts, code_texts, instrumentation, failed)
+    text_calculator = make_text_calculator(document_texts, cache=cache, instrumentation=instrumentation,
+                                           clusters=text_clusters)
+    code_calculator = make_code_calculator(code_texts, cache=cache, instrumentation=instrumentation,
+                                           clusters=code_clusters)
+    text_scores = text_clusters.expand(text_calculator.calculate_scores())
+    code_scores = code_clusters.expand(code_calculator.calculate_jaccard_scores())
+    pairs = text_clusters.duplicate_pairs(names, 'text') + code_clusters.duplicate_pairs(names, 'code')
+    if evidence_k:
+        evidence = similar_pairs(names, text_calculator, code_calculator, evidence_k, text_clusters, code_clusters,
+                                 failed)
+        pairs += locate_passages(names, document_texts, evidence, instrumentation)
+    if archive_path:
+        pairs += compare_with_archive(archive_path, names, text_calculator, code_calculator, text_clusters, code_clusters,
+                                      archive_k, archive_label, instrumentation)
+    return names, text_scores, code_scores, pairs
+
+
+def find_duplicates(document_texts, code_texts, instrumentation=None, failed=()):
+    """
+    去重预筛选：按原始与规范化内容的哈希，分别把文本相同和代码相同的提交分组。
+    参数: failed (iterable of int): 读取失败的文档下标，其 'error' 占位内容不参与分组。
+    返回: tuple (DuplicateClusters, DuplicateClusters): 文本与代码的分组。
+    """
+    instrumentation = instrumentation or NULL_INSTRUMENTATION
+    failed = list(failed)
+    with instrumentation.stage('deduplication', items=len(document_texts)) as record:
+        text_clusters = DuplicateClusters(document_texts, normalize_text, failed)
+        code_clusters = DuplicateClusters(code_texts, normalize_code, failed)
+        record['text_clusters'] = len(text_clusters)
+        record['code_clusters'] = len(code_clusters)
+    return text_clusters, code_clusters
+
+
+def make_text_calculator(document_texts, cache=None, instrumentation=None, clusters=None, cancel_check=None):
+    # 文本相似度计算器（jieba 分词 + TF-IDF/SimHash）；给出 clusters 时每组只加入代表，组大小作为权重；
+    # cancel_check 在分词等较长的循环中定期调用，抛出异常即中止
+    from algorithm import TextSimilarityCalculator
+    if clusters is not None:
+        return TextSimilarityCalculator(clusters.unique(document_texts), cache=cache, instrumentation=instrumentation,
+                                        weights=clusters.weights, cancel_check=cancel_check)
+    return TextSimilarityCalculator(document_texts, cache=cache, instrumentation=instrumentation,
+                                    cancel_check=cancel_check)
+
+
+def make_code_calculator(code_texts, cache=None, instrumentation=None, clusters=None, cancel_check=None):
+    # 代码相似度计算器（Pygments 词法分析 + Jaccard）；clusters 与 cancel_check 的用法同 make_text_calculator
+    from algorithm import CodeSimilarityCalculator
+    if clusters is not None:
+        return CodeSimilarityCalculator(clusters.unique(code_texts), cache=cache, instrumentation=instrumentation,
+                                        weights=clusters.weights, cancel_check=cancel_check)
+    return CodeSimilarityCalculator(code_texts, cache=cache, instrumentation=instrumentation,
+                                    cancel_check=cancel_check)
+
+
+def score_texts(document_texts, cache=None, instrumentation=None):
+    return make_text_calculator(document_texts, cache, instrumentation).calculate_scores()
+
+
+def score_codes(code_texts, cache=None, instrumentation=None):
+    return make_code_calculator(code_texts, cache, instrumentation).calculate_jaccard_scores()
+
+
+def similar_pairs(names, text_calculator, code_calculator, k=3, text_clusters=None, code_clusters=None, failed=()):
+    """
+    收集每个文档文本与代码方面最相似的 k 个文档，作为历史记录中的证据。
+    读取失败的文档不作为证据；代码规范化后为空（没有代码）的文档不作为代码证据，它们的词元集合都相同。
+    参数: text_clusters、code_clusters (DuplicateClusters): 计算器按组构建时的分组，此时每组以代表的文档名记录；
+          failed (iterable of int): 读取失败的文档下标。
+    返回: list of dict: 每项含 'kind'（'text' 或 'code'）、'document_a'、'document_b'、'score'，
+          文本对另含 'hamming'；同一对文档只记录一次。
+    """
+    text_names = text_clusters.unique(names) if text_clusters is not None else names
+    code_names = code_clusters.unique(names) if code_clusters is not None else names
+    failed = set(failed)
+    text_rows = text_clusters.representatives if text_clusters is not None else range(len(names))
+    code_rows = code_clusters.representatives if code_clusters is not None else range(len(names))
+    skip_text = {i for i, row in enumerate(text_rows) if row in failed}
+    skip_code = {i for i, row in enumerate(code_rows)
+                 if row in failed or not normalize_code(code_calculator.code_corpus[i])}
+    pairs = {}
+    for i, matches in enumerate(text_calculator.top_k_similar(k)):
+        for j, cosine, hamming in matches:
+            if i in skip_text or j in skip_text:
+                continue
+            key = ('text',) + tuple(sorted((i, j)))
+            pairs[key] = {'kind': 'text', 'document_a': text_names[key[1]], 'document_b': text_names[key[2]],
+                          'score': cosine, 'hamming': hamming}
+    for i, matches in enumerate(code_calculator.top_k_similar(k)):
+        for j, jaccard in matches:
+            if i in skip_code or j in skip_code:
+                continue
+            key = ('code',) + tuple(sorted((i, j)))
+            pairs[key] = {'kind': 'code', 'document_a': code_names[key[1]], 'document_b': code_names[key[2]],
+                          'score': jaccard}
+    return sorted(pairs.values(), key=lambda pair: pair['score'], reverse=True)
+
+
+def locate_passages(names, document_texts, pairs, instrumentation=None, max_passages=20, excerpt_chars=60):
+    """
+    段落定位：为文本相似的文档对（'kind' 为 'text' 的证据）找出相同的句子段落，写入该证据的 'passages'，
+    每个段落含两侧在自然语言内容中的字符偏移（见 PassageIndex.passages）与文档A一侧的开头 'excerpt'。
+    参数: names、document_texts (list): 文档名与对应的自然语言内容；pairs (list of dict): 相似文档对；
+          max_passages (int): 每对最多保存的段落数，按句子数从多到少保留。
+    返回: list of dict: 原来的 pairs（已就地补充 'passages'）。
+    """
+    from passage import PassageIndex
+    instrumentation = instrumentation or NULL_INSTRUMENTATION
+    positions = {name: i for i, name in enumerate(names)}
+    flagged = [pair for pair in pairs if pair['kind'] == 'text']
+    with instrumentation.stage('passages', items=len(names), characters=sum(map(len, document_texts))) as record:
+        index = PassageIndex(document_texts)
+        found = index.passages([(positions[pair['document_a']], positions[pair['document_b']]) for pair in flagged])
+        record['passages'] = sum(len(spans) for spans in found.values())
+    for pair in flagged:
+        i, j = positions[pair['document_a']], positions[pair['document_b']]
+        spans = found.get((min(i, j), max(i, j)), [])
+        if i > j:
+            # 索引中的段落以下标较小的文档为A，换成与证据相同的方向
+            spans = [{'a_start': span['b_start'], 'a_end': span['b_end'], 'b_start': span['a_start'],
+                      'b_end': span['a_end'], 'sentences': span['sentences']} for span in spans]
+        spans = sorted(spans, key=lambda span: span['sentences'], reverse=True)[:max_passages]
+        pair['passages'] = [dict(span, excerpt=document_texts[i][span['a_start']:span['a_end']][:excerpt_chars])
+                            for span in sorted(spans, key=lambda span: span['a_start'])]
+    return pairs
+
+
+def compare_with_archive(archive_path, names, text_calculator, code_calculator, text_clusters, code_clusters, k=3,
+                         label=None, instrumentation=None):
+    """
+    与参考归档（见 archive.ReferenceArchive）中的往届提交比较。
+    参数: archive_path (str): 归档目录；k (int): 每个文档记录的最相似往届文档数；
+          label (str): 不为None时，比较后把本批文档以该标签加入归档，归档不存在时以本批拟合的词表新建。
+    返回: list of dict: 相似文档对，'kind' 为 'archive-text'（另含 'hamming'）或 'archive-code'
+          （'score' 为winnowing指纹相似度，另含 'shared_fingerprints' 与 'estimated_jaccard'），'document_b' 为 "标签/文档名"。
+    """
+    from archive import ReferenceArchive
+    instrumentation = instrumentation or NULL_INSTRUMENTATION
+    text_names, code_names = text_clusters.unique(names), code_clusters.unique(names)
+    pairs = []
+    if ReferenceArchive.exists(archive_path):
+        archive = ReferenceArchive(archive_path)
+        with instrumentation.stage('archive_scoring', items=len(names), archived=len(archive)):
+            for name, matches in zip(text_names, archive.top_k_text(text_calculator, k)):
+                for archived, cosine, hamming in matches:
+                    pairs.append({'kind': 'archive-text', 'document_a': name, 'document_b': archived, 'score': cosine,
+                                  'hamming': hamming})
+            for name, matches in zip(code_names, archive.top_k_code(code_calculator, k)):
+                for archived, similarity, shared, estimated in matches:
+                    pairs.append({'kind': 'archive-code', 'document_a': name, 'document_b': archived, 'score': similarity,
+                                  'shared_fingerprints': shared, 'estimated_jaccard': estimated})
+    elif label is None:
+        raise ValueError(f"Reference archive not found: {archive_path}")
+    else:
+        archive = ReferenceArchive.create(archive_path, text_calculator)
+    if label is not None:
+        with instrumentation.stage('archive_append', items=len(names)):
+            archive.append(text_names, text_calculator, code_names, code_calculator, label)
+    return sorted(pairs, key=lambda pair: pair['score'], reverse=True)
+
+
+def run_check(template_path, folder_path, workers=None, cache=None, extractor='stream', instrumentation=None,
+              evidence_k=0, archive_path=None, archive_k=3, archive_label=None):
+    """
+    无界面的完整查重流程：读取文档、计算得分并生成结果记录。
+    参数: 同 load_documents；evidence_k (int): 每个文档记录的最相似文档数；
+          archive_path、archive_k、archive_label: 与往届提交的参考归档比较，见 compare_with_archive。
+    返回: tuple (list of dict, dict, list of dict): 结果记录、处理失败文件的错误信息与相似文档对。
+    """
+    processor = load_documents(template_path, folder_path, workers=workers, cache=cache, extractor=extractor,
+                               instrumentation=instrumentation)
+    logging.info(f"Loaded {len(processor.documents)} documents from {folder_path}")
+    names, text_scores, code_scores, pairs = score_documents(processor, cache=cache, instrumentation=instrumentation,
+                                                             evidence_k=evidence_k, archive_path=archive_path,
+                                                             archive_k=archive_k, archive_label=archive_label)
+    return build_results(names, text_scores, code_scores), dict(processor.errors), pairs
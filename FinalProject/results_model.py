@@ -0,0 +1,191 @@
+from PyQt5.QtCore import Qt, QAbstractListModel, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QColor
+
+RED = QColor(255, 0, 0)
+YELLOW = QColor(255, 255, 0)
+GREEN = QColor(0, 255, 0)
+
+
+def score_color(equivalent_score):
+    # 按等效分着色：>=80 红色，>=60 黄色，其余绿色；尚无得分时不着色
+    if equivalent_score is None:
+        return None
+    if equivalent_score >= 80:
+        return RED
+    if equivalent_score >= 60:
+        return YELLOW
+    return GREEN
+
+
+class ResultsTableModel(QAbstractTableModel):
+    """
+    查重结果表格模型。每行对应一条与历史记录文件格式相同的结果字典，
+    视图只为可见行请求数据，数千行结果也能立即显示。
+    得分为None表示该阶段尚未完成，用于在检测过程中显示部分结果。
+    """
+
+    COLUMNS = ['Document Name', 'Text Score', 'Code Score', 'Average Score', 'Timestamp']
+    SCORE_COLUMNS = {'Text Score', 'Code Score', 'Average Score'}
+
+    def __init__(self, parent=None, page_size=500):
+        super().__init__(parent)
+        self.records = []
+        self.page_size = page_size
+        self.pager = None  # 分页读取时为 (fetch_page, 总行数)，见 set_pager
+        self.sort_order = (None, True)  # 分页读取时的排序字段与是否降序
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.records[index.row()]
+        key = self.COLUMNS[index.column()]
+        if role == Qt.DisplayRole:
+            value = record.get(key)
+            if value is None:
+                return ''
+            return f"{value:.2f}" if key in self.SCORE_COLUMNS else str(value)
+        if role == Qt.BackgroundRole:
+            return score_color(record.get('Equivalent Score'))
+        if role == Qt.UserRole:
+            return record.get('Equivalent Score')  # 与原表格相同，UserRole 保存等效分
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return super().headerData(section, orientation, role)
+
+    def set_results(self, records):
+        self.beginResetModel()
+        self.pager = None
+        self.records = [dict(record) for record in records]
+        self.endResetModel()
+
+    def append_results(self, records):
+        # 在末尾追加行，用于检测过程中逐个文件显示
+        if not records:
+            return
+        self.beginInsertRows(QModelIndex(), len(self.records), len(self.records) + len(records) - 1)
+        self.records.extend(dict(record) for record in records)
+        self.endInsertRows()
+
+    def update_results(self, records):
+        # 按文档名合并部分结果：已有的行更新得分，不在表格中的文档追加到末尾
+        rows = {record['Document Name']: row for row, record in enumerate(self.records)}
+        missing = []
+        for record in records:
+            row = rows.get(record['Document Name'])
+            if row is None:
+                missing.append(record)
+            else:
+                self.records[row].update(record)
+        if self.records:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.records) - 1, len(self.COLUMNS) - 1))
+        self.append_results(missing)
+
+    def set_pager(self, fetch_page, total):
+        """
+        改为按需分页读取结果（如从历史记录库中读取），视图滚动到末尾时自动读取下一页。
+        参数: fetch_page (callable): fetch_page(起始行, 行数, 排序字段, 是否降序) 返回结果列表；total (int): 总行数。
+        """
+        self.beginResetModel()
+        self.pager = (fetch_page, total)
+        self.sort_order = (None, True)
+        self.records = []
+        self.endResetModel()
+        self.fetchMore()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return self.pager is not None and not parent.isValid() and len(self.records) < self.pager[1]
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        fetch_page, total = self.pager
+        page = fetch_page(len(self.records), min(self.page_size, total - len(self.records)), *self.sort_order)
+        if not page:
+            self.pager = (fetch_page, len(self.records))  # 数据源比预期的少，停止继续读取
+            return
+        self.beginInsertRows(QModelIndex(), len(self.records), len(self.records) + len(page) - 1)
+        self.records.extend(page)
+        self.endInsertRows()
+
+    def results(self):
+        # 返回全部结果的副本，用于保存；分页读取时先读完剩余的行
+        while self.canFetchMore():
+            self.fetchMore()
+        return [dict(record) for record in self.records]
+
+    def sort(self, column, order=Qt.DescendingOrder):
+        # 按原始数值排序（而非格式化后的文本），尚无得分的行排在最后
+        key = self.COLUMNS[column]
+        if self.pager is not None:
+            # 分页读取时由数据源排序，重新从第一页开始读取
+            self.beginResetModel()
+            self.sort_order = (key, order == Qt.DescendingOrder)
+            self.records = []
+            self.endResetModel()
+            self.fetchMore()
+            return
+        present = [record for record in self.records if record.get(key) is not None]
+        missing = [record for record in self.records if record.get(key) is None]
+        present.sort(key=lambda record: record[key], reverse=(order == Qt.DescendingOrder))
+        self.layoutAboutToBeChanged.emit()
+        self.records = present + missing
+        self.layoutChanged.emit()
+
+
+class RunListModel(QAbstractListModel):
+    """
+    历史记录列表模型，从 HistoryStore 按时间从新到旧分页读取检测记录，滚动到末尾时读取下一页。
+    UserRole 返回检测记录的编号。
+    """
+
+    def __init__(self, store, parent=None, page_size=200):
+        super().__init__(parent)
+        self.store = store
+        self.page_size = page_size
+        self.runs = []
+        self.total = store.count_runs()
+        self.fetchMore()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.runs)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        run = self.runs[index.row()]
+        if role == Qt.DisplayRole:
+            label = f"  {run['label']}" if run['label'] else ''
+            return f"{run['created_at']}{label}  （{run['document_count']} 份文档）"
+        if role == Qt.UserRole:
+            return run['id']
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self.runs) < self.total
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        page = self.store.list_runs(len(self.runs), self.page_size)
+        if not page:
+            self.total = len(self.runs)
+            return
+        self.beginInsertRows(QModelIndex(), len(self.runs), len(self.runs) + len(page) - 1)
+        self.runs.extend(page)
+        self.endInsertRows()
+
+    def refresh(self):
+        self.beginResetModel()
+        self.runs = []
+        self.total = self.store.count_runs()
+        self.endResetModel()
+        self.fetchMore()
@@ -0,0 +1,356 @@
+"""
+常驻的本地查重服务。jieba词典、已拟合的TF-IDF向量器、SimHash指纹和代码索引常驻内存，
+多位助教对同一课程语料的提交与查询无需每次重新加载和拟合。
+协议为最简单的 HTTP/1.1 + JSON，可监听 TCP 端口或 Unix 套接字：
+    POST   /template   {"path": 模板DOCX路径}
+    POST   /documents  {"documents": [{"name": 名称, "path": DOCX路径} 或 {"name": 名称, "text": 文本, "code": 代码}]}
+    DELETE /documents/<名称>
+    GET    /similar?name=<名称>&k=5
+    GET    /results
+    GET    /status
+用法: python service.py [--host 127.0.0.1 --port 8765 | --unix /tmp/plagiarism.sock] [--template 模板.docx --folder 语料文件夹]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from load import WordProcessor
+from pipeline import build_results
+
+MAX_BODY_BYTES = 64 * 1024 * 1024  # 单个请求体的上限
+MIN_PRUNING_DOCUMENTS = 10  # 文档数少于该值时不按文档频率筛选词语，否则一两份文档的语料筛选后词表为空
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ScoringService:
+    """
+    常驻内存的查重状态：文档名、文本与代码两个相似度计算器及最近一次的结果。
+    所有方法都在同一个工作线程中调用（见 ServiceServer），因此无需加锁。
+    """
+
+    def __init__(self, cache=None, workers=1, extractor='stream'):
+        self.cache = cache
+        self.workers = workers
+        self.processor = WordProcessor(cache=cache, extractor=extractor)
+        self.names = []
+        self.text_calculator = None
+        self.code_calculator = None
+        self.results = None  # 最近一次计算的结果，语料变化后置为None
+
+    def warm_up(self):
+        # 预先导入并加载jieba词典等，之后的请求不再承担冷启动开销
+        import jieba
+        import algorithm  # noqa: F401  提前导入sklearn与Pygments
+        logging.getLogger('jieba').setLevel(logging.WARNING)
+        jieba.initialize()
+
+    def set_template(self, path):
+        template_text = self.processor.read_docx(path)
+        if template_text is None:
+            raise ServiceError(400, f"Failed to read template file: {path}")
+        self.processor.set_template(template_text)
+        return {'template': path}
+
+    def load_folder(self, folder_path):
+        # 批量载入文件夹中的作业作为初始语料
+        self.processor.documents = {}
+        self.processor.process_folder(folder_path, workers=self.workers)
+        documents = [{'name': name, 'text': document['自然语言内容'], 'code': document['代码内容']}
+                     for name, document in self.processor.documents.items()]
+        return self.add_documents(documents)
+
+    def read_document(self, document):
+        # 请求中的文档可以直接给出文本与代码，也可以给出本机DOCX路径，由服务读取并去除模板
+        name = document.get('name')
+        if 'path' in document:
+            content = self.processor.extract_document(document['path'])
+            if content is None:
+                raise ServiceError(400, f"Failed to read document: {document['path']}")
+            name = name or os.path.splitext(os.path.basename(document['path']))[0]
+            text, code = content
+        else:
+            text, code = document.get('text', ''), document.get('code', '')
+        if not name:
+            raise ServiceError(400, "Each document needs a name or a path.")
+        return name, text, code
+
+    def add_documents(self, documents):
+        """
+        加入或替换文档。已存在的同名文档先删除；计算器已存在时沿用已拟合的模型增量加入。
+        参数: documents (list of dict): 见模块说明。
+        返回: dict: 加入的文档名与当前文档总数。
+        """
+        entries = {}
+        for document in documents:
+            name, text, code = self.read_document(document)
+            entries[name] = (text, code)
+        if not entries:
+            return {'added': [], 'documents': len(self.names)}
+        self.remove_names([name for name in entries if name in self.names])
+
+        names = list(entries)
+        texts = [entries[name][0] for name in names]
+        codes = [entries[name][1] for name in names]
+        if self.text_calculator is None:
+            from algorithm import TextSimilarityCalculator, CodeSimilarityCalculator
+            min_df, max_df = self.document_frequency_limits(len(names))
+            try:
+                text_calculator = TextSimilarityCalculator(texts, workers=self.workers, cache=self.cache, min_df=min_df,
+                                                           max_df=max_df)
+            except ValueError as e:
+                # 如全部文档都没有可用的词语
+                raise ServiceError(400, f"Cannot build the text model from these documents: {e}")
+            self.text_calculator = text_calculator
+            self.code_calculator = CodeSimilarityCalculator(codes, workers=self.workers, cache=self.cache)
+        else:
+            self.text_calculator.add_documents(texts)
+            self.code_calculator.add_documents(codes)
+        self.names.extend(names)
+        self.update_document_frequency_limits()
+        self.results = None
+        return {'added': names, 'documents': len(self.names)}
+
+    def document_frequency_limits(self, count):
+        # 返回 (min_df, max_df)：语料足够大时与批量检测相同，否则保留全部词语
+        if count < MIN_PRUNING_DOCUMENTS:
+            return 1, 1.0
+        return 0.02, 0.8
+
+    def update_document_frequency_limits(self):
+        # 语料规模变化后，下次重新拟合时使用相应的词语筛选条件
+        if self.text_calculator is not None:
+            self.text_calculator.min_df, self.text_calculator.max_df = self.document_frequency_limits(len(self.names))
+
+    def ensure_text_model(self):
+        # 增删文档较多时在查询前重新拟合；筛选后词表为空（如剩余词语都出现在几乎所有文档中）属于语料问题
+        try:
+            self.text_calculator.ensure_fitted()
+        except ValueError as e:
+            raise ServiceError(400, f"Cannot refit the text model on the current documents: {e}")
+
+    def remove_names(self, names):
+        indices = [self.names.index(name) for name in names]
+        if not indices:
+            return
+        if len(indices) == len(self.names):
+            # 全部删除后重新开始，下次加入文档时重新拟合
+            self.names, self.text_calculator, self.code_calculator = [], None, None
+        else:
+            self.text_calculator.remove_documents(indices)
+            self.code_calculator.remove_documents(indices)
+            removed = set(indices)
+            self.names = [name for i, name in enumerate(self.names) if i not in removed]
+            self.update_document_frequency_limits()
+        self.results = None
+
+    def remove_document(self, name):
+        if name not in self.names:
+            raise ServiceError(404, f"Unknown document: {name}")
+        self.remove_names([name])
+        return {'removed': name, 'documents': len(self.names)}
+
+    def similar(self, name, k=5):
+        # 查询单个文档在文本与代码两方面最相似的 k 个文档
+        if name not in self.names:
+            raise ServiceError(404, f"Unknown document: {name}")
+        self.ensure_text_model()
+        index = self.names.index(name)
+        text_matches = self.text_calculator.top_k_similar(k, rows=[index])[0]
+        code_matches = self.code_calculator.top_k_similar(k, rows=[index])[0]
+        return {
+            'name': name,
+            'text': [{'name': self.names[j], 'cosine': cosine, 'hamming': hamming} for j, cosine, hamming in text_matches],
+            'code': [{'name': self.names[j], 'jaccard': jaccard} for j, jaccard in code_matches]
+        }
+
+    def get_results(self):
+        # 全部文档的得分，格式与历史记录文件相同；语料不变时直接返回上次的结果
+        if self.results is None:
+            if not self.names:
+                self.results = []
+            else:
+                self.ensure_text_model()
+                text_scores = self.text_calculator.calculate_scores()
+                code_scores = self.code_calculator.calculate_jaccard_scores()
+                self.results = build_results(self.names, text_scores, code_scores)
+        return self.results
+
+    def status(self):
+        return {
+            'documents': len(self.names),
+            'template': bool(self.processor.template_text),
+            'fitted_documents': self.text_calculator.fitted_documents if self.text_calculator else 0,
+            'pending_refit': self.text_calculator.needs_refit() if self.text_calculator else False,
+            'results_ready': self.results is not None,
+            'cache_hits': self.cache.hits if self.cache else 0,
+            'cache_misses': self.cache.misses if self.cache else 0
+        }
+
+
+class ServiceServer:
+    """
+    基于 asyncio 流的 HTTP 服务器。网络读写在事件循环中进行，
+    分词、拟合与评分等计算放到单线程执行器中，既不阻塞事件循环，又保证对 ScoringService 的访问是串行的。
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def dispatch(self, method, path, query, body):
+        if path == '/status' and method == 'GET':
+            return await self.call(self.service.status)
+        if path == '/results' and method == 'GET':
+            return await self.call(self.service.get_results)
+        if path == '/similar' and method == 'GET':
+            if 'name' not in query:
+                raise ServiceError(400, "Missing query parameter: name")
+            try:
+                k = int(query.get('k', ['5'])[0])
+            except ValueError:
+                raise ServiceError(400, "k must be an integer")
+            return await self.call(self.service.similar, query['name'][0], k)
+        if path == '/template' and method == 'POST':
+            if 'path' not in body:
+                raise ServiceError(400, "Missing field: path")
+            return await self.call(self.service.set_template, body['path'])
+        if path == '/documents' and method == 'POST':
+            documents = body.get('documents')
+            if not isinstance(documents, list):
+                raise ServiceError(400, "Field 'documents' must be a list")
+            return await self.call(self.service.add_documents, documents)
+        if path.startswith('/documents/') and method == 'DELETE':
+            return await self.call(self.service.remove_document, unquote(path[len('/documents/'):]))
+        if path in ('/status', '/results', '/similar', '/template', '/documents') or path.startswith('/documents/'):
+            raise ServiceError(405, f"Method {method} not allowed for {path}")
+        raise ServiceError(404, f"Unknown path: {path}")
+
+    async def read_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.split(' ', 2)
+        except ValueError:
+            raise ServiceError(400, f"Malformed request line: {request_line}")
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            key, _, value = line.partition(':')
+            headers[key.strip().lower()] = value.strip()
+        length = headers.get('content-length')
+        if length is None:
+            if method.upper() == 'POST':
+                raise ServiceError(400, "Missing Content-Length header")
+            length = '0'
+        if not (length.isascii() and length.isdigit()):
+            raise ServiceError(400, f"Invalid Content-Length header: {length}")
+        length = int(length)
+        if length > MAX_BODY_BYTES:
+            raise ServiceError(413, f"Request body exceeds {MAX_BODY_BYTES} bytes")
+        body = {}
+        if length:
+            try:
+                body = json.loads((await reader.readexactly(length)).decode('utf-8'))
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                raise ServiceError(400, f"Invalid JSON body: {e}")
+            if not isinstance(body, dict):
+                raise ServiceError(400, "JSON body must be an object")
+        url = urlsplit(target)
+        return method.upper(), url.path, parse_qs(url.query), body
+
+    async def handle(self, reader, writer):
+        start = time.perf_counter()
+        status, payload, request = 200, None, None
+        try:
+            request = await self.read_request(reader)
+            if request is None:
+                writer.close()
+                return
+            payload = await self.dispatch(*request)
+        except ServiceError as e:
+            status, payload = e.status, {'error': str(e)}
+        except Exception as e:
+            logging.exception("Unhandled service error")
+            status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        writer.write(f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                     f"Content-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(data)}\r\n"
+                     f"Connection: close\r\n\r\n".encode('latin-1') + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+        if request is not None:
+            logging.info(f"{request[0]} {request[1]} -> {status} in {time.perf_counter() - start:.3f}s")
+
+    async def serve(self, host='127.0.0.1', port=8765, unix_path=None):
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle, path=unix_path)
+            logging.info(f"Listening on unix socket {unix_path}")
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            logging.info(f"Listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='作业查重（常驻服务模式）')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口')
+    parser.add_argument('--unix', help='改为监听该路径的Unix套接字')
+    parser.add_argument('--template', help='启动时载入的模板DOCX文件')
+    parser.add_argument('--folder', help='启动时载入的作业文件夹')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='文档读取与分词进程数')
+    parser.add_argument('--cache-dir', default=os.path.join(os.getcwd(), 'cache'), help='缓存目录')
+    parser.add_argument('--no-cache', action='store_true', help='不使用磁盘缓存')
+    parser.add_argument('-v', '--verbose', action='store_true', help='输出详细日志')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    cache = None
+    if not args.no_cache:
+        from cache import ContentCache
+        cache = ContentCache(args.cache_dir)
+
+    service = ScoringService(cache=cache, workers=args.workers)
+    service.warm_up()
+    if args.template:
+        service.set_template(args.template)
+    if args.folder:
+        loaded = service.load_folder(args.folder)
+        service.get_results()  # 预先计算一次，首个查询即可直接返回
+        print(f"已载入 {loaded['documents']} 份文档: {args.folder}")
+    try:
+        asyncio.run(ServiceServer(service).serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
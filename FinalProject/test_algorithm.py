@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from algorithm import (CANCEL_CHECK_DOCUMENTS, CodeSimilarityCalculator, PackedFingerprints, TextSimilarityCalculator,
+                       TokenAnalyzer)
+from benchmark import CorpusGenerator
+from dedup import DuplicateClusters, normalize_code, normalize_text
+
+
+def make_corpus(num_docs=12, sentences=6, seed=0):
+    # 带有计划抄袭的小型合成语料，返回每份报告的文本
+    documents, _ = CorpusGenerator(seed).generate(num_docs, sentences)
+    return [''.join(text) for _, text, _ in documents]
+
+
+def make_text_calculator(texts, **kwargs):
+    # 小语料不按文档频率筛选词语，分词在当前进程中完成
+    options = dict(workers=1, tokenizer_backend='serial', min_df=1, max_df=1.0)
+    options.update(kwargs)
+    return TextSimilarityCalculator(texts, **options)
+
+
+def test_bigrams_do_not_bridge_removed_tokens():
+    analyzer = TokenAnalyzer(frozenset({'的', '，'}))
+    features = analyzer(['排序', '的', '算法', '比较', '，', '结果', '!', '分析'])
+    assert features[:5] == ['排序', '算法', '比较', '结果', '分析']
+    assert '算法 比较' in features
+    assert '排序 算法' not in features  # 中间隔着停用词
+    assert '比较 结果' not in features  # 中间隔着停用词表中的标点
+    assert '结果 分析' not in features  # 中间隔着停用词表以外的标点
+    assert '!' not in features
+
+
+def test_ngram_range():
+    tokens = ['a', 'b', 'c']
+    assert TokenAnalyzer(ngram_range=(2, 3))(tokens) == ['a b', 'b c', 'a b c']
+    assert TokenAnalyzer(ngram_range=(1, 1))(tokens) == tokens
+
+
+@pytest.mark.parametrize('hashbits', [64, 128])
+def test_vectorized_simhash_matches_per_feature_simhash(hashbits):
+    calculator = make_text_calculator(make_corpus(), hashbits=hashbits)
+    assert calculator.document_hashes == calculator.calculate_simhashes_parallel()
+    assert calculator.simhash_engine.fingerprints(calculator.tfidf_matrix) == calculator.document_hashes
+
+
+@pytest.mark.parametrize('hashbits', [64, 100, 128])
+def test_packed_hamming_distances(hashbits):
+    rng = np.random.default_rng(0)
+    hashes = [int.from_bytes(rng.bytes(16), 'little') & ((1 << hashbits) - 1) for _ in range(40)]
+    hashes += hashes[:5]  # 距离为0的重复指纹
+    packed = PackedFingerprints.from_ints(hashes, hashbits)
+    assert packed.to_ints() == hashes
+    expected = np.array([[bin(a ^ b).count('1') for b in hashes] for a in hashes])
+    assert np.array_equal(packed.distance_matrix(block_size=7), expected)
+
+    max_distance = int(np.percentile(expected, 10))
+    found_i, found_j, found_d = packed.pairs_within(max_distance, block_size=7)  # 跨越多个块
+    found = set(zip(found_i.tolist(), found_j.tolist(), found_d.tolist()))
+    assert found == {(i, j, int(expected[i, j])) for i in range(len(hashes)) for j in range(i + 1, len(hashes))
+                     if expected[i, j] <= max_distance}
+
+
+def test_linear_scores_equal_pairwise_scores():
+    calculator = make_text_calculator(make_corpus())
+    assert np.allclose(calculator.calculate_scores('linear'), calculator.calculate_scores('pairwise'))
+
+
+def test_incremental_add_and_remove_match_pairwise_scores():
+    texts = make_corpus(16)
+    calculator = make_text_calculator(texts[:10], refit_threshold=10.0)  # 不触发重新拟合，检验增量更新的累计量
+    calculator.add_documents(texts[10:])
+    calculator.remove_documents([1, 4, 12])
+    assert calculator.tfidf_matrix.shape[0] == 13
+    assert np.allclose(calculator.calculate_scores('linear'), calculator.calculate_scores('pairwise'))
+
+    # 同一词表下，增删后的矩阵与指纹应与直接转换剩余文档的结果相同
+    remaining = [text for i, text in enumerate(texts) if i not in (1, 4, 12)]
+    rows = calculator.vectorizer.transform(calculator.cached_tokenize(remaining))
+    assert np.allclose(calculator.tfidf_matrix.toarray(), rows.toarray())
+    assert calculator.document_hashes == calculator.simhash_engine.fingerprints(rows)
+
+
+class Cancelled(Exception):
+    pass
+
+
+def cancel_after(calls):
+    # 第 calls 次调用时抛出 Cancelled，模拟用户在处理途中取消
+    count = []
+
+    def check():
+        count.append(None)
+        if len(count) >= calls:
+            raise Cancelled()
+    return check
+
+
+def test_cancel_check_interrupts_tokenization_lexing_and_queries():
+    texts = make_corpus(CANCEL_CHECK_DOCUMENTS + 1)
+    with pytest.raises(Cancelled):
+        make_text_calculator(texts, cancel_check=cancel_after(1))  # 第一块分词后即中止
+    codes = [f'def f{i}(x):\n    return x + {i}\n' for i in range(CANCEL_CHECK_DOCUMENTS + 1)]
+    with pytest.raises(Cancelled):
+        CodeSimilarityCalculator(codes, workers=1, language='python', cancel_check=cancel_after(1))
+
+    text_calculator = make_text_calculator(texts, cancel_check=cancel_after(3))  # 分词两块，查询时中止
+    with pytest.raises(Cancelled):
+        text_calculator.top_k_similar()
+    code_calculator = CodeSimilarityCalculator(codes, workers=1, language='python', cancel_check=cancel_after(3))
+    with pytest.raises(Cancelled):
+        code_calculator.top_k_similar()
+
+
+def test_weighted_fit_matches_expanded_corpus():
+    texts = make_corpus(10)
+    texts += [texts[2], texts[2], texts[5]]  # 重复提交
+    clusters = DuplicateClusters(texts, normalize_text)
+    options = dict(min_df=2, max_df=0.5)  # 文档频率筛选也应按组大小计数
+    weighted = make_text_calculator(clusters.unique(texts), weights=clusters.weights, **options)
+    expanded = make_text_calculator(texts, **options)
+    assert list(weighted.vectorizer.get_feature_names_out()) == list(expanded.vectorizer.get_feature_names_out())
+    assert np.allclose(weighted.vectorizer.idf_, expanded.vectorizer.idf_)
+    rows = clusters.unique(list(range(len(texts))))
+    assert np.allclose(weighted.tfidf_matrix.toarray(), expanded.tfidf_matrix[rows].toarray())
+    assert np.allclose(clusters.expand(weighted.calculate_scores()), expanded.calculate_scores())
+
+    codes = [f'def f(x):\n    return x + {i % 4} * {i}\n' for i in range(8)]
+    codes += [codes[1], codes[1], codes[6]]
+    clusters = DuplicateClusters(codes, normalize_code)
+    weighted = CodeSimilarityCalculator(clusters.unique(codes), workers=1, weights=clusters.weights)
+    expanded = CodeSimilarityCalculator(codes, workers=1)
+    assert np.allclose(clusters.expand(weighted.calculate_jaccard_scores()), expanded.calculate_jaccard_scores())
@@ -0,0 +1,25 @@
+from algorithm import CodeSimilarityCalculator, TextSimilarityCalculator
+from archive import ReferenceArchive
+
+TEXTS = ['实验一讨论了快速排序的递归实现与时间复杂度。', '实验二比较了链表和数组在插入操作上的性能差异。',
+         '实验三用哈希表统计了单词频率并分析了冲突处理。']
+CODES = ['', '\n\n', 'def add(a, b):\n    return a + b\n']
+
+
+def make_calculators(texts, codes):
+    text_calculator = TextSimilarityCalculator(texts, workers=1, tokenizer_backend='serial', min_df=1, max_df=1.0)
+    return text_calculator, CodeSimilarityCalculator(codes, workers=1)
+
+
+def test_codeless_reports_do_not_match_archived_codeless_reports(tmp_path):
+    path = str(tmp_path / 'archive')
+    text_calculator, code_calculator = make_calculators(TEXTS, CODES)
+    archive = ReferenceArchive.create(path, text_calculator)
+    names = ['old0', 'old1', 'old2']
+    archive.append(names, text_calculator, names, code_calculator, label='2023')
+    assert list(ReferenceArchive(path).segments[0].arrays['code_sizes'][:2]) == [0, 0]
+
+    _, code_calculator = make_calculators(TEXTS, ['\n', '', 'def add(x, y):\n    return x + y\n'])
+    matches = ReferenceArchive(path).top_k_code(code_calculator, k=3)
+    assert matches[0] == matches[1] == []
+    assert [match[0] for match in matches[2]] == ['2023/old2']
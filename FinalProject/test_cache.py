@@ -0,0 +1,10 @@
+from cache import ContentCache
+
+
+def test_overwriting_an_entry_keeps_the_tracked_size(tmp_path):
+    cache = ContentCache(str(tmp_path))
+    cache.set(cache.make_key('tokens', 'a'), ['x'] * 10)
+    for _ in range(5):
+        cache.set(cache.make_key('tokens', 'b'), ['y'] * 1000)
+    assert cache._size == cache.total_size()
+    assert cache.get(cache.make_key('tokens', 'b')) == ['y'] * 1000
@@ -0,0 +1,33 @@
+from dedup import DuplicateClusters, normalize_code, normalize_text
+from load import WordProcessor
+from pipeline import score_documents
+
+CODE = 'def add(a, b):\n    return a + b\n'
+
+
+def test_empty_and_failed_submissions_are_not_duplicates():
+    codes = ['', '\n  \n', 'error', 'error', CODE, CODE + '\n\n']
+    clusters = DuplicateClusters(codes, normalize_code, excluded=[2, 3])
+    assert clusters.duplicate_groups() == [[4, 5]]
+    pairs = clusters.duplicate_pairs(['a', 'b', 'c', 'd', 'e', 'f'], 'code')
+    assert [(pair['document_a'], pair['document_b'], pair['match']) for pair in pairs] == [('e', 'f', 'normalized')]
+
+
+def test_score_documents_skips_codeless_and_unreadable_reports():
+    processor = WordProcessor()
+    reports = ['实验一讨论了快速排序的递归实现与时间复杂度。', '实验二比较了链表和数组在插入操作上的性能差异。',
+               '实验三用哈希表统计了单词频率并分析了冲突处理。', '实验四实现了二叉搜索树的插入删除与中序遍历。']
+    for name, text in zip(['no_code_1', 'no_code_2', 'copy_1', 'copy_2'], reports):
+        processor.store_document(name, text, CODE if name.startswith('copy') else '')
+    processor.record_error('broken_1', 'Failed to read document')
+    processor.record_error('broken_2', 'Failed to read document')
+    _, text_scores, code_scores, pairs = score_documents(processor)
+    assert len(text_scores) == len(code_scores) == 6
+    assert [(pair['kind'], pair['document_a'], pair['document_b']) for pair in pairs] == \
+        [('code-duplicate', 'copy_1', 'copy_2')]
+
+
+def test_whitespace_only_text_differences_are_duplicates():
+    clusters = DuplicateClusters(['Hello  World', 'hello world', '  '], normalize_text)
+    assert clusters.duplicate_groups() == [[0, 1]]
+    assert list(clusters.weights) == [2, 1]
@@ -0,0 +1,20 @@
+import json
+
+from history_store import HistoryStore
+
+RESULTS = [{'Document Name': 'student1', 'Text Score': 50.0, 'Code Score': 40.0, 'Average Score': 45.0,
+            'Equivalent Score': 100.0, 'Timestamp': '2024-01-01 12:00:00'}]
+
+
+def test_only_legacy_history_files_are_imported_once(tmp_path):
+    for filename in ('results_20240101_120000.json', 'my_export.json', 'results_20240101_120000.json.bak'):
+        (tmp_path / filename).write_text(json.dumps(RESULTS), encoding='utf-8')
+    with HistoryStore(str(tmp_path / 'history.sqlite3')) as store:
+        assert store.import_json_folder(str(tmp_path)) == 1
+        run = store.list_runs()[0]
+        assert run['label'] == 'results_20240101_120000.json'
+        assert run['created_at'] == '2024-01-01 12:00:00'
+        # 删除导入的记录后，下次启动也不会再次导入
+        store.delete_run(run['id'])
+        assert store.import_json_folder(str(tmp_path)) == 0
+        assert store.count_runs() == 0
@@ -0,0 +1,33 @@
+import pytest
+from docx import Document
+
+from load import WordProcessor
+
+
+@pytest.fixture
+def folder(tmp_path):
+    # 一份正常的作业和一份损坏的 .docx
+    document = Document()
+    document.add_paragraph('实验目的是比较两种排序算法的运行时间。')
+    document.save(tmp_path / 'good.docx')
+    (tmp_path / 'broken.docx').write_bytes(b'not a zip archive')
+    return tmp_path
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('extractor', ['stream', 'python-docx'])
+def test_unreadable_file_is_recorded(folder, workers, extractor):
+    processor = WordProcessor(extractor=extractor)
+    processor.process_folder(str(folder), workers=workers)
+    assert set(processor.errors) == {'broken'}
+    assert processor.documents['broken']['自然语言内容'] == 'error'
+    assert '排序算法' in processor.documents['good']['自然语言内容']
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_progress_reports_document_names(folder, workers):
+    Document().save(folder / '2021.student.final.docx')  # 文件名中含有多个点
+    reported = []
+    processor = WordProcessor()
+    processor.process_folder(str(folder), workers=workers, progress=lambda done, total, name: reported.append(name))
+    assert sorted(reported) == sorted(processor.documents) == ['2021.student.final', 'broken', 'good']
@@ -0,0 +1,31 @@
+from passage import PassageIndex, split_sentences
+
+SHARED = '我们在一万个随机整数上分别测试了快速排序与归并排序。结果表明快速排序在平均情况下明显更快。'
+
+
+def class_texts(size):
+    # 每份报告有自己的开头，另含一个编号句，保证各份报告互不相同
+    return [f'第{i}份报告讨论了第{i}种数据结构的设计与实现细节。报告编号为{i}号，作者独立完成了全部实验。'
+            for i in range(size)]
+
+
+def test_passage_shared_by_three_students_in_small_class():
+    texts = class_texts(20)
+    for i in (0, 1, 2):
+        texts[i] += SHARED
+    found = PassageIndex(texts).passages([(0, 1), (0, 2), (1, 2), (0, 3)])
+    assert set(found) == {(0, 1), (0, 2), (1, 2)}
+    span = found[(0, 2)][0]
+    assert texts[0][span['a_start']:span['a_end']] == SHARED
+    assert texts[2][span['b_start']:span['b_end']] == SHARED
+    assert span['sentences'] == 2
+
+
+def test_boilerplate_in_most_documents_is_ignored():
+    texts = [text + SHARED for text in class_texts(20)]
+    assert PassageIndex(texts).passages() == {}
+
+
+def test_split_sentences_offsets():
+    text = '第一句。 Second one. 第三行\n第四句！'
+    assert [text[start:end] for start, end in split_sentences(text)] == ['第一句。', 'Second one.', '第三行', '第四句！']
@@ -0,0 +1,21 @@
+from load import WordProcessor
+from pipeline import score_documents
+
+REPORTS = ['实验一讨论了快速排序的递归实现与时间复杂度。', '实验二比较了链表和数组在插入操作上的性能差异。',
+           '实验三用哈希表统计了单词频率并分析了冲突处理。', '实验四实现了二叉搜索树的插入删除与中序遍历。',
+           '实验五用动态规划求解了背包问题并分析了空间优化。', '实验六实现了图的广度优先搜索与最短路径。']
+CODES = ['', '   \n', '# 只有注释\n', '', 'def add(a, b):\n    return a + b\n', 'def mul(a, b):\n    return a * b\n']
+
+
+def test_codeless_and_unreadable_reports_are_not_evidence():
+    processor = WordProcessor()
+    for i, (text, code) in enumerate(zip(REPORTS, CODES)):
+        processor.store_document(f'student{i}', text, code)
+    processor.record_error('broken_1', 'Failed to read document')
+    processor.record_error('broken_2', 'Failed to read document')
+    _, _, _, pairs = score_documents(processor, evidence_k=3)
+    code_pairs = {(pair['document_a'], pair['document_b']) for pair in pairs if pair['kind'] == 'code'}
+    assert code_pairs == {('student4', 'student5')}
+    assert not any(pair['document_a'].startswith('broken') or pair['document_b'].startswith('broken')
+                   for pair in pairs)
+    assert any(pair['kind'] == 'text' for pair in pairs)
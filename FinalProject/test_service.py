@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import pytest
+
+from service import ScoringService, ServiceError, ServiceServer
+
+
+def request(raw):
+    # 启动服务器，发送一个原始的HTTP请求，返回 (状态码, JSON内容)
+    async def exchange():
+        server = await asyncio.start_server(ServiceServer(ScoringService()).handle, '127.0.0.1', 0)
+        async with server:
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(raw)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        head, _, body = response.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(body)
+
+    return asyncio.run(exchange())
+
+
+def post(body, headers=None):
+    headers = {'Content-Length': str(len(body))} if headers is None else headers
+    lines = ''.join(f"{key}: {value}\r\n" for key, value in headers.items())
+    return request(f"POST /documents HTTP/1.1\r\n{lines}\r\n".encode('latin-1') + body)
+
+
+@pytest.mark.parametrize('body', [b'[]', b'"documents"', b'42'])
+def test_non_object_body_is_rejected(body):
+    status, payload = post(body)
+    assert status == 400
+    assert 'object' in payload['error']
+
+
+@pytest.mark.parametrize('headers', [{}, {'Content-Length': 'abc'}, {'Content-Length': '-5'}])
+def test_bad_content_length_is_rejected(headers):
+    status, payload = post(b'{"documents": []}', headers)
+    assert status == 400
+    assert 'Content-Length' in payload['error']
+
+
+def test_get_without_body_is_accepted():
+    status, payload = request(b'GET /status HTTP/1.1\r\n\r\n')
+    assert status == 200
+    assert payload['documents'] == 0
+
+
+def test_bootstrap_from_empty_service():
+    service = ScoringService()
+    service.add_documents([{'name': 'a', 'text': '实验目的是比较两种排序算法的运行时间。', 'code': 'print(1)'}])
+    service.add_documents([{'name': 'b', 'text': '实验目的是比较两种排序算法的运行时间。', 'code': 'print(2)'}])
+    assert [result['Document Name'] for result in service.get_results()] == ['a', 'b']
+    assert service.similar('a', 1)['text'][0]['name'] == 'b'
+
+
+def test_documents_without_words_are_rejected():
+    with pytest.raises(ServiceError) as error:
+        ScoringService().add_documents([{'name': 'a', 'text': '', 'code': ''}])
+    assert error.value.status == 400
+
+
+def test_refit_with_empty_vocabulary_is_rejected():
+    service = ScoringService()
+    document = {'text': '实验目的是比较两种排序算法的运行时间。', 'code': 'print(1)'}
+    service.add_documents([dict(document, name=f'a{i}') for i in range(5)])  # 文档较少，不筛选词语
+    service.add_documents([dict(document, name=f'b{i}') for i in range(7)])  # 重新拟合时全部词语超过 max_df
+    for query in (service.get_results, lambda: service.similar('a0')):
+        with pytest.raises(ServiceError) as error:
+            query()
+        assert error.value.status == 400
@@ -0,0 +1,20 @@
+from load import TemplateIndex, WordProcessor
+
+LINE = '实验要求：请完整记录实验过程与结果，并附上全部源代码。'
+TEMPLATE = f'一、实验目的\n{LINE}\n二、实验代码'
+
+
+def test_removed_template_passage_does_not_join_lines():
+    processor = WordProcessor()
+    processor.set_template(TEMPLATE)
+    stripped = processor.preprocess_text(f'本实验完成了快速排序\n{LINE}\ndef qsort(a):\n    return sorted(a)')
+    assert LINE not in stripped
+    assert stripped.splitlines() == ['本实验完成了快速排序', 'def qsort(a):', '    return sorted(a)']
+    natural, code = processor.separate_natural_language_from_code(stripped)
+    assert natural == '本实验完成了快速排序'
+    assert code.split() == ['def', 'qsort(a):', 'return', 'sorted(a)']
+
+
+def test_passage_within_one_line_is_removed_without_newline():
+    index = TemplateIndex('请在此处填写实验目的、实验环境与所用软件的版本说明')
+    assert index.remove('甲请在此处填写实验目的、实验环境与所用软件的版本说明乙') == '甲乙'